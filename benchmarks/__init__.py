@@ -0,0 +1,11 @@
+"""
+These benchmarks measure how long it takes to resolve datasets from a catalog and to write them to a container, without
+any network access, so that results from different commits and machines can be compared with each other.
+
+Run them from the root of the repository with:
+
+.. code-block:: none
+
+    python -m benchmarks.run --sizes 100 1000 10000 --output results.json
+    python -m benchmarks.run --sizes 100 1000 10000 --output new.json --compare results.json
+"""
@@ -0,0 +1,106 @@
+"""
+This module times how long it takes to import datarade and to start using it, in a new interpreter for each
+repetition, and records which of the heavy dependencies each scenario imported:
+
+- import: importing datarade
+- github_catalog: creating a dataset catalog for a public GitHub repository
+- schema_load: validating a dataset's configuration
+- sqlite_container: creating a dataset container for a SQLite database
+
+Results are written in the same format as the results of benchmarks.run, and can be compared with the results of an
+earlier run in the same way.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import List
+
+from benchmarks import run
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SCENARIOS = {
+    'import': 'import datarade',
+    'github_catalog': 'import datarade\n'
+                      "datarade.get_dataset_catalog(repository='datarade_test_catalog', organization='fivestack', "
+                      "platform='github')",
+    'schema_load': 'from datarade import schemas\n'
+                   "schemas.load_dataset({'name': 'my_dataset', 'definition': 'select 1', "
+                   "'fields': [{'name': 'id', 'type': 'Integer'}]})",
+    'sqlite_container': 'import datarade\n'
+                        "datarade.get_dataset_container(driver='sqlite', database_name=':memory:')",
+}
+HEAVY_MODULES = ('asyncio', 'azure.devops', 'bcp', 'marshmallow', 'msrest', 'pyodbc', 'requests', 'sqlalchemy',
+                 'yaml')
+
+# runs in the new interpreter, and prints the duration and the heavy modules that were imported as the last line
+_TIMER = '''
+import json, sys, time
+start = time.perf_counter()
+exec(compile(sys.argv[1], '<scenario>', 'exec'))
+duration = time.perf_counter() - start
+print(json.dumps({'duration': duration, 'modules': [name for name in sys.argv[2:] if name in sys.modules]}))
+'''
+
+
+def time_scenario(code: str) -> dict:
+    """
+    Runs a scenario in a new interpreter that imports datarade from this repository
+
+    Args:
+        code: the python code of the scenario
+
+    Returns: a dictionary with the duration of the scenario in seconds, and the heavy modules that it imported
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(PROJECT_ROOT),
+                                                                      os.environ.get('PYTHONPATH')])))
+    result = subprocess.run([sys.executable, '-c', _TIMER, code, *HEAVY_MODULES], cwd=str(PROJECT_ROOT), env=env,
+                            stdout=subprocess.PIPE, check=True)
+    return json.loads(result.stdout.decode('utf-8').strip().splitlines()[-1])
+
+
+def benchmark_scenario(name: str, repeat: int) -> dict:
+    """
+    Times a scenario a number of times
+
+    Args:
+        name: the name of the scenario
+        repeat: the number of new interpreters to time the scenario in
+
+    Returns: the result of the benchmark, with the heavy modules that the scenario imported
+    """
+    timings = [time_scenario(code=SCENARIOS[name]) for _ in range(repeat)]
+    result = run.summarize(benchmark=f'import.{name}', size=1, durations=[timing['duration'] for timing in timings],
+                           items=1)
+    result['modules'] = timings[-1]['modules']
+    return result
+
+
+def main(argv: 'List[str]' = None) -> dict:
+    parser = argparse.ArgumentParser(description='Time importing datarade and starting to use it.')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS),
+                        help='the scenarios to time')
+    parser.add_argument('--repeat', type=int, default=10, help='the number of new interpreters to time each scenario in')
+    parser.add_argument('--output', help='the file to write the results to, as JSON')
+    parser.add_argument('--compare', help='a results file from an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    report = {
+        'environment': run.environment(),
+        'parameters': {'scenarios': args.scenarios, 'repeat': args.repeat},
+        'results': [benchmark_scenario(name=name, repeat=args.repeat) for name in args.scenarios],
+    }
+    if args.compare:
+        report['comparisons'] = run.compare(baseline=json.loads(Path(args.compare).read_text()), current=report)
+    run.print_results(results=report['results'], comparisons=report.get('comparisons'))
+    for result in report['results']:
+        print(f'{result["benchmark"]} imported: {", ".join(result["modules"]) or "none of the heavy modules"}')
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,399 @@
+"""
+This module generates synthetic dataset catalogs on the local file system and times each stage of reading and writing
+datasets against them:
+
+- list_datasets: listing every dataset in the catalog
+- get_dataset: resolving a sample of datasets with a new catalog, one dataset at a time
+- get_dataset.archive: resolving the same sample with a new catalog that reads the whole catalog folder at once
+- schema.load: validating the parsed configuration of the sample with schemas.load_many()
+- field.sqlalchemy_column: building the sqlalchemy columns for every field in the sample
+- write_dataset: writing a sqlite source table to a sqlite container with the DB-API transfer engine
+
+Catalogs are generated from a seed, so two runs with the same parameters read identical catalogs. Results are written
+as JSON, along with the parameters and the environment they were measured in, and can be compared with the results of
+an earlier run.
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import sqlalchemy
+import yaml
+
+import datarade
+from datarade import instrumentation, models, schemas, services, transfer
+
+FIELD_TYPES = ('Boolean', 'Date', 'DateTime', 'Time', 'Float', 'Integer', 'Numeric', 'String', 'Text')
+WRITE_FIELDS = [{'name': 'id', 'type': 'Integer'}, {'name': 'name', 'type': 'String'},
+                {'name': 'amount', 'type': 'Float'}, {'name': 'quantity', 'type': 'Integer'},
+                {'name': 'note', 'type': 'Text'}]
+
+
+def generate_catalog(path: 'Path', dataset_count: int, field_count: int, definition_lines: int,
+                     seed: int = 0) -> 'List[str]':
+    """
+    Writes a synthetic dataset catalog to the local file system, in the layout that a local DatasetCatalog reads
+
+    Args:
+        path: the directory to write the catalog to, the datasets are written to the 'catalog' folder within it
+        dataset_count: the number of datasets in the catalog
+        field_count: the number of fields in each dataset
+        definition_lines: the number of lines in each dataset's definition
+        seed: the seed for the random field types, the same seed always generates the same catalog
+
+    Returns: the names of the datasets in the catalog
+    """
+    rng = random.Random(seed)
+    dataset_names = [f'dataset_{i:05d}' for i in range(dataset_count)]
+    for dataset_name in dataset_names:
+        config, definition = generate_dataset_files(dataset_name=dataset_name, field_count=field_count,
+                                                    definition_lines=definition_lines, rng=rng)
+        dataset_dir = path / 'catalog' / dataset_name
+        dataset_dir.mkdir(parents=True, exist_ok=True)
+        (dataset_dir / 'config.yaml').write_text(yaml.safe_dump(config, sort_keys=False))
+        (dataset_dir / 'definition.sql').write_text(definition)
+    return dataset_names
+
+
+def generate_dataset_files(dataset_name: str, field_count: int, definition_lines: int,
+                           rng: 'random.Random') -> 'Tuple[dict, str]':
+    """
+    Generates the configuration and the definition for a synthetic dataset
+
+    Args:
+        dataset_name: the name of the dataset
+        field_count: the number of fields in the dataset
+        definition_lines: the number of lines in the definition
+        rng: the random number generator for the field types
+
+    Returns: the configuration dictionary and the definition
+    """
+    fields = [{'name': f'field_{i:04d}', 'type': rng.choice(FIELD_TYPES),
+               'description': f'Field {i} of {dataset_name}, populated from source_{i % 10}.column_{i}'}
+              for i in range(field_count)]
+    config = {
+        'name': dataset_name,
+        'description': f'A synthetic dataset with {field_count} fields',
+        'fields': fields,
+        'database': {'driver': 'mssql', 'database_name': 'benchmark', 'host': 'localhost', 'schema_name': 'dbo'},
+        'user': {'username': 'benchmark_user'},
+    }
+    columns = [f'    s{i % 10}.column_{i} as {field["name"]},' for i, field in enumerate(fields)]
+    joins = [f'left join dbo.source_{i % 10} s{i % 10} on s{i % 10}.id = s0.id and s{i % 10}.batch = {i}'
+             for i in range(max(definition_lines - len(columns) - 2, 0))]
+    definition = '\n'.join(['select'] + columns + ['    1 as marker', 'from dbo.source_0 s0'] + joins)
+    return config, definition
+
+
+def measure(benchmark: str, size: int, run: 'Callable[[], int]', repeat: int,
+            setup: 'Callable[[], None]' = None) -> dict:
+    """
+    Times a benchmark a number of times and summarizes the durations
+
+    Args:
+        benchmark: the name of the benchmark
+        size: the size of the input, like the number of datasets in the catalog or the number of rows to write
+        run: the code to time, which returns the number of items it handled
+        repeat: the number of times to time the code
+        setup: code to run before each repetition, which is not timed
+
+    Returns: a dictionary with the name, size and the summarized durations of the benchmark, in seconds
+    """
+    durations = []
+    items = 0
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        items = run()
+        durations.append(time.perf_counter() - start)
+    return summarize(benchmark=benchmark, size=size, durations=durations, items=items)
+
+
+def summarize(benchmark: str, size: int, durations: 'List[float]', items: int) -> dict:
+    """
+    Summarizes the durations of a benchmark
+
+    Args:
+        benchmark: the name of the benchmark
+        size: the size of the input
+        durations: the duration of each repetition, in seconds
+        items: the number of items each repetition handled
+
+    Returns: a dictionary with the name, size and the summarized durations of the benchmark, in seconds
+    """
+    median = statistics.median(durations)
+    return {
+        'benchmark': benchmark,
+        'size': size,
+        'repeat': len(durations),
+        'items': items,
+        'min': min(durations),
+        'median': median,
+        'mean': statistics.mean(durations),
+        'p95': sorted(durations)[max(round(0.95 * len(durations)) - 1, 0)],
+        'max': max(durations),
+        'items_per_second': items / median if median else None,
+    }
+
+
+def benchmark_catalog(path: 'Path', size: int, field_count: int, definition_lines: int, sample: int, repeat: int,
+                      seed: int) -> 'List[dict]':
+    """
+    Generates a catalog and times resolving datasets from it, validating them and building their columns
+
+    Args:
+        path: the directory to write the catalog to
+        size: the number of datasets in the catalog
+        field_count: the number of fields in each dataset
+        definition_lines: the number of lines in each dataset's definition
+        sample: the number of datasets to resolve from the catalog
+        repeat: the number of times to time each benchmark
+        seed: the seed for the catalog and the sample
+
+    Returns: a list of results, one for each benchmark
+    """
+    dataset_names = generate_catalog(path=path, dataset_count=size, field_count=field_count,
+                                     definition_lines=definition_lines, seed=seed)
+    sample_names = sorted(random.Random(seed).sample(dataset_names, min(sample, size)))
+
+    def new_catalog(archive: bool = False) -> 'models.DatasetCatalog':
+        return services.get_dataset_catalog(repository=str(path), organization='', platform='local', branch=None,
+                                            archive=archive, indexed=True)
+
+    def get_sample(archive: bool = False) -> int:
+        dataset_catalog = new_catalog(archive=archive)
+        for dataset_name in sample_names:
+            services.get_dataset(dataset_catalog=dataset_catalog, dataset_name=dataset_name)
+        return len(sample_names)
+
+    dataset_dicts = {}
+    for dataset_name in sample_names:
+        dataset_dict = yaml.safe_load((path / 'catalog' / dataset_name / 'config.yaml').read_text())
+        dataset_dict['definition'] = (path / 'catalog' / dataset_name / 'definition.sql').read_text()
+        dataset_dicts[dataset_name] = dataset_dict
+    datasets = list(schemas.load_many(dataset_dicts=dataset_dicts)[0].values())
+
+    def load_sample() -> int:
+        return len(schemas.load_many(dataset_dicts=dataset_dicts)[0])
+
+    def build_columns() -> int:
+        return len([field.sqlalchemy_column for dataset in datasets for field in dataset.fields])
+
+    return [
+        measure(benchmark='list_datasets', size=size, run=lambda: len(services.list_datasets(new_catalog())),
+                repeat=repeat),
+        measure(benchmark='get_dataset', size=size, run=get_sample, repeat=repeat),
+        measure(benchmark='get_dataset.archive', size=size, run=lambda: get_sample(archive=True), repeat=repeat),
+        measure(benchmark='schema.load', size=size, run=load_sample, repeat=repeat),
+        measure(benchmark='field.sqlalchemy_column', size=size, run=build_columns, repeat=repeat),
+    ]
+
+
+def benchmark_write(path: 'Path', rows: int, repeat: int, batch_size: int, seed: int) -> dict:
+    """
+    Times writing a sqlite source table to a sqlite container with the DB-API transfer engine
+
+    The source table is written once, and the time spent in each stage of the write is added to the result from the
+    instrumentation spans.
+
+    Args:
+        path: the directory to write the source and target databases to
+        rows: the number of rows in the source table
+        repeat: the number of times to time the write
+        batch_size: the number of rows the transfer engine inserts at a time
+        seed: the seed for the values in the source table
+
+    Returns: the result of the benchmark
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    source_path = path / f'source_{rows}.db'
+    try:
+        source_path.unlink()
+    except FileNotFoundError:
+        pass
+    rng = random.Random(seed)
+    source_engine = sqlalchemy.create_engine(f'sqlite+pysqlite:///{source_path}')
+    with source_engine.begin() as connection:
+        connection.execute(sqlalchemy.text(
+            'create table source (id integer, name varchar, amount float, quantity integer, note text)'))
+        connection.execute(
+            sqlalchemy.text('insert into source values (:id, :name, :amount, :quantity, :note)'),
+            [{'id': i, 'name': f'name_{i}', 'amount': round(rng.uniform(0, 1000), 2),
+              'quantity': rng.randint(0, 100), 'note': f'row {i} of the benchmark source table'}
+             for i in range(rows)])
+    source_engine.dispose()
+    dataset = schemas.load_dataset({
+        'name': 'benchmark_dataset',
+        'definition': 'select id, name, amount, quantity, note from source',
+        'fields': WRITE_FIELDS,
+        'database': {'driver': 'sqlite', 'database_name': str(source_path)},
+    })
+    dataset_container = services.get_dataset_container(
+        driver='sqlite', database_name=str(path / f'target_{rows}.db'),
+        transfer_engine=transfer.DBAPITransferEngine(batch_size=batch_size))
+    stages: 'Dict[str, float]' = {}
+
+    def record(finished_span: 'instrumentation.Span'):
+        stages[finished_span.name] = stages.get(finished_span.name, 0.0) + finished_span.duration
+
+    def write() -> int:
+        services.write_dataset(dataset=dataset, dataset_container=dataset_container)
+        return rows
+
+    instrumentation.add_listener(record)
+    try:
+        result = measure(benchmark='write_dataset', size=rows, run=write, repeat=repeat)
+    finally:
+        instrumentation.remove_listener(record)
+    result['stages'] = {name: duration / repeat for name, duration in sorted(stages.items())}
+    return result
+
+
+def environment() -> dict:
+    """
+    Describes the environment that the benchmarks run in
+
+    Returns: a dictionary of the python, platform and library versions
+    """
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'datarade': datarade.__version__,
+        **{package: package_version(package) for package in ('sqlalchemy', 'marshmallow', 'pyyaml')},
+    }
+
+
+def package_version(package: str) -> str:
+    """
+    Finds the installed version of a package, with importlib.metadata on python 3.8 and later, or with setuptools'
+    pkg_resources on python 3.7
+
+    Args:
+        package: the name of the distribution, like 'pyyaml'
+
+    Returns: the version of the package
+    """
+    try:
+        from importlib import metadata
+    except ImportError:
+        import pkg_resources
+
+        return pkg_resources.get_distribution(package).version
+    return metadata.version(package)
+
+
+def run(workdir: 'Path', sizes: 'List[int]', field_count: int = 50, definition_lines: int = 200, sample: int = 100,
+        rows: 'List[int]' = None, repeat: int = 5, batch_size: int = 10000, seed: int = 0) -> dict:
+    """
+    Runs every benchmark
+
+    Args:
+        workdir: the directory to write the catalogs and the databases to
+        sizes: the numbers of datasets in each catalog
+        field_count: the number of fields in each dataset
+        definition_lines: the number of lines in each dataset's definition
+        sample: the number of datasets to resolve from each catalog
+        rows: the numbers of rows to write, defaults to 10,000
+        repeat: the number of times to time each benchmark
+        batch_size: the number of rows the transfer engine inserts at a time
+        seed: the seed for the catalogs, the samples and the source tables
+
+    Returns: a dictionary with the environment, the parameters and the results of the benchmarks
+    """
+    rows = rows if rows is not None else [10000]
+    parameters = {'sizes': sizes, 'field_count': field_count, 'definition_lines': definition_lines,
+                  'sample': sample, 'rows': rows, 'repeat': repeat, 'batch_size': batch_size, 'seed': seed}
+    results = []
+    for size in sizes:
+        results.extend(benchmark_catalog(path=workdir / f'catalog_{size}', size=size, field_count=field_count,
+                                         definition_lines=definition_lines, sample=sample, repeat=repeat, seed=seed))
+    for row_count in rows:
+        results.append(benchmark_write(path=workdir / 'write', rows=row_count, repeat=repeat, batch_size=batch_size,
+                                       seed=seed))
+    return {'environment': environment(), 'parameters': parameters, 'results': results}
+
+
+def compare(baseline: dict, current: dict) -> 'List[dict]':
+    """
+    Compares the median durations of two runs, for the benchmarks and sizes that are in both
+
+    Args:
+        baseline: the results of the earlier run
+        current: the results of the later run
+
+    Returns: a list of comparisons, where a ratio below 1 means the benchmark got faster
+    """
+    baseline_results = {(result['benchmark'], result['size']): result for result in baseline['results']}
+    comparisons = []
+    for result in current['results']:
+        baseline_result = baseline_results.get((result['benchmark'], result['size']))
+        if baseline_result is None:
+            continue
+        comparisons.append({
+            'benchmark': result['benchmark'],
+            'size': result['size'],
+            'baseline': baseline_result['median'],
+            'current': result['median'],
+            'ratio': result['median'] / baseline_result['median'] if baseline_result['median'] else None,
+        })
+    return comparisons
+
+
+def print_results(results: 'List[dict]', comparisons: 'Optional[List[dict]]' = None):
+    """
+    Prints the results as a table, with the ratio to the baseline when there is one
+
+    Args:
+        results: the results of the benchmarks
+        comparisons: the comparisons to the baseline
+    """
+    ratios = {(comparison['benchmark'], comparison['size']): comparison['ratio'] for comparison in comparisons or []}
+    print(f'{"benchmark":<26}{"size":>8}{"median (s)":>14}{"p95 (s)":>14}{"items/s":>14}{"vs baseline":>14}')
+    for result in results:
+        ratio = ratios.get((result['benchmark'], result['size']))
+        print(f'{result["benchmark"]:<26}{result["size"]:>8}{result["median"]:>14.6f}{result["p95"]:>14.6f}'
+              f'{result["items_per_second"] or 0:>14.1f}{"" if ratio is None else f"{ratio:.2f}x":>14}')
+
+
+def main(argv: 'List[str]' = None) -> dict:
+    parser = argparse.ArgumentParser(description='Time reading datasets from synthetic catalogs and writing them.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000],
+                        help='the numbers of datasets in each catalog')
+    parser.add_argument('--fields', type=int, default=50, help='the number of fields in each dataset')
+    parser.add_argument('--definition-lines', type=int, default=200,
+                        help="the number of lines in each dataset's definition")
+    parser.add_argument('--sample', type=int, default=100, help='the number of datasets to resolve from each catalog')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000], help='the numbers of rows to write')
+    parser.add_argument('--repeat', type=int, default=5, help='the number of times to time each benchmark')
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help='the number of rows the transfer engine inserts at a time')
+    parser.add_argument('--seed', type=int, default=0, help='the seed for the generated catalogs and tables')
+    parser.add_argument('--workdir', help='the directory to generate catalogs in, defaults to a temporary directory')
+    parser.add_argument('--output', help='the file to write the results to, as JSON')
+    parser.add_argument('--compare', help='a results file from an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        report = run(workdir=Path(args.workdir or temp_dir), sizes=args.sizes, field_count=args.fields,
+                     definition_lines=args.definition_lines, sample=args.sample, rows=args.rows, repeat=args.repeat,
+                     batch_size=args.batch_size, seed=args.seed)
+    if args.compare:
+        report['comparisons'] = compare(baseline=json.loads(Path(args.compare).read_text()), current=report)
+    print_results(results=report['results'], comparisons=report.get('comparisons'))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
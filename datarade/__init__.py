@@ -1,4 +1,25 @@
 """This library provides tools that allow datasets to be defined separately from a pipeline."""
+import importlib
+
 __version__ = '0.3.0'
 
-from datarade.services import get_dataset_catalog, get_dataset_container, get_dataset, write_dataset
+__all__ = ['get_dataset_catalog', 'get_dataset_catalog_async', 'get_dataset_container', 'list_datasets', 'get_dataset',
+           'get_dataset_async', 'get_datasets', 'write_dataset', 'write_datasets']
+
+_SUBMODULES = ['cache', 'git_client', 'instrumentation', 'models', 'scheduler', 'schemas', 'services', 'testing',
+               'transfer']
+
+
+def __getattr__(name: str):
+    # the services and the submodules are imported the first time they are used, which keeps importing datarade fast
+    if name in __all__:
+        from datarade import services
+
+        return getattr(services, name)
+    if name in _SUBMODULES:
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__() -> 'list':
+    return sorted(set(globals()) | set(__all__) | set(_SUBMODULES))
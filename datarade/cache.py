@@ -0,0 +1,159 @@
+"""
+This module provides a persistent, content-addressed cache for files read out of a dataset catalog.
+
+Each file is recorded under a key that identifies where it came from (platform, repo, branch and path), along with the
+version the git platform reported for it (an ETag or a blob object id). The contents themselves are stored once per
+unique blob, named by their sha256 digest, so the same definition on a uat branch and a production branch only takes up
+space once. The git clients use the recorded version to revalidate an entry with the platform instead of downloading it
+again.
+"""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+DEFAULT_CACHE_DIR = Path.home() / Path('.datarade') / Path('cache')
+DEFAULT_CACHE_SIZE = 100 * 1024 * 1024
+
+
+class FileCache:
+    """
+    A size-bounded, on-disk cache of catalog files
+
+    Blobs are evicted in least recently used order once the total size of all blobs exceeds the maximum size. A blob's
+    modification time is used as its last access time so that reads never have to rewrite the index.
+
+    Args:
+        cache_dir: the directory to store the cache in, defaults to ~/.datarade/cache
+        max_size: the maximum number of bytes of file contents to keep, defaults to 100 MB
+    """
+
+    def __init__(self, cache_dir: str = None, max_size: int = None):
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else DEFAULT_CACHE_DIR
+        self.max_size = max_size if max_size is not None else DEFAULT_CACHE_SIZE
+        self.blob_dir = self.cache_dir / Path('blobs')
+        self.index_file = self.cache_dir / Path('index.json')
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._index: 'Dict[str, Dict[str, str]]' = self._read_index()
+
+    def get(self, key: str) -> 'Optional[Tuple[str, bytes]]':
+        """
+        Looks up a file in the cache and marks its blob as recently used
+
+        Args:
+            key: the key that identifies the file
+
+        Returns: a tuple of the cached version and the file contents, or None if the file is not cached
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            blob = self.blob_dir / entry['digest']
+            try:
+                contents = blob.read_bytes()
+                if hashlib.sha256(contents).hexdigest() != entry['digest']:
+                    blob.unlink()
+                    contents = None
+                else:
+                    os.utime(blob)
+            except FileNotFoundError:  # another process evicted the blob after the index was read
+                contents = None
+            if contents is None:
+                self._index.pop(key, None)
+                return None
+            return entry['version'], contents
+
+    def put(self, key: str, version: str, contents: bytes):
+        """
+        Stores a file in the cache, evicting the least recently used blobs if the cache is over its maximum size
+
+        Files that are larger than the maximum size are not cached, and any older copy of the file is forgotten.
+
+        Args:
+            key: the key that identifies the file
+            version: the ETag or blob id that the git platform reported for this copy of the file
+            contents: the contents of the file
+        """
+        digest = hashlib.sha256(contents).hexdigest()
+        with self._lock:
+            if len(contents) > self.max_size:
+                self._index = self._read_index()
+                if self._index.pop(key, None) is not None:
+                    self._write_index()
+                return
+            blob = self.blob_dir / digest
+            if blob.exists():
+                os.utime(blob)
+            else:
+                temp_blob = self.blob_dir / f'{digest}.{os.getpid()}.{threading.get_ident()}.tmp'
+                temp_blob.write_bytes(contents)
+                os.replace(temp_blob, blob)
+            self._index = self._read_index()
+            self._index[key] = {'version': version, 'digest': digest}
+            self._evict(keep=digest)
+            self._write_index()
+
+    def clear(self):
+        """
+        Removes every file from the cache
+        """
+        with self._lock:
+            for blob in self.blob_dir.iterdir():
+                blob.unlink()
+            self._index = {}
+            self._write_index()
+
+    def _evict(self, keep: str = None):
+        """
+        Removes the least recently used blobs, and any index entries that point to them, until the cache fits within
+        its maximum size
+
+        Args:
+            keep: the digest of a blob that must not be evicted, like the one that was just stored
+        """
+        blobs = []
+        for blob in self.blob_dir.iterdir():
+            if blob.name.endswith('.tmp'):
+                continue
+            try:
+                blobs.append((blob.stat(), blob))
+            except FileNotFoundError:  # another process evicted the blob while the directory was being listed
+                continue
+        total_size = sum(blob_stat.st_size for blob_stat, _ in blobs)
+        evicted = set()
+        for blob_stat, blob in sorted(blobs, key=lambda x: x[0].st_mtime):
+            if total_size <= self.max_size:
+                break
+            if blob.name == keep:
+                continue
+            try:
+                blob.unlink()
+            except FileNotFoundError:
+                pass
+            total_size -= blob_stat.st_size
+            evicted.add(blob.name)
+        if evicted:
+            self._index = {key: entry for key, entry in self._index.items() if entry['digest'] not in evicted}
+
+    def _read_index(self) -> 'Dict[str, Dict[str, str]]':
+        """
+        Reads the index from disk, which allows several processes to share one cache directory
+
+        Returns: a dictionary of keys to their version and blob digest
+        """
+        try:
+            return json.loads(self.index_file.read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_index(self):
+        """
+        Atomically replaces the index on disk with the in-memory index
+        """
+        temp_index = self.cache_dir / f'index.{os.getpid()}.{threading.get_ident()}.tmp'
+        temp_index.write_text(json.dumps(self._index))
+        os.replace(temp_index, self.index_file)
@@ -1,15 +1,30 @@
 """
 This client allows a user to access files stored in a git-compliant source control repository.
-It supports publicly available repos hosted on GitHub and public or private git-compliant repos hosted on Azure Repos.
+It supports publicly available repos hosted on GitHub and public or private git-compliant repos hosted on Azure Repos,
+as well as local working trees and clones.
 """
 import abc
-from typing import Generator
+import codecs
+import email.utils
+import hashlib
+import io
+import subprocess
+import tarfile
+import threading
+import time
+import weakref
+import zipfile
+from pathlib import Path
+from typing import Dict, Generator, Iterable, Iterator, Mapping, Optional, TYPE_CHECKING
+from urllib.parse import urlencode
 
-import requests
-from azure.devops.connection import Connection
-from azure.devops.v6_0.git.models import GitVersionDescriptor
-from msrest.authentication import BasicAuthentication
-from azure.devops.v6_0.git.git_client import GitClient as AzureReposGitClient
+# the azure-devops package is imported by AzureReposClient, so that it's only imported for Azure Repos catalogs, and
+# requests is imported by HTTPTransport, so that it's only imported once a GitHub catalog is used
+if TYPE_CHECKING:
+    import aiohttp
+    import requests
+    from azure.devops.v6_0.git.git_client import GitClient as AzureReposGitClient
+    from datarade.cache import FileCache
 
 
 class AbstractGitClient(abc.ABC):
@@ -26,6 +41,218 @@ class AbstractGitClient(abc.ABC):
         """
         raise NotImplementedError
 
+    def iter_file_contents(self, file_path: str) -> 'Iterator[str]':
+        """
+        This returns the contents of a file in the repo as a stream of strings, so that large files can be consumed
+        without holding several copies of them in memory. Clients that can't stream yield the whole file at once.
+
+        Args:
+            file_path: the relative path to the file within the repo
+
+        Returns: an iterator over the file contents as strings
+        """
+        yield self.get_file_contents(file_path=file_path)
+
+    def get_archive(self, folder_path: str) -> 'Dict[str, bytes]':
+        """
+        This downloads every file in a folder of the repo in a single request.
+
+        Args:
+            folder_path: the relative path to the folder within the repo
+
+        Returns: a dictionary of relative file paths within the repo to file contents
+        """
+        raise NotImplementedError
+
+    def list_files(self, folder_path: str) -> 'Dict[str, str]':
+        """
+        This lists every file in a folder of the repo, recursively, in a single request.
+
+        Args:
+            folder_path: the relative path to the folder within the repo
+
+        Returns: a dictionary of relative file paths within the repo to git blob ids
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        This releases any connections or processes held by the client.
+        """
+        pass
+
+    def __enter__(self) -> 'AbstractGitClient':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def git_blob_id(contents: bytes) -> str:
+    """
+    Calculates the id git gives to a blob with these contents
+
+    Args:
+        contents: the contents of the file
+
+    Returns: the blob id, as a hex string
+    """
+    return hashlib.sha1(b'blob %d\0' % len(contents) + contents).hexdigest()
+
+
+def decode_contents(contents: bytes, encoding: str = 'utf-8') -> str:
+    """
+    Decodes the contents of a file, which every git client does before returning them
+
+    Args:
+        contents: the contents of the file
+        encoding: the encoding of the file
+
+    Returns: the contents of the file as a string
+    """
+    return contents.decode(encoding)
+
+
+def decode_chunks(chunks: 'Iterable[bytes]', encoding: str = 'utf-8') -> 'Iterator[str]':
+    """
+    Decodes a stream of bytes into a stream of strings, including characters that are split across two chunks
+
+    Args:
+        chunks: the chunks of bytes
+        encoding: the encoding of the bytes
+
+    Returns: an iterator over the decoded strings
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def is_not_found(e: Exception) -> bool:
+    """
+    Determines whether an exception raised while getting a file means that the file does not exist, as opposed to a
+    failure like a rate limit, an authentication error or an unavailable server
+
+    Args:
+        e: the exception raised by a git client
+
+    Returns: True if the file does not exist
+    """
+    if isinstance(e, FileNotFoundError):
+        return True
+    # requests.HTTPError carries its response, aiohttp.ClientResponseError carries the status code itself
+    if getattr(getattr(e, 'response', None), 'status_code', None) == 404 or getattr(e, 'status', None) == 404:
+        return True
+    # the azure-devops package raises an AzureDevOpsServiceError with the message of a TF401174 error for missing items
+    return getattr(e, 'type_key', None) == 'GitItemNotFoundException' or \
+        str(getattr(e, 'message', '')).startswith('TF401174')
+
+
+def retry_delay(status_code: int, headers: 'Mapping[str, str]', attempt: int,
+                backoff_factor: float) -> 'Optional[float]':
+    """
+    Determines how long to wait before retrying a request given the response to the previous attempt
+
+    Rate limited responses (429, or 403 with no remaining rate limit or with a Retry-After header, like GitHub's
+    secondary rate limit) wait for as long as the server asks through Retry-After or X-RateLimit-Reset. Server errors,
+    and rate limited responses that don't say how long to wait, back off exponentially. A Retry-After value that is
+    neither a number of seconds nor an HTTP date is ignored, and so is an X-RateLimit-Reset value that is not a number
+    of seconds since the epoch.
+
+    Args:
+        status_code: the status code of the response
+        headers: the headers of the response
+        attempt: the number of attempts that have already been retried, starting at 0
+        backoff_factor: the number of seconds to wait before the first exponential backoff retry
+
+    Returns: the number of seconds to wait, or None if the request should not be retried
+    """
+    rate_limited = status_code == 429 or (status_code == 403 and (headers.get('X-RateLimit-Remaining') == '0' or
+                                                                   headers.get('Retry-After') is not None))
+    if not rate_limited and status_code not in (500, 502, 503, 504):
+        return None
+    retry_after = headers.get('Retry-After')
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max(email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            pass
+    rate_limit_reset = headers.get('X-RateLimit-Reset')
+    if rate_limited and rate_limit_reset is not None:
+        try:
+            return max(float(rate_limit_reset) - time.time(), 0.0)
+        except ValueError:
+            pass
+    return backoff_factor * 2 ** attempt
+
+
+class HTTPTransport:
+    """
+    A pooled, keep-alive HTTP transport that is shared by every request a git client makes
+
+    Connections are reused across requests through a requests Session, responses are requested with gzip compression,
+    and throttled or failed requests are retried according to retry_delay(). Requests that can't connect or time out
+    are retried with exponential backoff.
+
+    Args:
+        pool_size: the maximum number of connections to keep alive per host
+        max_retries: the maximum number of times to retry a single request
+        backoff_factor: the number of seconds to wait before the first exponential backoff retry
+        max_wait: the maximum number of seconds to wait between two attempts
+        timeout: the maximum number of seconds to wait to connect, and then for each part of the response
+    """
+    def __init__(self, pool_size: int = 10, max_retries: int = 5, backoff_factor: float = 0.5,
+                 max_wait: float = 60.0, timeout: float = 60.0):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_wait = max_wait
+        self.timeout = timeout
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, url: str, headers: dict = None) -> 'requests.Response':
+        """
+        Performs a get request, retrying it while the server is rate limiting or failing, or can't be reached
+
+        Args:
+            url: the url to get
+            headers: any headers to add to the session's default headers
+
+        Returns: the final response, which may still be a failed response once the retries are used up
+        """
+        import requests
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(url=url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise e
+                delay = self.backoff_factor * 2 ** attempt
+            else:
+                delay = retry_delay(status_code=response.status_code, headers=response.headers, attempt=attempt,
+                                    backoff_factor=self.backoff_factor)
+                if delay is None or attempt >= self.max_retries:
+                    return response
+            time.sleep(min(delay, self.max_wait))
+            attempt += 1
+
 
 class GitHubClient(AbstractGitClient):
     """
@@ -36,15 +263,35 @@ class GitHubClient(AbstractGitClient):
         repository: the name of the repo (e.g. https://github.com/<organization>/<repository>)
         organization: the user or organization that owns the repo (see repository example)
         branch: the name of the branch to use
+        cache: an optional FileCache, files in the cache are revalidated with their ETag instead of downloaded again
+        transport: an HTTPTransport to share with other clients, a new one is created if not provided
+        pool_size: the maximum number of connections to keep alive when creating a new transport
+        base_url: a url that serves raw files, archives and the trees API in place of GitHub, such as a local
+            datarade.testing.git_server.GitServer
     """
-    def __init__(self, repository: str, organization: str, branch: str):
-        self.base_url = f'https://raw.githubusercontent.com/{organization}'
+    def __init__(self, repository: str, organization: str, branch: str, cache: 'Optional[FileCache]' = None,
+                 transport: 'Optional[HTTPTransport]' = None, pool_size: int = 10, base_url: str = None):
+        if base_url is None:
+            self.base_url = f'https://raw.githubusercontent.com/{organization}'
+            self.archive_url = f'https://codeload.github.com/{organization}'
+            self.api_url = f'https://api.github.com/repos/{organization}'
+        else:
+            self.base_url = f'{base_url}/{organization}'
+            self.archive_url = f'{base_url}/{organization}'
+            self.api_url = f'{base_url}/repos/{organization}'
+        self.organization = organization
         self.repository = repository
         self.branch = branch
+        self.cache = cache
+        self.transport = transport if transport is not None else HTTPTransport(pool_size=pool_size)
 
     def get_file_contents(self, file_path: str) -> str:
         """
-        This performs a basic get on the raw contents on GitHub. It's not ideal, but does the job.
+        This performs a basic get on the raw contents on GitHub. It's not ideal, but does the job. Responses that are
+        still unsuccessful after the transport's retries raise an HTTPError rather than being returned as the contents.
+
+        If there is a cache, the cached ETag is sent along with the request and the cached contents are returned when
+        GitHub reports that the file has not been modified.
 
         Args:
             file_path: the relative path to the file within the repo
@@ -52,13 +299,69 @@ class GitHubClient(AbstractGitClient):
         Returns: the contents of the file as a string
         """
         url = f'{self.base_url}/{self.repository}/{self.branch}/{file_path}'
+        cache_key = f'github/{self.organization}/{self.repository}/{self.branch}/{file_path}'
+        cached = self.cache.get(cache_key) if self.cache is not None else None
+        headers = {'If-None-Match': cached[0]} if cached is not None else {}
         try:
-            response = requests.get(url=url)
+            response = self.transport.get(url=url, headers=headers)
+            if cached is not None and response.status_code == 304:
+                return decode_contents(contents=cached[1])
+            response.raise_for_status()
         except Exception as e:
             print(f'File does not exist at: {url}')
             raise e
         else:
-            return response.content
+            etag = response.headers.get('ETag')
+            if self.cache is not None and response.status_code == 200 and etag is not None:
+                self.cache.put(cache_key, etag, response.content)
+            return decode_contents(contents=response.content)
+
+    def get_archive(self, folder_path: str) -> 'Dict[str, bytes]':
+        """
+        This downloads the tarball of the branch and keeps the files within the folder.
+
+        Args:
+            folder_path: the relative path to the folder within the repo
+
+        Returns: a dictionary of relative file paths within the repo to file contents
+        """
+        url = f'{self.archive_url}/{self.repository}/tar.gz/{self.branch}'
+        try:
+            response = self.transport.get(url=url)
+            response.raise_for_status()
+        except Exception as e:
+            print(f'Archive does not exist at: {url}')
+            raise e
+        files = {}
+        with tarfile.open(fileobj=io.BytesIO(response.content), mode='r:gz') as archive:
+            for member in archive:
+                # every member is nested in a '<repository>-<branch>' directory
+                file_path = member.name.partition('/')[2]
+                if member.isfile() and file_path.startswith(f'{folder_path}/'):
+                    files[file_path] = archive.extractfile(member).read()
+        return files
+
+    def list_files(self, folder_path: str) -> 'Dict[str, str]':
+        """
+        This lists the tree of the branch, with recursion, through the git trees API.
+
+        Args:
+            folder_path: the relative path to the folder within the repo
+
+        Returns: a dictionary of relative file paths within the repo to git blob ids
+        """
+        url = f'{self.api_url}/{self.repository}/git/trees/{self.branch}?recursive=1'
+        try:
+            response = self.transport.get(url=url)
+            response.raise_for_status()
+        except Exception as e:
+            print(f'Tree does not exist at: {url}')
+            raise e
+        tree = response.json()
+        if tree.get('truncated'):
+            print(f'The tree listing was truncated by GitHub, some files may be missing: {url}')
+        return {item['path']: item['sha'] for item in tree['tree']
+                if item['type'] == 'blob' and item['path'].startswith(f'{folder_path}/')}
 
 
 class AzureReposClient(AbstractGitClient):
@@ -73,17 +376,25 @@ class AzureReposClient(AbstractGitClient):
         branch: the name of the branch to use
         username: the username for the repo
         password: the password for the repo
+        cache: an optional FileCache, files in the cache are revalidated by comparing blob object ids instead of
+            downloaded again
+        base_url: a url that serves the Azure DevOps REST API in place of https://dev.azure.com, such as a local
+            datarade.testing.git_server.GitServer
     """
     def __init__(self, repository: str, organization: str, project: str, branch: str,
-                 username: str, password: str):
+                 username: str, password: str, cache: 'Optional[FileCache]' = None, base_url: str = None):
+        from azure.devops.v6_0.git.models import GitVersionDescriptor
+
         self.client: 'AzureReposGitClient' = self._get_client(organization=organization, username=username,
-                                                              password=password)
+                                                              password=password, base_url=base_url)
+        self.organization = organization
         self.project = project
         self.repository = repository
         self.version_descriptor = GitVersionDescriptor(version=branch)
+        self.cache = cache
 
     @staticmethod
-    def _get_client(organization: str, username: str, password: str) -> 'AzureReposGitClient':
+    def _get_client(organization: str, username: str, password: str, base_url: str = None) -> 'AzureReposGitClient':
         """
         This method configures this client to connect to Azure Repos.
 
@@ -91,10 +402,14 @@ class AzureReposClient(AbstractGitClient):
             organization: the organization within the Azure DevOps instance
             username: the username for the organization
             password: this can be a password for no MFA, or the git credentials password that overrides MFA
+            base_url: the url to use in place of https://dev.azure.com
 
         Returns: an instance of the azure-devops v6.0 GitClient
         """
-        base_url = f'https://dev.azure.com/{organization}'
+        from azure.devops.connection import Connection
+        from msrest.authentication import BasicAuthentication
+
+        base_url = f'{base_url or "https://dev.azure.com"}/{organization}'
         credentials = BasicAuthentication(username=username, password=password)
         connection = Connection(base_url=base_url, creds=credentials)
         client_type = 'azure.devops.v6_0.git.git_client.GitClient'
@@ -104,11 +419,35 @@ class AzureReposClient(AbstractGitClient):
         """
         This uses get_item_content() to get the file contents from Azure Repos.
 
+        If there is a cache, this first looks up the object id of the file on the branch with get_item(). The cached
+        contents are returned when the object id matches the cached one, otherwise the blob is downloaded by its object
+        id with get_blob_content() and cached.
+
         Args:
             file_path: the relative path to the file within the repo
 
         Returns: the contents of the file as a string
         """
+        if self.cache is not None:
+            try:
+                return self._get_cached_file_contents(file_path=file_path)
+            except Exception as e:
+                print(f'File does not exist at: {self._path_to_file(file_path=file_path)}')
+                raise e
+        return ''.join(self.iter_file_contents(file_path=file_path))
+
+    def iter_file_contents(self, file_path: str) -> 'Iterator[str]':
+        """
+        This streams the file contents from get_item_content(), decoding each chunk as it arrives.
+
+        Args:
+            file_path: the relative path to the file within the repo
+
+        Returns: an iterator over the contents of the file as strings
+        """
+        if self.cache is not None:
+            yield self.get_file_contents(file_path=file_path)
+            return
         try:
             content: 'Generator' = self.client.get_item_content(repository_id=self.repository,
                                                                 project=self.project,
@@ -116,11 +455,532 @@ class AzureReposClient(AbstractGitClient):
                                                                 version_descriptor=self.version_descriptor,
                                                                 download=True)
         except Exception as e:
-            path_to_file = f'{self.project}/{self.repository}/{self.version_descriptor.version}/{file_path}'
-            print(f'File does not exist at: {path_to_file}')
+            print(f'File does not exist at: {self._path_to_file(file_path=file_path)}')
             raise e
-        else:
-            file = ''
-            for item in content:
-                file += item.decode('utf-8')
-            return file
+        yield from decode_chunks(chunks=content)
+
+    def _path_to_file(self, file_path: str) -> str:
+        """
+        Describes where a file lives for error messages
+
+        Args:
+            file_path: the relative path to the file within the repo
+
+        Returns: the path to the file, including the project, repository and branch
+        """
+        return f'{self.project}/{self.repository}/{self.version_descriptor.version}/{file_path}'
+
+    def get_archive(self, folder_path: str) -> 'Dict[str, bytes]':
+        """
+        This uses get_item_zip() to download the folder, with full recursion, as a zip file.
+
+        Args:
+            folder_path: the relative path to the folder within the repo
+
+        Returns: a dictionary of relative file paths within the repo to file contents
+        """
+        try:
+            content: 'Generator' = self.client.get_item_zip(repository_id=self.repository,
+                                                            project=self.project,
+                                                            path=folder_path,
+                                                            recursion_level='Full',
+                                                            version_descriptor=self.version_descriptor,
+                                                            download=True)
+            zip_file = io.BytesIO(b''.join(content))
+        except Exception as e:
+            print(f'Folder does not exist at: {self._path_to_file(file_path=folder_path)}')
+            raise e
+        files = {}
+        with zipfile.ZipFile(zip_file) as archive:
+            for member in archive.infolist():
+                if member.is_dir():
+                    continue
+                file_path = member.filename.lstrip('/')
+                if not file_path.startswith(f'{folder_path}/'):
+                    file_path = f'{folder_path}/{file_path}'
+                files[file_path] = archive.read(member)
+        return files
+
+    def list_files(self, folder_path: str) -> 'Dict[str, str]':
+        """
+        This uses get_items() to list the folder with full recursion.
+
+        Args:
+            folder_path: the relative path to the folder within the repo
+
+        Returns: a dictionary of relative file paths within the repo to git blob ids
+        """
+        try:
+            items = self.client.get_items(repository_id=self.repository, project=self.project,
+                                          scope_path=folder_path, recursion_level='Full',
+                                          version_descriptor=self.version_descriptor)
+        except Exception as e:
+            print(f'Folder does not exist at: {self._path_to_file(file_path=folder_path)}')
+            raise e
+        return {item.path.lstrip('/'): item.object_id for item in items if not item.is_folder}
+
+    def _get_cached_file_contents(self, file_path: str) -> str:
+        """
+        Revalidates the cached copy of a file against the object id of the file on the branch
+
+        Args:
+            file_path: the relative path to the file within the repo
+
+        Returns: the contents of the file as a string
+        """
+        cache_key = f'azure-devops/{self.organization}/{self.project}/{self.repository}/' \
+                    f'{self.version_descriptor.version}/{file_path}'
+        item = self.client.get_item(repository_id=self.repository, project=self.project, path=file_path,
+                                    version_descriptor=self.version_descriptor)
+        cached = self.cache.get(cache_key)
+        if cached is not None and cached[0] == item.object_id:
+            return decode_contents(contents=cached[1])
+        content: 'Generator' = self.client.get_blob_content(repository_id=self.repository, project=self.project,
+                                                            sha1=item.object_id, download=True)
+        contents = b''.join(content)
+        self.cache.put(cache_key, item.object_id, contents)
+        return decode_contents(contents=contents)
+
+
+class ArchiveClient(AbstractGitClient):
+    """
+    This client wraps another git client and serves every file within a folder from a single archive of that folder.
+    The archive is downloaded the first time a file is requested and is then kept in memory. Files outside of the
+    folder are passed through to the wrapped client.
+
+    Args:
+        client: the git client used to download the archive
+        folder_path: the relative path to the folder within the repo, defaults to 'catalog'
+    """
+    def __init__(self, client: 'AbstractGitClient', folder_path: str = 'catalog'):
+        self.client = client
+        self.folder_path = folder_path
+        self._files: 'Optional[Dict[str, bytes]]' = None
+        self._lock = threading.Lock()
+
+    @property
+    def files(self) -> 'Dict[str, bytes]':
+        """
+        Downloads the archive if it has not been downloaded yet
+
+        Returns: a dictionary of relative file paths within the repo to file contents
+        """
+        with self._lock:
+            if self._files is None:
+                self._files = self.client.get_archive(folder_path=self.folder_path)
+            return self._files
+
+    def get_file_contents(self, file_path: str) -> str:
+        """
+        This looks up the file in the archive.
+
+        Args:
+            file_path: the relative path to the file within the repo
+
+        Returns: the contents of the file as a string
+        """
+        if not file_path.startswith(f'{self.folder_path}/'):
+            return self.client.get_file_contents(file_path=file_path)
+        try:
+            return decode_contents(contents=self.files[file_path])
+        except KeyError:
+            print(f'File does not exist in the archive: {file_path}')
+            raise FileNotFoundError(file_path)
+
+    def get_archive(self, folder_path: str) -> 'Dict[str, bytes]':
+        """
+        This returns the files within the folder from the archive when the folder is within the archived folder.
+
+        Args:
+            folder_path: the relative path to the folder within the repo
+
+        Returns: a dictionary of relative file paths within the repo to file contents
+        """
+        if folder_path != self.folder_path and not folder_path.startswith(f'{self.folder_path}/'):
+            return self.client.get_archive(folder_path=folder_path)
+        return {file_path: contents for file_path, contents in self.files.items()
+                if file_path.startswith(f'{folder_path}/')}
+
+    def list_files(self, folder_path: str) -> 'Dict[str, str]':
+        """
+        This lists the files within the folder from the archive when the folder is within the archived folder.
+
+        Args:
+            folder_path: the relative path to the folder within the repo
+
+        Returns: a dictionary of relative file paths within the repo to git blob ids
+        """
+        if folder_path != self.folder_path and not folder_path.startswith(f'{self.folder_path}/'):
+            return self.client.list_files(folder_path=folder_path)
+        return {file_path: git_blob_id(contents=contents)
+                for file_path, contents in self.get_archive(folder_path=folder_path).items()}
+
+    def refresh(self):
+        """
+        Discards the archive so that the next request downloads it again
+        """
+        with self._lock:
+            self._files = None
+
+    def close(self):
+        """
+        This closes the wrapped client.
+        """
+        self.client.close()
+
+
+class LocalGitClient(AbstractGitClient):
+    """
+    This client reads files from a repo on the local file system, such as a mirror that is kept in sync with the
+    hosted repo. Without a branch, files are read from the working tree. With a branch (or a tag or commit), files are
+    read straight out of the clone's object database, which also works for bare clones. Objects are read through a
+    single long-running 'git cat-file --batch' process, which requires git to be installed. The process is stopped by
+    close(), or when the client is garbage collected.
+
+    Args:
+        repository: the path to the working tree or clone
+        branch: the branch, tag or commit to read files at, the working tree is read if this is not provided
+    """
+    def __init__(self, repository: str, branch: str = None):
+        self.path = Path(repository)
+        self.branch = branch
+        self._process: 'Optional[subprocess.Popen]' = None
+        self._finalizer: 'Optional[weakref.finalize]' = None
+        self._lock = threading.Lock()
+
+    def get_file_contents(self, file_path: str) -> str:
+        """
+        This reads the file from the working tree, or from the object database at the branch.
+
+        Args:
+            file_path: the relative path to the file within the repo
+
+        Returns: the contents of the file as a string
+        """
+        try:
+            if self.branch is None:
+                return decode_contents(contents=(self.path / file_path).read_bytes())
+            return decode_contents(contents=self._read_object(object_name=f'{self.branch}:{file_path}'))
+        except Exception as e:
+            print(f'File does not exist at: {self.path}/{self.branch or ""}/{file_path}')
+            raise e
+
+    def get_archive(self, folder_path: str) -> 'Dict[str, bytes]':
+        """
+        This reads every file within the folder from the working tree, or from the object database at the branch.
+
+        Args:
+            folder_path: the relative path to the folder within the repo
+
+        Returns: a dictionary of relative file paths within the repo to file contents
+        """
+        if self.branch is None:
+            return {file.relative_to(self.path).as_posix(): file.read_bytes()
+                    for file in (self.path / folder_path).rglob('*') if file.is_file()}
+        tree = subprocess.run(['git', '-C', str(self.path), 'ls-tree', '-r', '-z', '--name-only', self.branch, '--',
+                               folder_path], check=True, stdout=subprocess.PIPE).stdout
+        return {file_path: self._read_object(object_name=f'{self.branch}:{file_path}')
+                for file_path in tree.decode('utf-8').split('\0') if file_path}
+
+    def list_files(self, folder_path: str) -> 'Dict[str, str]':
+        """
+        This lists the files within the folder in the working tree, or in the object database at the branch.
+
+        Args:
+            folder_path: the relative path to the folder within the repo
+
+        Returns: a dictionary of relative file paths within the repo to git blob ids
+        """
+        if self.branch is None:
+            return {file.relative_to(self.path).as_posix(): git_blob_id(contents=file.read_bytes())
+                    for file in (self.path / folder_path).rglob('*') if file.is_file()}
+        tree = subprocess.run(['git', '-C', str(self.path), 'ls-tree', '-r', '-z', self.branch, '--', folder_path],
+                              check=True, stdout=subprocess.PIPE).stdout
+        files = {}
+        for item in tree.decode('utf-8').split('\0'):
+            if item:
+                # each item is '<mode> <type> <blob id>\t<path>'
+                metadata, file_path = item.split('\t', 1)
+                files[file_path] = metadata.split()[2]
+        return files
+
+    def _read_object(self, object_name: str) -> bytes:
+        """
+        Reads an object through the 'git cat-file --batch' process, starting the process if it's not running
+
+        Args:
+            object_name: the name of the object, in '<branch>:<path>' format
+
+        Returns: the contents of the object
+        """
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._stop_process()
+                self._process = subprocess.Popen(['git', '-C', str(self.path), 'cat-file', '--batch'],
+                                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+                self._finalizer = weakref.finalize(self, _stop_process, self._process)
+            self._process.stdin.write(f'{object_name}\n'.encode('utf-8'))
+            self._process.stdin.flush()
+            header = self._process.stdout.readline().rstrip(b'\n')
+            # '<object name> missing' or '<object name> ambiguous', where the object name may contain spaces
+            name, _, status = header.rpartition(b' ')
+            if name == object_name.encode('utf-8') and status in (b'missing', b'ambiguous'):
+                raise FileNotFoundError(object_name)
+            _, object_type, size = header.split(b' ')
+            contents = self._process.stdout.read(int(size))
+            self._process.stdout.read(1)  # every object is followed by a newline
+        if object_type != b'blob':
+            raise FileNotFoundError(object_name)
+        return contents
+
+    def close(self):
+        """
+        This stops the 'git cat-file --batch' process, if it's running.
+        """
+        with self._lock:
+            self._stop_process()
+
+    def _stop_process(self):
+        """
+        Stops the 'git cat-file --batch' process, if one was started, the caller should hold the lock
+        """
+        if self._finalizer is not None:
+            self._finalizer()
+        self._process = None
+        self._finalizer = None
+
+
+def _stop_process(process: 'subprocess.Popen'):
+    """
+    Stops a 'git cat-file --batch' process by closing its input, which is also used as a finalizer for LocalGitClient
+
+    Args:
+        process: the process to stop
+    """
+    process.stdin.close()
+    process.wait()
+    process.stdout.close()
+
+
+class AsyncGitClient(abc.ABC):
+    """
+    This is the asyncio counterpart to AbstractGitClient, for use within an event loop. Clients hold on to open
+    connections, so they should be closed with close() when they are no longer needed.
+    """
+
+    @abc.abstractmethod
+    async def get_file_contents(self, file_path: str) -> str:
+        """
+        This returns the contents of a file in the repo.
+
+        Args:
+            file_path: the relative path to the file within the repo
+
+        Returns: the file contents as a string
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        """
+        This releases any connections held by the client.
+        """
+        pass
+
+
+class AsyncHTTPGitClient(AsyncGitClient):
+    """
+    This is the base for async clients that read raw files over HTTP with aiohttp. It shares its retry behavior with
+    HTTPTransport and revalidates cached files with If-None-Match.
+
+    aiohttp is an optional dependency, which is installed with the 'async' extra.
+
+    Args:
+        cache: an optional FileCache, files in the cache are revalidated with their ETag instead of downloaded again
+        pool_size: the maximum number of connections to keep open at the same time
+        max_retries: the maximum number of times to retry a single request
+        backoff_factor: the number of seconds to wait before the first exponential backoff retry
+        max_wait: the maximum number of seconds to wait between two attempts
+        timeout: the maximum number of seconds a single attempt may take
+    """
+    def __init__(self, cache: 'Optional[FileCache]' = None, pool_size: int = 10, max_retries: int = 5,
+                 backoff_factor: float = 0.5, max_wait: float = 60.0, timeout: float = 60.0):
+        self.cache = cache
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._session: 'Optional[aiohttp.ClientSession]' = None
+
+    @property
+    def session(self) -> 'aiohttp.ClientSession':
+        """
+        Creates the aiohttp session the first time it's needed, since it has to be created within the event loop
+
+        Returns: an aiohttp ClientSession
+        """
+        if self._session is None:
+            import aiohttp
+
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(connector=connector, auth=self._auth,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                                  headers={'Accept-Encoding': 'gzip, deflate'})
+        return self._session
+
+    @property
+    def _auth(self) -> 'Optional[aiohttp.BasicAuth]':
+        """
+        The credentials to send with every request, if any
+
+        Returns: an aiohttp BasicAuth object, or None
+        """
+        return None
+
+    @abc.abstractmethod
+    def _file_url(self, file_path: str) -> str:
+        """
+        Builds the url that returns the raw contents of the file
+
+        Args:
+            file_path: the relative path to the file within the repo
+
+        Returns: the url to the raw file
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _cache_key(self, file_path: str) -> str:
+        """
+        Builds the key that identifies the file in the cache
+
+        Args:
+            file_path: the relative path to the file within the repo
+
+        Returns: the cache key
+        """
+        raise NotImplementedError
+
+    async def get_file_contents(self, file_path: str) -> str:
+        """
+        This gets the raw contents of the file, retrying the request while the server is rate limiting or failing, or
+        can't be reached.
+
+        Args:
+            file_path: the relative path to the file within the repo
+
+        Returns: the contents of the file as a string
+        """
+        import asyncio
+
+        import aiohttp
+
+        # the cache reads and writes files, so it's used on the default executor to keep the event loop free
+        loop = asyncio.get_event_loop()
+        url = self._file_url(file_path=file_path)
+        cache_key = self._cache_key(file_path=file_path)
+        cached = await loop.run_in_executor(None, self.cache.get, cache_key) if self.cache is not None else None
+        headers = {'If-None-Match': cached[0]} if cached is not None else {}
+        attempt = 0
+        try:
+            while True:
+                try:
+                    async with self.session.get(url, headers=headers) as response:
+                        delay = retry_delay(status_code=response.status, headers=response.headers, attempt=attempt,
+                                            backoff_factor=self.backoff_factor)
+                        if delay is None or attempt >= self.max_retries:
+                            if cached is not None and response.status == 304:
+                                return decode_contents(contents=cached[1])
+                            response.raise_for_status()
+                            contents = await response.read()
+                            etag = response.headers.get('ETag')
+                            break
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    if attempt >= self.max_retries:
+                        raise e
+                    delay = self.backoff_factor * 2 ** attempt
+                await asyncio.sleep(min(delay, self.max_wait))
+                attempt += 1
+        except Exception as e:
+            print(f'File does not exist at: {url}')
+            raise e
+        if self.cache is not None and etag is not None:
+            await loop.run_in_executor(None, self.cache.put, cache_key, etag, contents)
+        return decode_contents(contents=contents)
+
+    async def close(self):
+        """
+        This closes the aiohttp session, if one was opened.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class AsyncGitHubClient(AsyncHTTPGitClient):
+    """
+    This is the async version of GitHubClient, which reads the raw files on a public repo hosted on GitHub.
+
+    Args:
+        repository: the name of the repo (e.g. https://github.com/<organization>/<repository>)
+        organization: the user or organization that owns the repo (see repository example)
+        branch: the name of the branch to use
+        base_url: a url that serves raw files in place of raw.githubusercontent.com, such as a local
+            datarade.testing.git_server.GitServer
+        kwargs: the connection options supported by AsyncHTTPGitClient
+    """
+    def __init__(self, repository: str, organization: str, branch: str, base_url: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = f'{base_url or "https://raw.githubusercontent.com"}/{organization}'
+        self.organization = organization
+        self.repository = repository
+        self.branch = branch
+
+    def _file_url(self, file_path: str) -> str:
+        return f'{self.base_url}/{self.repository}/{self.branch}/{file_path}'
+
+    def _cache_key(self, file_path: str) -> str:
+        return f'github/{self.organization}/{self.repository}/{self.branch}/{file_path}'
+
+
+class AsyncAzureReposClient(AsyncHTTPGitClient):
+    """
+    This is the async version of AzureReposClient. Since the azure-devops package is synchronous, this calls the
+    items endpoint of the Azure DevOps REST API directly.
+
+    Args:
+        repository: the name of the repo (e.g. https://dev.azure.com/<organization>/<project>/_git/<repository>)
+        organization: the organization that owns the Azure DevOps instance (see repository example)
+        project: the project within the organization that contains the repo (see repository example)
+        branch: the name of the branch to use
+        username: the username for the repo
+        password: the password for the repo
+        base_url: a url that serves the Azure DevOps REST API in place of https://dev.azure.com, such as a local
+            datarade.testing.git_server.GitServer
+        kwargs: the connection options supported by AsyncHTTPGitClient
+    """
+    def __init__(self, repository: str, organization: str, project: str, branch: str,
+                 username: str, password: str, base_url: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = f'{base_url or "https://dev.azure.com"}/{organization}'
+        self.organization = organization
+        self.project = project
+        self.repository = repository
+        self.branch = branch
+        self.username = username
+        self.password = password
+
+    @property
+    def _auth(self) -> 'Optional[aiohttp.BasicAuth]':
+        import aiohttp
+
+        return aiohttp.BasicAuth(login=self.username or '', password=self.password or '')
+
+    def _file_url(self, file_path: str) -> str:
+        query = urlencode({'path': file_path, 'versionDescriptor.version': self.branch,
+                           'versionDescriptor.versionType': 'branch', 'download': 'true', 'api-version': '6.0'})
+        return f'{self.base_url}/{self.project}/_apis/git/repositories/{self.repository}/items?{query}'
+
+    def _cache_key(self, file_path: str) -> str:
+        # AzureReposClient caches files by blob object id, these are cached by the ETag of the items endpoint instead
+        return f'azure-devops-items/{self.organization}/{self.project}/{self.repository}/{self.branch}/{file_path}'
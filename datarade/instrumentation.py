@@ -0,0 +1,200 @@
+"""
+This module measures how long each stage of reading and writing a dataset takes.
+
+Each stage, like fetching a file from git, creating a table or loading data with bcp, is recorded as a Span with the
+number of bytes and rows it handled where those are known. Finished spans are passed to every listener that has been
+added with add_listener(), as Span objects that can be turned into structured events with to_dict(). Listeners are
+called on the thread that ran the stage, so they should be quick and thread safe. A listener that raises an exception
+never stops a read or a write, it's reported as a RuntimeWarning instead. Work that is handed to a thread pool with
+submit() keeps the span that was open when it was submitted as its parent.
+
+OpenTelemetryExporter is a listener that exports the spans to OpenTelemetry. opentelemetry-api is an optional
+dependency, which is installed with the 'otel' extra.
+"""
+import contextlib
+import contextvars
+import threading
+import time
+import warnings
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+_listeners: 'List[Callable[[Span], None]]' = []
+_listeners_lock = threading.Lock()
+_current_span: 'contextvars.ContextVar[Optional[Span]]' = contextvars.ContextVar('datarade_span', default=None)
+
+
+class Span:
+    """
+    Represents one timed stage of reading or writing a dataset
+
+    Args:
+        name: the name of the stage, like 'git.fetch' or 'bcp.load'
+        attributes: details about the stage, like the dataset name and the number of bytes and rows it handled
+        parent: the name of the span that was open in the same context when this one started
+    """
+
+    def __init__(self, name: str, attributes: 'Dict[str, Any]' = None, parent: str = None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.parent = parent
+        self.start_time_ns = time.time_ns()
+        self.duration: 'Optional[float]' = None
+        self.error: 'Optional[str]' = None
+        self._start = time.perf_counter()
+
+    @property
+    def rows_per_second(self) -> 'Optional[float]':
+        """
+        The number of rows handled per second, if the number of rows is known
+
+        Returns: the throughput in rows per second
+        """
+        return self._per_second(self.attributes.get('rows'))
+
+    @property
+    def bytes_per_second(self) -> 'Optional[float]':
+        """
+        The number of bytes handled per second, if the number of bytes is known
+
+        Returns: the throughput in bytes per second
+        """
+        return self._per_second(self.attributes.get('bytes'))
+
+    def _per_second(self, amount: 'Optional[int]') -> 'Optional[float]':
+        if amount is None or not self.duration:
+            return None
+        return amount / self.duration
+
+    def to_dict(self) -> dict:
+        """
+        Converts the span into a structured event
+
+        Returns: a dictionary with the name, the timing and the derived throughput of the span, and its attributes
+            nested under 'attributes'
+        """
+        return {
+            'name': self.name,
+            'parent': self.parent,
+            'start_time_ns': self.start_time_ns,
+            'duration': self.duration,
+            'error': self.error,
+            'rows_per_second': self.rows_per_second,
+            'bytes_per_second': self.bytes_per_second,
+            'attributes': dict(self.attributes),
+        }
+
+
+def add_listener(listener: 'Callable[[Span], None]'):
+    """
+    Adds a callable that is passed every span as it finishes
+
+    Args:
+        listener: the callable to add
+    """
+    with _listeners_lock:
+        _listeners.append(listener)
+
+
+def remove_listener(listener: 'Callable[[Span], None]'):
+    """
+    Removes a callable that was added with add_listener()
+
+    Args:
+        listener: the callable to remove
+    """
+    with _listeners_lock:
+        _listeners.remove(listener)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes) -> 'Iterator[Span]':
+    """
+    Times the code within the context, and passes the finished span to the listeners
+
+    Attributes that are only known once the stage has run, like the number of rows, can be set on the span's
+    attributes within the context.
+
+    Args:
+        name: the name of the stage
+        attributes: details about the stage
+
+    Returns: the Span for the stage
+    """
+    parent = _current_span.get()
+    current = Span(name=name, attributes=attributes, parent=parent.name if parent is not None else None)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f'{type(e).__name__}: {e}'
+        raise e
+    finally:
+        current.duration = time.perf_counter() - current._start
+        _current_span.reset(token)
+        _emit(current)
+
+
+def _emit(finished_span: 'Span'):
+    """
+    Passes a finished span to every listener, reporting listeners that fail instead of raising their exceptions
+
+    Args:
+        finished_span: the span to pass on
+    """
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for listener in listeners:
+        try:
+            listener(finished_span)
+        except Exception as e:
+            warnings.warn(f'An instrumentation listener failed on span {finished_span.name}: {e!r}', RuntimeWarning)
+
+
+def submit(executor: 'Executor', fn: 'Callable', *args, **kwargs) -> 'Future':
+    """
+    Submits a callable to an executor with a copy of the current context, so that spans it opens keep their parent
+
+    Args:
+        executor: the executor to run the callable on
+        fn: the callable to run
+        args: the positional arguments to pass to the callable
+        kwargs: the keyword arguments to pass to the callable
+
+    Returns: the Future for the callable
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class OpenTelemetryExporter:
+    """
+    A listener that exports each span to OpenTelemetry, with its attributes prefixed with 'datarade.'
+
+    Spans are exported when they finish, so they are children of the OpenTelemetry span that is active on the thread at
+    that point, rather than of each other. The name of the enclosing datarade span is kept in 'datarade.parent'.
+
+    Args:
+        tracer: the OpenTelemetry tracer to create spans with, defaults to the global tracer provider's tracer
+    """
+
+    def __init__(self, tracer: 'Any' = None):
+        if tracer is None:
+            from opentelemetry import trace
+
+            tracer = trace.get_tracer('datarade')
+        self.tracer = tracer
+
+    def __call__(self, finished_span: 'Span'):
+        attributes = {f'datarade.{key}': value for key, value in finished_span.attributes.items()
+                      if isinstance(value, (bool, int, float, str))}
+        if finished_span.parent is not None:
+            attributes['datarade.parent'] = finished_span.parent
+        if finished_span.rows_per_second is not None:
+            attributes['datarade.rows_per_second'] = finished_span.rows_per_second
+        exported_span = self.tracer.start_span(f'datarade.{finished_span.name}', attributes=attributes,
+                                               start_time=finished_span.start_time_ns)
+        if finished_span.error is not None:
+            from opentelemetry.trace import Status, StatusCode
+
+            exported_span.set_status(Status(StatusCode.ERROR, finished_span.error))
+        exported_span.end(end_time=finished_span.start_time_ns + int(finished_span.duration * 1e9))
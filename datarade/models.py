@@ -1,23 +1,143 @@
 """
 This module contains all models for datarade.
 """
-from typing import List
+import datetime
+import functools
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
 from urllib.parse import quote_plus
 
-from bcp import BCP, Connection
-from sqlalchemy import MetaData, create_engine, schema, types, Table
+from datarade import cache, git_client, instrumentation
 
-from datarade import git_client
+# sqlalchemy and bcp are imported where they're used, so that reading datasets from a catalog doesn't import them
+if TYPE_CHECKING:
+    from bcp import BCP
+    from sqlalchemy import MetaData, Table, schema, types
+    from sqlalchemy.engine import Connection as SQLAlchemyConnection, Dialect, Engine
+    from sqlalchemy.sql.elements import TextClause
+
+    from datarade import transfer
 
 
 class DatasetCatalogNotSupportedException(Exception):
     """Occurs when an invalid platform is supplied to a DatasetCatalog instance."""
-    print('Supported platforms include: github, azure-devops')
 
 
 class DriverNotSupportedException(Exception):
     """Occurs when an invalid driver is supplied to a Database instance."""
-    print('Supported drivers include: mssql')
+
+
+class DatasetDependencyException(Exception):
+    """Occurs when the dependencies between datasets are circular, or when a dependency of a dataset failed."""
+
+
+class RowCountMismatchException(Exception):
+    """Occurs when the number of rows written to a DatasetContainer doesn't match the number of rows in the source."""
+
+
+_engines: 'Dict[Tuple[str, int, bool], Engine]' = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(url: str, pool_size: int = 5, pool_pre_ping: bool = True) -> 'Engine':
+    """
+    Returns the sqlalchemy Engine for these connection parameters, creating it the first time it's requested
+
+    Engines are kept for the life of the process so that every DatasetContainer and Database that connects with the
+    same parameters shares one connection pool.
+
+    Args:
+        url: the sqlalchemy database url
+        pool_size: the number of connections to keep open in the connection pool
+        pool_pre_ping: test each connection when it's checked out of the pool, replacing it if it was dropped
+
+    Returns: a sqlalchemy Engine object
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.engine import make_url
+
+    key = (url, pool_size, pool_pre_ping)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            if make_url(url).get_backend_name() == 'sqlite':  # sqlite's default pool doesn't take a size
+                engine = create_engine(url, pool_pre_ping=pool_pre_ping)
+            else:
+                engine = create_engine(url, pool_size=pool_size, pool_pre_ping=pool_pre_ping)
+            _engines[key] = engine
+        return engine
+
+
+def dispose_engines():
+    """
+    Closes the connection pools of every engine in the registry and empties the registry
+    """
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+@functools.lru_cache(maxsize=None)
+def _find_odbc_driver(name: str) -> str:
+    """
+    Finds an installed ODBC driver, the result is remembered since the installed drivers don't change while running
+
+    Args:
+        name: the name of the driver, without its version
+
+    Returns: the first installed version of the driver, in sorted order
+    """
+    import pyodbc
+
+    installed_drivers = pyodbc.drivers()
+    matching_drivers = [driver for driver in installed_drivers if name in driver]
+    try:
+        return sorted(matching_drivers)[0]
+    except IndexError as e:
+        print(f'There is no version of the {name} driver installed.')
+        raise e
+
+
+def _same_type(reflected: 'types.TypeEngine', defined: 'types.TypeEngine', dialect: 'Dialect') -> bool:
+    """
+    Compares the type of a column in a database with the type of a field, as the database would spell them
+
+    The types are compared by their DDL rather than by their class, since reflection often returns a different class
+    for the same column type, like BIT for a Boolean field on SQL Server.
+
+    Args:
+        reflected: the type of the column, as reflected from the database
+        defined: the type of the field
+        dialect: the sqlalchemy dialect of the database
+
+    Returns: True if the column can store the field without being altered
+    """
+    reflected_type = reflected.compile(dialect=dialect)
+    defined_type = defined.compile(dialect=dialect)
+    if reflected_type == defined_type:
+        return True
+    # a type without a length or a precision gets the database's default, which is reflected, like FLOAT(53)
+    return '(' not in defined_type and reflected_type.partition('(')[0] == defined_type
+
+
+def _file_cache(cache_dir: str = None, cache_size: int = None) -> 'Optional[cache.FileCache]':
+    """
+    Creates the persistent file cache for a dataset catalog, if it has a cache directory
+
+    Args:
+        cache_dir: the directory for the file cache
+        cache_size: the maximum size of the file cache in bytes
+
+    Returns: a FileCache, or None if there is no cache directory
+    """
+    if cache_dir is None:
+        return None
+    return cache.FileCache(cache_dir=cache_dir, max_size=cache_size)
 
 
 class Field:
@@ -43,6 +163,8 @@ class Field:
 
         Returns: a sqlalchemy Column object
         """
+        from sqlalchemy import schema, types
+
         type_lookup = {
             'Boolean': types.Boolean,
             'Date': types.Date,
@@ -66,30 +188,58 @@ class Database:
     Represents a database, either as a source for a Dataset, or as a target in a DatasetContainer
 
     Args:
-        driver: the type of database, currently only 'mssql' is supported
-        database_name: the name of the database
-        host: the name of the server, including the instance
+        driver: the type of database, one of: [mssql, sqlite]
+        database_name: the name of the database, or the path to the database file for sqlite
+        host: the name of the server, including the instance, not used for sqlite
         port: the port that the database is listening to on the server
         schema_name: the name of the schema
     """
 
-    def __init__(self, driver: str, database_name: str, host: str, port: int = None, schema_name: str = None):
+    def __init__(self, driver: str, database_name: str, host: str = None, port: int = None, schema_name: str = None):
         self.driver = driver
         self.database_name = database_name
         self.host = host
         self.port = port
         self.schema_name = schema_name
 
-    def sqlalchemy_metadata(self, username: str = None, password: str = None) -> 'MetaData':
+    def sqlalchemy_metadata(self, username: str = None, password: str = None, pool_size: int = 5,
+                            pool_pre_ping: bool = True) -> 'MetaData':
         """
         Takes credentials and returns a sqlalchemy MetaData object for this database
 
         Args:
             username: the username for the database
             password: the password for the database
+            pool_size: the number of connections to keep open in the engine's connection pool
+            pool_pre_ping: test each connection when it's checked out of the pool, replacing it if it was dropped
 
         Returns: a sqlalchemy MetaData object
         """
+        from sqlalchemy import MetaData
+
+        engine = self.sqlalchemy_engine(username=username, password=password, pool_size=pool_size,
+                                        pool_pre_ping=pool_pre_ping)
+        if self.schema_name is not None:  # sqlalchemy treats schema=None and not returning schema differently
+            return MetaData(bind=engine, schema=self.schema_name)
+        else:
+            return MetaData(bind=engine)
+
+    def sqlalchemy_engine(self, username: str = None, password: str = None, pool_size: int = 5,
+                          pool_pre_ping: bool = True) -> 'Engine':
+        """
+        Takes credentials and returns the sqlalchemy Engine for this database from the process-wide engine registry
+
+        Args:
+            username: the username for the database
+            password: the password for the database
+            pool_size: the number of connections to keep open in the engine's connection pool
+            pool_pre_ping: test each connection when it's checked out of the pool, replacing it if it was dropped
+
+        Returns: a sqlalchemy Engine object
+        """
+        if self.driver == 'sqlite':
+            return get_engine(url=f'{self._sqlalchemy_driver_name}:///{self.database_name}', pool_size=pool_size,
+                              pool_pre_ping=pool_pre_ping)
         driver = '{' + self._odbc_driver_name + '}'
         if self.port:
             server = f'{self.host},{self.port}'
@@ -102,14 +252,11 @@ class Database:
             auth = 'Trusted_Connection=Yes'
         url = base_url + auth
         try:
-            engine = create_engine(f'{self._sqlalchemy_driver_name}:///?odbc_connect={quote_plus(url)}')
+            return get_engine(url=f'{self._sqlalchemy_driver_name}:///?odbc_connect={quote_plus(url)}',
+                              pool_size=pool_size, pool_pre_ping=pool_pre_ping)
         except Exception as e:
             print(f'Unable to create an engine using these parameters: {quote_plus(url)}')
             raise e
-        if self.schema_name is not None:  # sqlalchemy treats schema=None and not returning schema differently
-            return MetaData(bind=engine, schema=self.schema_name)
-        else:
-            return MetaData(bind=engine)
 
     def bcp(self, username: str = None, password: str = None) -> 'BCP':
         """
@@ -121,6 +268,8 @@ class Database:
 
         Returns: a BCP object
         """
+        from bcp import BCP, Connection
+
         conn = Connection(driver=self.driver,
                           host=self.host,
                           port=self.port,
@@ -151,8 +300,11 @@ class Database:
         """
         if self.driver == 'mssql':
             return 'mssql+pyodbc'
+        elif self.driver == 'sqlite':
+            return 'sqlite+pysqlite'
         else:
             print(f'This driver is not supported: {self.driver}')
+            print('Supported drivers include: mssql, sqlite')
             raise DriverNotSupportedException
 
     @property
@@ -163,20 +315,10 @@ class Database:
         Returns: the latest SQL Server Native Client for MS SQL Server databases
         """
         if self.driver == 'mssql':
-            import pyodbc
-
-            installed_drivers = pyodbc.drivers()
-            sql_server_native_clients = [client
-                                         for client in installed_drivers
-                                         if 'SQL Server Native Client' in client]
-            try:
-                latest_client = sorted(sql_server_native_clients)[0]
-            except IndexError as e:
-                print('There is no version of the SQL Server Native Client driver installed.')
-                raise e
-            return latest_client
+            return _find_odbc_driver(name='SQL Server Native Client')
         else:
             print(f'This driver is not supported: {self.driver}')
+            print('Supported drivers include: mssql, sqlite')
             raise DriverNotSupportedException
 
 
@@ -200,6 +342,71 @@ class User:
         self.username = username
 
 
+class Partition:
+    """
+    Represents how to split a dataset into parts that can be extracted and loaded in parallel
+
+    Either a key column and a number of ranges, or a list of explicit predicates, should be provided. Together, the
+    predicates should select every row of the dataset exactly once.
+
+    Args:
+        column: an integer column of the dataset to split into ranges of equal width
+        count: the number of ranges to split the key column into
+        predicates: sql predicates on the columns of the dataset, each one selecting one part of the dataset
+        parallelism: the maximum number of parts to extract and load at the same time, defaults to all of them
+    """
+
+    def __init__(self, column: str = None, count: int = None, predicates: 'List[str]' = None,
+                 parallelism: int = None):
+        self.column = column
+        self.count = count
+        self.predicates = predicates
+        self.parallelism = parallelism
+
+    def range_predicates(self, minimum: int, maximum: int) -> 'List[str]':
+        """
+        Splits the values of the key column into ranges of equal width
+
+        Rows where the key column is null are included in the first range. The last range has no upper bound.
+
+        Args:
+            minimum: the smallest value of the key column
+            maximum: the largest value of the key column
+
+        Returns: a list of sql predicates, one for each range
+        """
+        if not isinstance(minimum, int) or not isinstance(maximum, int):
+            print(f'The partition column must be an integer column, use predicates instead: {self.column}')
+            raise TypeError(f'Partition column {self.column} is not an integer column')
+        count = max(min(self.count, maximum - minimum + 1), 1)
+        bounds = [minimum + (maximum - minimum + 1) * i // count for i in range(count)]
+        predicates = [f'{self.column} >= {lower} and {self.column} < {upper}'
+                      for lower, upper in zip(bounds, bounds[1:])]
+        predicates.append(f'{self.column} >= {bounds[-1]}')
+        predicates[0] = f'({predicates[0]}) or {self.column} is null'
+        return predicates
+
+
+class Incremental:
+    """
+    Represents how to load only the rows of a dataset that are new or changed since the last write
+
+    The watermark column should only ever increase for new or changed rows, like a modified date or an identity column.
+    With the append strategy, rows past the highest watermark in the dataset container are added to it. With the merge
+    strategy, rows at or past the highest watermark replace any rows in the dataset container that have the same key.
+
+    Args:
+        watermark: the column of the dataset that marks how recently each row was added or changed
+        strategy: how to add the new rows to the dataset container, one of: [append, merge]
+        key: the columns that identify a row, required for the merge strategy
+    """
+
+    def __init__(self, watermark: str, strategy: str = 'append', key: 'List[str]' = None):
+        self.watermark = watermark
+        self.strategy = strategy
+        self.key = key or []
+
+
 class Dataset:
     """
     Represents a dataset as metadata
@@ -212,11 +419,18 @@ class Dataset:
             what the dataset is or how it's populated
         database: a Database object that contains the data for the dataset
         user: a User object that can be used to connect to the database to access the data
+        depends_on: the names of other datasets that need to be written before this one
+        partition: a Partition object that describes how to split the dataset for a parallel write
+        incremental: an Incremental object that describes how to load only new rows, the dataset is fully reloaded
+            on every write without one
+        change_probe: a cheap query on the source database whose results change whenever the dataset's data changes,
+            like the highest modified date or an aggregate checksum of the source tables
     """
 
     def __init__(self, name: str, definition: str, actual: str, expected: str, fields: 'List[Field]',
                  description: str = None,
-                 database: 'Database' = None, user: 'User' = None):
+                 database: 'Database' = None, user: 'User' = None, depends_on: 'List[str]' = None,
+                 partition: 'Partition' = None, incremental: 'Incremental' = None, change_probe: str = None):
         self.name = name
         self.definition = definition
         self.actual = actual
@@ -225,6 +439,94 @@ class Dataset:
         self.description = description
         self.database = database
         self.user = user
+        self.depends_on = depends_on or []
+        self.partition = partition
+        self.incremental = incremental
+        self.change_probe = change_probe
+
+    def probe_source(self, username: str = None, password: str = None) -> 'Optional[List[tuple]]':
+        """
+        Runs the change probe on the source database
+
+        Args:
+            username: a user with select/execute permissions on the source database objects
+            password: the password for the user
+
+        Returns: the rows returned by the change probe, or None if the dataset does not have one
+        """
+        from sqlalchemy import text
+
+        if self.change_probe is None:
+            return None
+        engine = self.database.sqlalchemy_engine(username=username, password=password)
+        with engine.connect() as connection:
+            return [tuple(row) for row in connection.execute(text(self.change_probe))]
+
+    def fingerprint(self, probe_result: 'Optional[List[tuple]]' = None) -> str:
+        """
+        Summarizes everything that determines the data written for this dataset
+
+        Args:
+            probe_result: the rows returned by the change probe
+
+        Returns: a sha256 hex digest of the definition, the fields and the result of the change probe
+        """
+        contents = {
+            'definition': self.definition,
+            'fields': [[field.name, field.type] for field in self.fields],
+            'probe': probe_result,
+        }
+        return hashlib.sha256(json.dumps(contents, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class CatalogIndex:
+    """
+    Describes which files exist for each dataset in a DatasetCatalog, along with their git blob ids
+
+    Args:
+        files: a dictionary of relative file paths within the repo to git blob ids, typically from a single listing of
+            the catalog folder
+    """
+
+    def __init__(self, files: 'Dict[str, str]'):
+        self.datasets: 'Dict[str, Dict[str, str]]' = {}
+        for file_path, blob_id in files.items():
+            path_parts = file_path.split('/')
+            if len(path_parts) == 3 and path_parts[0] == 'catalog':
+                _, dataset_name, file_name = path_parts
+                self.datasets.setdefault(dataset_name, {})[file_name] = blob_id
+
+    def list_datasets(self) -> 'List[str]':
+        """
+        Lists the datasets in the catalog, which are the directories that contain a config.yaml file
+
+        Returns: a sorted list of dataset names
+        """
+        return sorted(dataset_name for dataset_name, files in self.datasets.items() if 'config.yaml' in files)
+
+    def has_file(self, dataset_name: str, file_name: str) -> bool:
+        """
+        Checks whether a file exists for a dataset
+
+        Args:
+            dataset_name: the name of the dataset
+            file_name: the name of the file within the directory for the dataset
+
+        Returns: True if the file exists
+        """
+        return file_name in self.datasets.get(dataset_name, {})
+
+    def blob_id(self, dataset_name: str, file_name: str) -> 'Optional[str]':
+        """
+        Looks up the git blob id of a file for a dataset
+
+        Args:
+            dataset_name: the name of the dataset
+            file_name: the name of the file within the directory for the dataset
+
+        Returns: the blob id, or None if the file does not exist
+        """
+        return self.datasets.get(dataset_name, {}).get(file_name)
 
 
 class DatasetCatalog:
@@ -234,46 +536,295 @@ class DatasetCatalog:
     This can be thought of as a place to host datasets for data pipelines. But it can also be thought of as a place to
     advertise datasets to a broad audience since it only contains metadata and not the underlying data.
 
+    A local repository is read through a git process, which is stopped when the catalog is closed or garbage
+    collected. The catalog can be used as a context manager to close it on exit.
+
     Args:
-        repository: the name of the repository
+        repository: the name of the repository, or the path to the repository for a local repository
         organization: the name of the organization (or user for GitHub) that owns the repository
-        platform: that platform that hosts the repo ['github', 'azure-devops']
+        platform: that platform that hosts the repo ['github', 'azure-devops', 'local']
         project: the name of the project that contains the repository, only used for Azure Repos
-        branch: the branch to use in the repository
+        branch: the branch to use in the repository, a local repository reads its working tree when this is None
         username: the username with read access to the repository, only used for Azure Repos
         password: the password with read access to the repository, only used for Azure Repos, can also be the one-time
             git credentials password that bypasses MFA
+        cache_dir: the directory for a persistent file cache, files are only cached when this is provided
+        cache_size: the maximum size of the file cache in bytes, defaults to 100 MB
+        pool_size: the maximum number of connections to keep alive to the platform, only used for GitHub
+        archive: download the whole catalog folder in one request the first time a file is needed, and serve every
+            file in the catalog from memory after that
+        shared: keep validated datasets in memory so that the catalog can be shared by many threads, concurrent
+            requests for the same dataset wait on a single load instead of each reading the files
+        indexed: list the catalog folder once, the first time a dataset is read, and never request files that the
+            listing shows don't exist
+        base_url: a url that stands in for the platform's endpoints, such as a local
+            datarade.testing.git_server.GitServer, only used for GitHub and Azure Repos
     """
 
     def __init__(self, repository: str, organization: str, platform: str, project: str = None, branch: str = 'master',
-                 username: str = None, password: str = None):
+                 username: str = None, password: str = None, cache_dir: str = None, cache_size: int = None,
+                 pool_size: int = 10, archive: bool = False, shared: bool = False, indexed: bool = False,
+                 base_url: str = None):
         self.repository = repository
         self.organization = organization
         self.project = project
         self.branch = branch
         self.username = username
         self.password = password
+        self.pool_size = pool_size
+        self.base_url = base_url
+        self.shared = shared
+        self.indexed = indexed
+        self._index: 'Optional[CatalogIndex]' = None
+        self._datasets: 'Dict[str, Dataset]' = {}
+        self._loading: 'Dict[str, Future]' = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self.cache = _file_cache(cache_dir=cache_dir, cache_size=cache_size)
         self.git = self._get_git_client(platform=platform)
+        if archive:
+            self.git = git_client.ArchiveClient(client=self.git, folder_path='catalog')
 
     def _get_git_client(self, platform: str) -> 'git_client.AbstractGitClient':
         """
         Configures the appropriate git client given the platform
 
         Args:
-            platform: the source control platform, one of 'github' or 'azure-devops'
+            platform: the source control platform, one of 'github', 'azure-devops' or 'local'
 
         Returns: the appropriate git client
         """
         if platform == 'github':
             return git_client.GitHubClient(repository=self.repository, organization=self.organization,
-                                           branch=self.branch)
+                                           branch=self.branch, cache=self.cache, pool_size=self.pool_size,
+                                           base_url=self.base_url)
         elif platform == 'azure-devops':
             return git_client.AzureReposClient(repository=self.repository, organization=self.organization,
                                                project=self.project, branch=self.branch,
-                                               username=self.username, password=self.password)
+                                               username=self.username, password=self.password, cache=self.cache,
+                                               base_url=self.base_url)
+        elif platform == 'local':
+            return git_client.LocalGitClient(repository=self.repository, branch=self.branch)
         else:
+            print(f'This platform is not supported: {platform}')
+            print('Supported platforms include: github, azure-devops, local')
             raise DatasetCatalogNotSupportedException
 
+    @property
+    def index(self) -> 'CatalogIndex':
+        """
+        Lists the catalog folder the first time the index is needed
+
+        Returns: a CatalogIndex of the files in the catalog
+        """
+        with self._index_lock:
+            if self._index is None:
+                self._index = CatalogIndex(files=self.git.list_files(folder_path='catalog'))
+            return self._index
+
+    def list_datasets(self) -> 'List[str]':
+        """
+        Lists the datasets in the catalog
+
+        Returns: a sorted list of dataset names
+        """
+        return self.index.list_datasets()
+
+    def get_or_load(self, dataset_name: str, load: 'Callable[[], Dataset]') -> 'Dataset':
+        """
+        Returns the dataset from memory for a shared catalog, otherwise loads it
+
+        For a shared catalog, only the first thread to ask for a dataset that is not in memory calls load(). Any other
+        thread that asks for the same dataset in the meantime waits for that load to finish and gets its result, or its
+        exception. Failed loads are not kept, so the next request tries again. Neither are loads that were running when
+        the catalog was invalidated, since they may have read the files from before the change.
+
+        Args:
+            dataset_name: the name of the dataset
+            load: a callable that reads and validates the dataset from the catalog
+
+        Returns: a Dataset object
+        """
+        if not self.shared:
+            return load()
+        with self._lock:
+            dataset = self._datasets.get(dataset_name)
+            if dataset is not None:
+                return dataset
+            loading = self._loading.get(dataset_name)
+            is_loader = loading is None
+            if is_loader:
+                loading = Future()
+                self._loading[dataset_name] = loading
+                generation = self._generation
+        if not is_loader:
+            return loading.result()
+        try:
+            dataset = load()
+        except Exception as e:
+            with self._lock:
+                if self._loading.get(dataset_name) is loading:
+                    del self._loading[dataset_name]
+            loading.set_exception(e)
+            raise e
+        with self._lock:
+            if self._generation == generation:
+                self._datasets[dataset_name] = dataset
+            if self._loading.get(dataset_name) is loading:
+                del self._loading[dataset_name]
+        loading.set_result(dataset)
+        return dataset
+
+    @property
+    def generation(self) -> int:
+        """
+        Counts how many times the catalog has been invalidated, so that a load can tell whether it may be stale
+
+        Returns: the number of calls to invalidate()
+        """
+        with self._lock:
+            return self._generation
+
+    def get_loaded_dataset(self, dataset_name: str) -> 'Optional[Dataset]':
+        """
+        Returns the dataset if a shared catalog holds it in memory
+
+        Args:
+            dataset_name: the name of the dataset
+
+        Returns: a Dataset object, or None if the dataset has not been loaded
+        """
+        with self._lock:
+            return self._datasets.get(dataset_name)
+
+    def add_loaded_dataset(self, dataset_name: str, dataset: 'Dataset', generation: int = None):
+        """
+        Keeps a dataset that was loaded outside of get_or_load() in memory, if this is a shared catalog
+
+        Args:
+            dataset_name: the name of the dataset
+            dataset: the validated dataset
+            generation: the catalog's generation from before the dataset was read, the dataset is not kept if the
+                catalog has been invalidated since then
+        """
+        if self.shared:
+            with self._lock:
+                if generation is None or generation == self._generation:
+                    self._datasets[dataset_name] = dataset
+
+    def invalidate(self, dataset_name: str = None):
+        """
+        Discards datasets held in memory so that they are read from the catalog again, along with the catalog index
+        and the catalog archive when the catalog is in archive mode
+
+        Loads that are already running still return their dataset to the threads waiting on them, but it isn't kept, and
+        later requests start a new load.
+
+        Args:
+            dataset_name: the name of the dataset to discard, all datasets are discarded if this is not provided
+        """
+        with self._lock:
+            self._generation += 1
+            if dataset_name is None:
+                self._datasets.clear()
+                self._loading.clear()
+            else:
+                self._datasets.pop(dataset_name, None)
+                self._loading.pop(dataset_name, None)
+        if dataset_name is None:
+            with self._index_lock:
+                self._index = None
+        if dataset_name is None and isinstance(self.git, git_client.ArchiveClient):
+            self.git.refresh()
+
+    def close(self):
+        """
+        Closes the git client, which stops the git process of a local repository
+        """
+        self.git.close()
+
+    def __enter__(self) -> 'DatasetCatalog':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AsyncDatasetCatalog:
+    """
+    Represents a git repo that hosts datasets in a predetermined structure, read with an asyncio git client
+
+    This takes the same connection arguments as DatasetCatalog, but it's not a DatasetCatalog: the async git clients
+    only get files, so the catalog can't be listed, archived, indexed or shared between threads. The pool size applies
+    to both platforms. It's closed with an awaitable close(), so it's used as an async context manager rather than
+    with a plain 'with' statement.
+
+    Args:
+        repository: the name of the repository
+        organization: the name of the organization (or user for GitHub) that owns the repository
+        platform: that platform that hosts the repo ['github', 'azure-devops']
+        project: the name of the project that contains the repository, only used for Azure Repos
+        branch: the branch to use in the repository
+        username: the username with read access to the repository, only used for Azure Repos
+        password: the password with read access to the repository, only used for Azure Repos
+        cache_dir: the directory for a persistent file cache, files are only cached when this is provided
+        cache_size: the maximum size of the file cache in bytes, defaults to 100 MB
+        pool_size: the maximum number of connections to keep alive to the platform
+        base_url: a url that stands in for the platform's endpoints, such as a local
+            datarade.testing.git_server.GitServer
+    """
+
+    def __init__(self, repository: str, organization: str, platform: str, project: str = None, branch: str = 'master',
+                 username: str = None, password: str = None, cache_dir: str = None, cache_size: int = None,
+                 pool_size: int = 10, base_url: str = None):
+        self.repository = repository
+        self.organization = organization
+        self.project = project
+        self.branch = branch
+        self.username = username
+        self.password = password
+        self.pool_size = pool_size
+        self.base_url = base_url
+        self.cache = _file_cache(cache_dir=cache_dir, cache_size=cache_size)
+        self.git = self._get_git_client(platform=platform)
+
+    def _get_git_client(self, platform: str) -> 'git_client.AsyncGitClient':
+        """
+        Configures the appropriate async git client given the platform
+
+        Args:
+            platform: the source control platform, one of 'github' or 'azure-devops'
+
+        Returns: the appropriate async git client
+        """
+        if platform == 'github':
+            return git_client.AsyncGitHubClient(repository=self.repository, organization=self.organization,
+                                                branch=self.branch, cache=self.cache, pool_size=self.pool_size,
+                                                base_url=self.base_url)
+        elif platform == 'azure-devops':
+            return git_client.AsyncAzureReposClient(repository=self.repository, organization=self.organization,
+                                                    project=self.project, branch=self.branch,
+                                                    username=self.username, password=self.password,
+                                                    cache=self.cache, pool_size=self.pool_size,
+                                                    base_url=self.base_url)
+        else:
+            print(f'This platform is not supported: {platform}')
+            print('Supported platforms include: github, azure-devops')
+            raise DatasetCatalogNotSupportedException
+
+    async def close(self):
+        """
+        Closes the connections held by the git client
+        """
+        await self.git.close()
+
+    async def __aenter__(self) -> 'AsyncDatasetCatalog':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
 
 class DatasetContainer:
     """
@@ -283,21 +834,295 @@ class DatasetContainer:
         database: the database to write datasets to
         username: a user with create table and insert permissions on the schema
         password: the password for the user
+        pool_size: the number of connections to keep open to the database, shared with every other container that
+            connects with the same parameters
+        pool_pre_ping: test each connection when it's checked out of the pool, replacing it if it was dropped
+        transfer_engine: the transfer engine that loads data into the container, defaults to picking one for each
+            source database
+        spool_dir: the directory to write intermediate data files to, defaults to the transfer engine's directory
+        compression: compress intermediate data files as they are written, one of: [gzip, zstd], the bcp engine only
+            compresses on POSIX operating systems
     """
 
-    def __init__(self, database: 'Database', username: str = None, password: str = None):
+    fingerprint_table_name = 'datarade_fingerprints'
+    _fingerprint_table_lock = threading.Lock()
+
+    def __init__(self, database: 'Database', username: str = None, password: str = None, pool_size: int = 5,
+                 pool_pre_ping: bool = True, transfer_engine: 'transfer.AbstractTransferEngine' = None,
+                 spool_dir: str = None, compression: str = None):
+        if compression not in (None, 'gzip', 'zstd'):
+            print(f'This compression is not supported: {compression}')
+            raise ValueError(f'Unsupported compression: {compression}')
         self.database = database
-        self.metadata = self.database.sqlalchemy_metadata(username=username, password=password)
-        self.bcp = self.database.bcp(username=username, password=password)
+        self.transfer_engine = transfer_engine
+        self.spool_dir = Path(spool_dir) if spool_dir else None
+        self.compression = compression
+        self.metadata = self.database.sqlalchemy_metadata(username=username, password=password, pool_size=pool_size,
+                                                          pool_pre_ping=pool_pre_ping)
+        # bcp only supports MS SQL Server, other containers are loaded through sqlalchemy
+        self.bcp = self.database.bcp(username=username, password=password) if database.driver == 'mssql' else None
+
+    def create_table(self, dataset: 'Dataset', table_name: str = None, replace: bool = True):
+        """
+        Makes sure a table in the DatasetContainer has the correct attributes to store the data
+
+        An existing table is compared with the dataset's fields instead of being dropped and created again, which keeps
+        its statistics and the views that depend on it. When the columns match, the table is emptied. When they don't,
+        new columns are added and old columns are dropped, or the types of columns are changed on SQL Server. The table
+        is only dropped and created again when its columns need to be reordered, since bcp loads columns by position.
+
+        Args:
+            dataset: the dataset to use as a blueprint for the table
+            table_name: the one part name of the table, defaults to the name of the dataset
+            replace: empty the table if it already exists, otherwise the existing rows are kept
+        """
+        with instrumentation.span('container.ddl', table=table_name or dataset.name), \
+                self.metadata.bind.begin() as connection:
+            self._reconcile_table(connection=connection, dataset=dataset, table_name=table_name, replace=replace)
+
+    def create_tables(self, datasets: 'List[Dataset]', table_names: 'List[str]' = None, replace: bool = True):
+        """
+        Makes sure the tables for several datasets have the correct attributes to store the data, in one transaction
+
+        The tables are compared with the datasets' fields in the same way as create_table(), and every CREATE and ALTER
+        statement is run in the same transaction, so the DDL for many datasets costs one round of commits.
+
+        Args:
+            datasets: the datasets to use as blueprints for the tables
+            table_names: the one part names of the tables, in the same order as the datasets, defaults to the names of
+                the datasets
+            replace: empty the tables that already exist, otherwise the existing rows are kept
+        """
+        table_names = table_names or [dataset.name for dataset in datasets]
+        with instrumentation.span('container.ddl', tables=len(datasets)), self.metadata.bind.begin() as connection:
+            for dataset, table_name in zip(datasets, table_names):
+                self._reconcile_table(connection=connection, dataset=dataset, table_name=table_name, replace=replace)
+
+    def get_watermark(self, table_name: str, column_name: str) -> 'Any':
+        """
+        Finds the highest value of a column in a table in the DatasetContainer
+
+        Args:
+            table_name: the one part name of the table
+            column_name: the name of the column
+
+        Returns: the highest value of the column, or None if the table is empty
+        """
+        from sqlalchemy import Table, column, func, select
+
+        table = Table(table_name, self.metadata, extend_existing=True)
+        return self.metadata.bind.execute(select([func.max(column(column_name))]).select_from(table)).scalar()
+
+    def merge_table(self, dataset: 'Dataset', source_table_name: str):
+        """
+        Replaces the rows of a dataset's table that have the same key as the rows in another table, then drops the
+        other table
+
+        The rows are deleted and inserted in one transaction, so readers never see a partial merge.
+
+        Args:
+            dataset: the dataset whose table should be merged into, with an Incremental object that has a key
+            source_table_name: the one part name of the table with the new rows
+        """
+        from sqlalchemy import and_, exists, select
+
+        target = self._table(dataset=dataset)
+        source = self._table(dataset=dataset, table_name=source_table_name)
+        matches = exists().where(and_(*[target.c[key] == source.c[key] for key in dataset.incremental.key]))
+        column_names = [field.name for field in dataset.fields]
+        with instrumentation.span('container.merge', table=dataset.name), self.metadata.bind.begin() as connection:
+            connection.execute(target.delete().where(matches))
+            connection.execute(target.insert().from_select(column_names, select([source.c[name]
+                                                                                  for name in column_names])))
+        source.drop()
+        self.metadata.remove(source)
+
+    def swap_table(self, table_name: str, staging_table_name: str):
+        """
+        Replaces a table with a staging table by renaming both in one transaction, then drops the old table
+
+        Only metadata changes while the tables are swapped, so readers of the table see the old data until the
+        transaction commits, and the new data straight afterwards.
+
+        Args:
+            table_name: the one part name of the table to replace, which doesn't need to exist yet
+            staging_table_name: the one part name of the table with the new data
+        """
+        from sqlalchemy import Table
+
+        old_table_name = f'{table_name}_old'
+        old_table = Table(old_table_name, self.metadata, extend_existing=True)
+        old_table.drop(checkfirst=True)
+        has_live_table = self.has_table(table_name=table_name)
+        with instrumentation.span('container.swap', table=table_name), self.metadata.bind.begin() as connection:
+            if has_live_table:
+                connection.execute(self._rename_table(table_name=table_name, new_table_name=old_table_name))
+            connection.execute(self._rename_table(table_name=staging_table_name, new_table_name=table_name))
+        if has_live_table:
+            old_table.drop()
+        self.metadata.remove(old_table)
+        staging_table = Table(staging_table_name, self.metadata, extend_existing=True)
+        self.metadata.remove(staging_table)
+
+    def _rename_table(self, table_name: str, new_table_name: str) -> 'TextClause':
+        """
+        Builds a statement that renames a table within its schema
+
+        Args:
+            table_name: the one part name of the table
+            new_table_name: the new one part name of the table
+
+        Returns: a sqlalchemy TextClause object
+        """
+        from sqlalchemy import MetaData, Table, text
+
+        dialect = self.metadata.bind.dialect
+        quoted_table_name = dialect.identifier_preparer.format_table(Table(table_name, MetaData(),
+                                                                           schema=self.metadata.schema))
+        if dialect.name == 'mssql':
+            return text('exec sp_rename :table_name, :new_table_name').bindparams(table_name=quoted_table_name,
+                                                                                  new_table_name=new_table_name)
+        return text(f'alter table {quoted_table_name} rename to {dialect.identifier_preparer.quote(new_table_name)}')
+
+    def has_table(self, table_name: str) -> bool:
+        """
+        Checks whether a table exists in the DatasetContainer
+
+        Args:
+            table_name: the one part name of the table
 
-    def create_table(self, dataset: 'Dataset'):
+        Returns: True if the table exists
         """
-        Creates a table in the DatasetContainer with the correct attributes to store the data
+        from sqlalchemy import inspect
+
+        return inspect(self.metadata.bind).has_table(table_name, schema=self.metadata.schema)
+
+    def get_fingerprint(self, dataset_name: str) -> 'Optional[str]':
+        """
+        Looks up the fingerprint that was stored with the last successful write of a dataset
+
+        Args:
+            dataset_name: the name of the dataset
+
+        Returns: the fingerprint, or None if there isn't one
+        """
+        from sqlalchemy import select
+
+        table = self._fingerprint_table()
+        query = select([table.c.fingerprint]).where(table.c.dataset_name == dataset_name)
+        return self.metadata.bind.execute(query).scalar()
+
+    def set_fingerprint(self, dataset_name: str, fingerprint: 'Optional[str]'):
+        """
+        Stores the fingerprint of a dataset, replacing any earlier fingerprint
 
         Args:
+            dataset_name: the name of the dataset
+            fingerprint: the fingerprint, or None to remove the dataset's fingerprint
+        """
+        table = self._fingerprint_table()
+        with self.metadata.bind.begin() as connection:
+            connection.execute(table.delete().where(table.c.dataset_name == dataset_name))
+            if fingerprint is not None:
+                connection.execute(table.insert().values(dataset_name=dataset_name, fingerprint=fingerprint,
+                                                         written_at=datetime.datetime.utcnow()))
+
+    def _fingerprint_table(self) -> 'Table':
+        """
+        Defines the table that stores the fingerprint of each dataset, creating it if it doesn't exist yet
+
+        Returns: a sqlalchemy Table object
+        """
+        from sqlalchemy import Table, schema, types
+
+        with self._fingerprint_table_lock:
+            table = Table(self.fingerprint_table_name, self.metadata,
+                          schema.Column('dataset_name', types.String(256), primary_key=True),
+                          schema.Column('fingerprint', types.String(64), nullable=False),
+                          schema.Column('written_at', types.DateTime, nullable=False),
+                          extend_existing=True)
+            table.create(checkfirst=True)
+        return table
+
+    def _reconcile_table(self, connection: 'SQLAlchemyConnection', dataset: 'Dataset', table_name: str = None,
+                         replace: bool = True):
+        """
+        Compares a table with the dataset's fields and runs the DDL needed to make them match
+
+        Args:
+            connection: the sqlalchemy Connection to run the DDL on
             dataset: the dataset to use as a blueprint for the table
+            table_name: the one part name of the table, defaults to the name of the dataset
+            replace: empty the table if it already exists, otherwise the existing rows are kept
+        """
+        from sqlalchemy import inspect, text
+
+        table = self._table(dataset=dataset, table_name=table_name)
+        inspector = inspect(connection)
+        if not inspector.has_table(table.name, schema=table.schema):
+            table.create(connection)
+            return
+        existing_columns = {column['name']: column['type']
+                            for column in inspector.get_columns(table.name, schema=table.schema)}
+        kept_column_names = [name for name in existing_columns if name in table.c]
+        if kept_column_names != [column.name for column in table.columns][:len(kept_column_names)]:
+            table.drop(connection)
+            table.create(connection)
+            return
+        dialect = connection.dialect
+        quoted_table_name = dialect.identifier_preparer.format_table(table)
+        changed_columns = [table.c[name] for name in kept_column_names
+                           if not _same_type(reflected=existing_columns[name], defined=table.c[name].type,
+                                             dialect=dialect)]
+        if changed_columns and dialect.name != 'mssql':
+            table.drop(connection)
+            table.create(connection)
+            return
+        for name in existing_columns:
+            if name not in table.c:
+                connection.execute(text(f'alter table {quoted_table_name} '
+                                        f'drop column {dialect.identifier_preparer.quote(name)}'))
+        for changed_column in changed_columns:
+            connection.execute(text(f'alter table {quoted_table_name} alter column '
+                                    f'{dialect.identifier_preparer.format_column(changed_column)} '
+                                    f'{changed_column.type.compile(dialect=dialect)}'))
+        for new_column in list(table.columns)[len(kept_column_names):]:
+            connection.execute(text(f'alter table {quoted_table_name} add '
+                                    f'{dialect.identifier_preparer.format_column(new_column)} '
+                                    f'{new_column.type.compile(dialect=dialect)}'))
+        if replace:
+            if dialect.name == 'mssql':
+                connection.execute(text(f'truncate table {quoted_table_name}'))
+            else:
+                connection.execute(table.delete())
+
+    def _table(self, dataset: 'Dataset', table_name: str = None) -> 'Table':
+        """
+        Defines a table in the DatasetContainer's metadata with the columns of a dataset
+
+        Args:
+            dataset: the dataset to use as a blueprint for the table
+            table_name: the one part name of the table, defaults to the name of the dataset
+
+        Returns: a sqlalchemy Table object
         """
+        from sqlalchemy import Table
+
         field_args = [field.sqlalchemy_column for field in dataset.fields]
-        table = Table(dataset.name, self.metadata, extend_existing=True, *field_args)
-        table.drop(checkfirst=True)
-        table.create()
+        # an existing definition would keep its old column order, so it's replaced instead of extended
+        self.metadata.remove(Table(table_name or dataset.name, self.metadata, extend_existing=True))
+        return Table(table_name or dataset.name, self.metadata, *field_args)
+
+    def count_rows(self, table_name: str) -> int:
+        """
+        Counts the rows in a table in the DatasetContainer
+
+        Args:
+            table_name: the one part name of the table
+
+        Returns: the number of rows in the table
+        """
+        from sqlalchemy import Table, func, select
+
+        table = Table(table_name, self.metadata, extend_existing=True)
+        return self.metadata.bind.execute(select([func.count()]).select_from(table)).scalar()
@@ -0,0 +1,160 @@
+"""
+This module runs many dataset writes at once while respecting the dependencies between the datasets.
+
+The datasets form a directed acyclic graph through their depends_on lists. A dataset is started once every dataset it
+depends on has been written, as long as its source database and its dataset container both have a free slot. Among the
+datasets that are ready, the one with the longest chain of work still ahead of it is started first, so that long
+chains of dependent datasets don't end up waiting on each other at the end of the run.
+"""
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Hashable, List, Tuple
+
+from datarade import instrumentation, models
+
+
+def schedule(datasets: 'List[models.Dataset]', write: 'Callable[[models.Dataset], None]',
+             source_key: 'Callable[[models.Dataset], Hashable]', container_key: 'Callable[[models.Dataset], Hashable]',
+             max_workers: int = 8, max_per_source: int = 2, max_per_container: int = 4,
+             durations: 'Dict[str, float]' = None, prepare: 'Callable[[List[models.Dataset]], None]' = None
+             ) -> 'Tuple[Dict[str, float], Dict[str, Exception]]':
+    """
+    Writes the datasets concurrently, in dependency order
+
+    Dependencies on datasets that are not in the list are treated as already written. When a dataset fails, every
+    dataset that depends on it, directly or indirectly, is skipped. Dataset names must be unique, and every limit must
+    be at least 1.
+
+    Args:
+        datasets: the datasets to write
+        write: a callable that writes one dataset
+        source_key: a callable that identifies the source database of a dataset
+        container_key: a callable that identifies the dataset container that a dataset is written to
+        max_workers: the maximum number of datasets to write at the same time
+        max_per_source: the maximum number of datasets to read from the same source database at the same time
+        max_per_container: the maximum number of datasets to write to the same dataset container at the same time
+        durations: the expected number of seconds each dataset takes to write, typically from a previous run,
+            datasets without a duration count as one second
+        prepare: a callable that is passed every dataset once the arguments have been checked, before the first write
+
+    Returns: a tuple of a dictionary of dataset names to the number of seconds each successful write took, and a
+        dictionary of dataset names to the exception raised by each failed or skipped write
+    """
+    limits = {'max_workers': max_workers, 'max_per_source': max_per_source, 'max_per_container': max_per_container}
+    invalid_limits = {name: limit for name, limit in limits.items() if limit < 1}
+    if invalid_limits:
+        print(f'These limits must be at least 1: {invalid_limits}')
+        raise ValueError(f'Limits below 1 would never start a write: {invalid_limits}')
+    duplicate_names = sorted(name for name, count in Counter(dataset.name for dataset in datasets).items() if count > 1)
+    if duplicate_names:
+        print(f'These datasets appear more than once: {duplicate_names}')
+        raise ValueError(f'Dataset names must be unique: {duplicate_names}')
+    durations = durations or {}
+    datasets_by_name = {dataset.name: dataset for dataset in datasets}
+    dependencies = {dataset.name: {dependency for dependency in dataset.depends_on if dependency in datasets_by_name}
+                    for dataset in datasets}
+    dependents: 'Dict[str, List[str]]' = {dataset_name: [] for dataset_name in datasets_by_name}
+    for dataset_name, dataset_dependencies in dependencies.items():
+        for dependency in dataset_dependencies:
+            dependents[dependency].append(dataset_name)
+    priorities = {}
+    for dataset_name in reversed(_dependency_order(dependencies=dependencies)):
+        longest_dependent = max((priorities[dependent] for dependent in dependents[dataset_name]), default=0.0)
+        priorities[dataset_name] = durations.get(dataset_name, 1.0) + longest_dependent
+    if prepare is not None:
+        prepare(datasets)
+
+    waiting_on = {dataset_name: len(dataset_dependencies) for dataset_name, dataset_dependencies in dependencies.items()}
+    ready = [dataset_name for dataset_name, count in waiting_on.items() if count == 0]
+    running: 'Dict[Future, str]' = {}
+    sources = Counter()
+    containers = Counter()
+    write_durations = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='datarade_write') as executor:
+        while ready or running:
+            ready.sort(key=lambda x: priorities[x], reverse=True)
+            for dataset_name in list(ready):
+                if len(running) >= max_workers:
+                    break
+                dataset = datasets_by_name[dataset_name]
+                source, container = source_key(dataset), container_key(dataset)
+                if sources[source] < max_per_source and containers[container] < max_per_container:
+                    ready.remove(dataset_name)
+                    sources[source] += 1
+                    containers[container] += 1
+                    running[instrumentation.submit(executor, _timed, write, dataset)] = dataset_name
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                dataset_name = running.pop(future)
+                dataset = datasets_by_name[dataset_name]
+                sources[source_key(dataset)] -= 1
+                containers[container_key(dataset)] -= 1
+                try:
+                    write_durations[dataset_name] = future.result()
+                except Exception as e:
+                    print(f'Unable to write dataset: {dataset_name}')
+                    errors[dataset_name] = e
+                    _skip_dependents(dataset_name=dataset_name, dependents=dependents, errors=errors)
+                    continue
+                for dependent in dependents[dataset_name]:
+                    waiting_on[dependent] -= 1
+                    if waiting_on[dependent] == 0 and dependent not in errors:
+                        ready.append(dependent)
+    return write_durations, errors
+
+
+def _timed(write: 'Callable[[models.Dataset], None]', dataset: 'models.Dataset') -> float:
+    """
+    Writes a dataset and measures how long it took
+
+    Args:
+        write: a callable that writes one dataset
+        dataset: the dataset to write
+
+    Returns: the number of seconds the write took
+    """
+    start = time.perf_counter()
+    write(dataset)
+    return time.perf_counter() - start
+
+
+def _dependency_order(dependencies: 'Dict[str, set]') -> 'List[str]':
+    """
+    Sorts the datasets so that every dataset comes after the datasets it depends on
+
+    Args:
+        dependencies: a dictionary of dataset names to the names of the datasets they depend on
+
+    Returns: the dataset names in dependency order
+    """
+    order = []
+    remaining = {dataset_name: set(dataset_dependencies) for dataset_name, dataset_dependencies in dependencies.items()}
+    while remaining:
+        independent = sorted(dataset_name for dataset_name, dataset_dependencies in remaining.items()
+                             if not dataset_dependencies)
+        if not independent:
+            print(f'These datasets have circular dependencies: {sorted(remaining)}')
+            raise models.DatasetDependencyException(f'Circular dependencies between: {sorted(remaining)}')
+        order.extend(independent)
+        for dataset_name in independent:
+            del remaining[dataset_name]
+        for dataset_dependencies in remaining.values():
+            dataset_dependencies.difference_update(independent)
+    return order
+
+
+def _skip_dependents(dataset_name: str, dependents: 'Dict[str, List[str]]', errors: 'Dict[str, Exception]'):
+    """
+    Records every dataset that depends on a failed dataset, directly or indirectly, as skipped
+
+    Args:
+        dataset_name: the name of the failed dataset
+        dependents: a dictionary of dataset names to the names of the datasets that depend on them
+        errors: the dictionary of errors to record the skipped datasets in
+    """
+    for dependent in dependents[dataset_name]:
+        if dependent not in errors:
+            errors[dependent] = models.DatasetDependencyException(f'{dependent} depends on {dataset_name}, which failed')
+            _skip_dependents(dataset_name=dependent, dependents=dependents, errors=errors)
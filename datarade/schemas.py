@@ -3,10 +3,14 @@ These schemas are all part of the aggregate schema Dataset. Reading the datasets
 a lot of user input, similar to reading input data on a REST api. As such, it makes sense to apply validation to all
 data entered this way.
 """
+from typing import Dict, Tuple
+
 import marshmallow as ma
 
 from datarade import models
 
+FIELD_KEYS = frozenset(['name', 'description', 'type'])
+
 
 class FieldSchema(ma.Schema):
     """
@@ -23,6 +27,38 @@ class FieldSchema(ma.Schema):
         return models.Field(**data)
 
 
+class FieldList(ma.fields.Nested):
+    """
+    A list of FieldSchema objects that builds Field objects directly when every field is well formed
+
+    Datasets can have hundreds of fields, and running each one through FieldSchema is most of the cost of validating
+    a dataset. Fields that are dictionaries of strings, with a name, a type and optionally a description, are converted
+    to Field objects without marshmallow. If any field is not, the whole list is loaded with FieldSchema instead, so
+    the error messages are exactly the ones FieldSchema reports.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(FieldSchema, many=True, **kwargs)
+
+    def _deserialize(self, value, attr, data, partial=None, **kwargs):
+        if isinstance(value, list) and all(_is_well_formed_field(field) for field in value):
+            return [models.Field(**field) for field in value]
+        return super()._deserialize(value, attr, data, partial=partial, **kwargs)
+
+
+def _is_well_formed_field(field) -> bool:
+    """
+    Checks whether a field would pass FieldSchema without any changes
+
+    Args:
+        field: one item of a dataset's list of fields
+
+    Returns: True if the field is a dictionary of strings with a name, a type and no unknown keys
+    """
+    return type(field) is dict and 'name' in field and 'type' in field and field.keys() <= FIELD_KEYS and \
+        all(type(value) is str for value in field.values())
+
+
 class DatabaseSchema(ma.Schema):
     """
     A marshmallow schema corresponding to a datarade Database object
@@ -31,10 +67,15 @@ class DatabaseSchema(ma.Schema):
     """
     driver = ma.fields.Str(required=True)
     database_name = ma.fields.Str(required=True)
-    host = ma.fields.Str(required=True)
+    host = ma.fields.Str(required=False)
     port = ma.fields.Int(required=False)
     schema_name = ma.fields.Str(required=False)
 
+    @ma.validates_schema()
+    def validate_host(self, data: dict, **kwargs):
+        if data.get('driver') != 'sqlite' and 'host' not in data:
+            raise ma.ValidationError('Missing data for required field.', 'host')
+
     @ma.post_load()
     def post_load(self, data: dict, **kwargs) -> 'models.Database':
         return models.Database(**data)
@@ -53,6 +94,48 @@ class UserSchema(ma.Schema):
         return models.User(**data)
 
 
+class PartitionSchema(ma.Schema):
+    """
+    A marshmallow schema corresponding to a datarade Partition object
+
+    This schema is only called indirectly as an attribute for DatasetSchema
+    """
+    column = ma.fields.Str(required=False)
+    count = ma.fields.Int(required=False, validate=ma.validate.Range(min=1))
+    predicates = ma.fields.List(ma.fields.Str(), required=False, validate=ma.validate.Length(min=1))
+    parallelism = ma.fields.Int(required=False, validate=ma.validate.Range(min=1))
+
+    @ma.validates_schema()
+    def validate_partition(self, data: dict, **kwargs):
+        has_range = 'column' in data and 'count' in data
+        if has_range == ('predicates' in data):
+            raise ma.ValidationError('Provide either a column and a count, or a list of predicates.')
+
+    @ma.post_load()
+    def post_load(self, data: dict, **kwargs) -> 'models.Partition':
+        return models.Partition(**data)
+
+
+class IncrementalSchema(ma.Schema):
+    """
+    A marshmallow schema corresponding to a datarade Incremental object
+
+    This schema is only called indirectly as an attribute for DatasetSchema
+    """
+    watermark = ma.fields.Str(required=True)
+    strategy = ma.fields.Str(required=False, validate=ma.validate.OneOf(['append', 'merge']))
+    key = ma.fields.List(ma.fields.Str(), required=False, validate=ma.validate.Length(min=1))
+
+    @ma.validates_schema()
+    def validate_incremental(self, data: dict, **kwargs):
+        if data.get('strategy') == 'merge' and 'key' not in data:
+            raise ma.ValidationError('The merge strategy requires a key.', 'key')
+
+    @ma.post_load()
+    def post_load(self, data: dict, **kwargs) -> 'models.Incremental':
+        return models.Incremental(**data)
+
+
 class DatasetSchema(ma.Schema):
     """
     A marshmallow schema corresponding to a datarade Dataset object
@@ -62,13 +145,60 @@ class DatasetSchema(ma.Schema):
     """
     name = ma.fields.Str(required=True)
     definition = ma.fields.Str(required=True)
-    fields = ma.fields.Nested(FieldSchema, required=True, many=True)
+    fields = FieldList(required=True)
     description = ma.fields.Str(required=False)
-    actual = ma.fields.Str(required=False)
-    expected = ma.fields.Str(required=False)
+    actual = ma.fields.Str(required=False, allow_none=True)
+    expected = ma.fields.Str(required=False, allow_none=True)
     database = ma.fields.Nested(DatabaseSchema, required=False)
     user = ma.fields.Nested(UserSchema, required=False)
+    depends_on = ma.fields.List(ma.fields.Str(), required=False)
+    partition = ma.fields.Nested(PartitionSchema, required=False)
+    incremental = ma.fields.Nested(IncrementalSchema, required=False)
+    change_probe = ma.fields.Str(required=False)
 
     @ma.post_load()
     def post_load(self, data: dict, **kwargs) -> 'models.Dataset':
+        # actual and expected are optional in the schema, but required by Dataset
+        data.setdefault('actual', None)
+        data.setdefault('expected', None)
         return models.Dataset(**data)
+
+
+# building a schema copies and binds all of its fields, so a single instance is built once and reused for every load
+_dataset_schema = DatasetSchema()
+
+
+def load_dataset(dataset_dict: dict) -> 'models.Dataset':
+    """
+    Validates the configuration for a dataset with a DatasetSchema that is shared by every call
+
+    Args:
+        dataset_dict: the configuration dictionary for the dataset
+
+    Returns: a Dataset object
+    """
+    return _dataset_schema.load(dataset_dict)
+
+
+def load_many(dataset_dicts: 'Dict[str, dict]') -> 'Tuple[Dict[str, models.Dataset], Dict[str, ma.ValidationError]]':
+    """
+    Validates the configurations for many datasets, one at a time, with the DatasetSchema that is shared by every call
+
+    This is a convenience loop over the datasets rather than a single DatasetSchema(many=True) load, so that a
+    dataset that fails validation does not stop the rest of the datasets from being loaded. Its ValidationError has
+    the same messages that DatasetSchema().load() raises for that dataset on its own.
+
+    Args:
+        dataset_dicts: a dictionary of dataset names to configuration dictionaries
+
+    Returns: a tuple of a dictionary of dataset names to Dataset objects, and a dictionary of dataset names to the
+        ValidationError raised for that dataset
+    """
+    datasets = {}
+    errors = {}
+    for dataset_name, dataset_dict in dataset_dicts.items():
+        try:
+            datasets[dataset_name] = _dataset_schema.load(dataset_dict)
+        except ma.ValidationError as e:
+            errors[dataset_name] = e
+    return datasets, errors
@@ -3,17 +3,28 @@ These services allow a user to interact with datasets stored in a git-compliant
 should be treated as the interface to this library. In other words, breaking changes may be introduced at lower levels,
 but this layer should remain relatively stable as the library matures.
 """
-from typing import Optional
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union, TYPE_CHECKING
 
-from bcp import DataFile
 import yaml
 
-from datarade import models, schemas
+from datarade import git_client, instrumentation, models, scheduler, schemas
+
+# asyncio, and transfer with the database drivers, are imported by the services that use them
+if TYPE_CHECKING:
+    import asyncio
+
+    from datarade import transfer
+
+DATASET_FILE_NAMES = ('config.yaml', 'definition.sql', 'actual.sql', 'expected.sql')
 
 
 def get_dataset_catalog(repository: str, organization: str, platform: str, project: str = None,
                         branch: 'Optional[str]' = 'master',
-                        username: str = None, password: str = None) -> 'models.DatasetCatalog':
+                        username: str = None, password: str = None,
+                        cache_dir: str = None, cache_size: int = None,
+                        pool_size: int = 10, archive: bool = False, shared: bool = False,
+                        indexed: bool = False, base_url: str = None) -> 'models.DatasetCatalog':
     """
     A factory function that provides a DatasetCatalog instance
 
@@ -34,46 +45,119 @@ def get_dataset_catalog(repository: str, organization: str, platform: str, proje
                 |--- config.yaml
                 |--- definition.sql
 
-    The repository can be hosted on Git Hub or on Azure Repos. Multiple branches can be used for managing related
-    dataset catalogs. For instance, you may want to maintain a uat branch and a production branch for managing
-    environments. Or you may want one repo for all of your catalogs, but you want to provide some organization to
-    your datasets.
+    The repository can be hosted on Git Hub or on Azure Repos, or it can be a clone on the local file system. Multiple
+    branches can be used for managing related dataset catalogs. For instance, you may want to maintain a uat branch and
+    a production branch for managing environments. Or you may want one repo for all of your catalogs, but you want to
+    provide some organization to your datasets.
 
     Args:
-        repository: the name of the repository
+        repository: the name of the repository, or the path to the repository for a local repository
         organization: the name of the organization (or user for GitHub) that owns the repository
-        platform: that platform that hosts the repo ['github', 'azure-devops']
+        platform: that platform that hosts the repo ['github', 'azure-devops', 'local']
         project: the name of the project that contains the repository, only used for Azure Repos
-        branch: the branch to use in the repository, defaults to 'master'
+        branch: the branch to use in the repository, defaults to 'master', a local repository reads its working tree
+            when this is None
         username: the username with read access to the repository, only used for Azure Repos
         password: the password with read access to the repository, only used for Azure Repos, can also be the one-time
             git credentials password that bypasses MFA
+        cache_dir: the directory for a persistent file cache, when provided, files that have not changed since they
+            were cached are revalidated with the platform instead of downloaded again
+        cache_size: the maximum size of the file cache in bytes, defaults to 100 MB
+        pool_size: the maximum number of keep-alive connections to the platform, only used for GitHub, defaults to 10
+        archive: download the whole catalog folder as a single archive the first time a file is needed, and serve
+            every file from memory after that, which is faster when many datasets are read from the catalog
+        shared: keep validated datasets in memory so the catalog can be shared by many threads, concurrent requests
+            for the same dataset wait on a single load, use DatasetCatalog.invalidate() to pick up catalog changes
+        indexed: list the whole catalog in one request the first time a dataset is read, so that files that don't
+            exist, like optional actual.sql and expected.sql files, are never requested
+        base_url: a url that stands in for GitHub or Azure Repos, such as a local
+            datarade.testing.git_server.GitServer that adds latency and errors for load testing
 
     Returns: a DatasetCatalog instance
     """
     return models.DatasetCatalog(repository=repository, organization=organization, platform=platform,
-                                 project=project, branch=branch, username=username, password=password)
+                                 project=project, branch=branch, username=username, password=password,
+                                 cache_dir=cache_dir, cache_size=cache_size, pool_size=pool_size,
+                                 archive=archive, shared=shared, indexed=indexed, base_url=base_url)
+
+
+def get_dataset_catalog_async(repository: str, organization: str, platform: str, project: str = None,
+                              branch: 'Optional[str]' = 'master',
+                              username: str = None, password: str = None,
+                              cache_dir: str = None, cache_size: int = None,
+                              pool_size: int = 10, base_url: str = None) -> 'models.AsyncDatasetCatalog':
+    """
+    A factory function that provides an AsyncDatasetCatalog instance, for use with get_dataset_async()
+
+    This takes the same arguments as get_dataset_catalog(), except for archive, shared and indexed, since the async git
+    clients only get files. They require the optional aiohttp dependency, which is installed with the 'async' extra.
+    The catalog holds open connections, so it should be closed with 'await close()' when it's no longer needed, or
+    used as an async context manager:
+
+    .. code-block:: python
 
+        async with datarade.get_dataset_catalog_async(...) as dataset_catalog:
+            dataset = await datarade.get_dataset_async(dataset_catalog=dataset_catalog, dataset_name='my_dataset')
 
-def get_dataset_container(driver: str, database_name: str, host: str, port: int = None, schema_name: str = None,
-                          username: str = None, password: str = None) -> 'models.DatasetContainer':
+    Returns: an AsyncDatasetCatalog instance
+    """
+    return models.AsyncDatasetCatalog(repository=repository, organization=organization, platform=platform,
+                                      project=project, branch=branch, username=username, password=password,
+                                      cache_dir=cache_dir, cache_size=cache_size, pool_size=pool_size,
+                                      base_url=base_url)
+
+
+def get_dataset_container(driver: str, database_name: str, host: str = None, port: int = None,
+                          schema_name: str = None, username: str = None, password: str = None, pool_size: int = 5,
+                          pool_pre_ping: bool = True, transfer_engine: 'transfer.AbstractTransferEngine' = None,
+                          spool_dir: str = None, compression: str = None) -> 'models.DatasetContainer':
     """
     A factory function that provides a DatasetContainer instance
 
+    Containers that connect with the same parameters share a single sqlalchemy engine, and its connection pool, for the
+    life of the process.
+
+    Data is loaded into the container with bcp when both the source and the container are MS SQL Server databases and
+    bcp is installed, and through sqlalchemy otherwise, unless a transfer engine is supplied.
+
     Args:
-        driver: the type of database, currently only 'mssql' is supported
-        database_name: name of the database
-        host: the name of the server, including the instance
+        driver: the type of database, one of: [mssql, sqlite]
+        database_name: name of the database, or the path to the database file for sqlite
+        host: the name of the server, including the instance, not used for sqlite
         port: the port that the database is listening to on the server
         schema_name: the name of the schema
         username: a user with create table and insert permissions on the schema
         password: the password for the user
+        pool_size: the number of connections to keep open to the database, defaults to 5
+        pool_pre_ping: test each connection when it's checked out of the pool, replacing it if it was dropped
+        transfer_engine: the transfer engine that loads data into the container, such as a
+            transfer.DBAPITransferEngine with a different batch size
+        spool_dir: the directory to write intermediate data files to, such as a scratch disk for this container
+        compression: compress intermediate data files as they are written, one of: [gzip, zstd], which keeps less
+            data on disk at the cost of some cpu, the bcp engine only compresses on POSIX operating systems
 
     Returns: a DatasetContainer instance
     """
     database = models.Database(driver=driver, database_name=database_name, host=host, port=port,
                                schema_name=schema_name)
-    return models.DatasetContainer(database=database, username=username, password=password)
+    return models.DatasetContainer(database=database, username=username, password=password, pool_size=pool_size,
+                                   pool_pre_ping=pool_pre_ping, transfer_engine=transfer_engine, spool_dir=spool_dir,
+                                   compression=compression)
+
+
+def list_datasets(dataset_catalog: 'models.DatasetCatalog') -> 'List[str]':
+    """
+    Lists the datasets in the dataset catalog
+
+    The whole catalog folder is listed in a single request. The listing is kept by the dataset catalog and can be
+    refreshed with DatasetCatalog.invalidate().
+
+    Args:
+        dataset_catalog: the dataset catalog to list
+
+    Returns: a sorted list of dataset names, which are the directories in the catalog that contain a config.yaml file
+    """
+    return dataset_catalog.list_datasets()
 
 
 def get_dataset(dataset_catalog: 'models.DatasetCatalog', dataset_name: str) -> 'models.Dataset':
@@ -82,7 +166,8 @@ def get_dataset(dataset_catalog: 'models.DatasetCatalog', dataset_name: str) ->
 
     It collects all of the required files from the dataset catalog repository, puts the contents in a configuration
     dictionary, passes that dictionary up to the abstract repository for validation, and returns the resulting Dataset
-    instance.
+    instance. A shared dataset catalog returns the dataset from memory once it has been loaded, and concurrent calls
+    for the same dataset wait on a single load.
 
     Args:
         dataset_catalog: dataset catalog that contains the dataset
@@ -91,24 +176,169 @@ def get_dataset(dataset_catalog: 'models.DatasetCatalog', dataset_name: str) ->
 
     Returns: a Dataset object
     """
-    config_yaml = dataset_catalog.git.get_file_contents(f'catalog/{dataset_name}/config.yaml')
-    definition = dataset_catalog.git.get_file_contents(f'catalog/{dataset_name}/definition.sql')
+    def load() -> 'models.Dataset':
+        files = {file_name: _get_catalog_file(dataset_catalog=dataset_catalog, dataset_name=dataset_name,
+                                              file_name=file_name)
+                 for file_name in DATASET_FILE_NAMES}
+        dataset_dict = _get_dataset_dict(files=files)
+        with instrumentation.span('schema.load', dataset=dataset_name):
+            return schemas.load_dataset(dataset_dict)
+
+    return dataset_catalog.get_or_load(dataset_name=dataset_name, load=load)
+
+
+async def get_dataset_async(dataset_catalog: 'models.AsyncDatasetCatalog', dataset_name: str) -> 'models.Dataset':
+    """
+    Returns a datarade Dataset object using the identified configuration in the dataset catalog, without blocking the
+    event loop
+
+    This is the async version of get_dataset(). The files for the dataset are collected concurrently.
+
+    Args:
+        dataset_catalog: async dataset catalog that contains the dataset
+        dataset_name: the name of the dataset, which is also the name of the directory containing the files in the
+            repository
+
+    Returns: a Dataset object
+    """
+    import asyncio
+
+    files = {file_name: asyncio.ensure_future(
+                 dataset_catalog.git.get_file_contents(f'catalog/{dataset_name}/{file_name}'))
+             for file_name in DATASET_FILE_NAMES}
+    await asyncio.gather(*files.values(), return_exceptions=True)
+    dataset_dict = _get_dataset_dict(files=files)
+    with instrumentation.span('schema.load', dataset=dataset_name):
+        return schemas.load_dataset(dataset_dict)
+
+
+def get_datasets(dataset_catalog: 'models.DatasetCatalog', dataset_names: 'List[str]',
+                 max_workers: int = 16) -> 'Tuple[Dict[str, models.Dataset], Dict[str, Exception]]':
+    """
+    Returns datarade Dataset objects for several datasets in the dataset catalog at once
+
+    The files for all of the datasets are collected concurrently on a bounded thread pool, and all of the resulting
+    configuration dictionaries are validated together. A dataset that can't be collected or fails validation does not
+    stop the rest of the datasets from being returned; its exception is reported alongside the datasets instead. A
+    shared dataset catalog returns datasets that it already holds in memory, and keeps the newly loaded ones.
+
+    Args:
+        dataset_catalog: dataset catalog that contains the datasets
+        dataset_names: the names of the datasets, which are also the names of the directories containing the files in
+            the repository
+        max_workers: the maximum number of files to collect at the same time
+
+    Returns: a tuple of a dictionary of dataset names to Dataset objects, and a dictionary of dataset names to the
+        exception raised while collecting or validating that dataset
+    """
+    generation = dataset_catalog.generation
+    loaded_datasets = {}
+    for dataset_name in dataset_names:
+        dataset = dataset_catalog.get_loaded_dataset(dataset_name=dataset_name)
+        if dataset is not None:
+            loaded_datasets[dataset_name] = dataset
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        files = {dataset_name: {file_name: _get_catalog_file(dataset_catalog=dataset_catalog, dataset_name=dataset_name,
+                                                             file_name=file_name, executor=executor)
+                                for file_name in DATASET_FILE_NAMES}
+                 for dataset_name in dataset_names if dataset_name not in loaded_datasets}
+        dataset_dicts = {}
+        errors = {}
+        for dataset_name, dataset_files in files.items():
+            try:
+                dataset_dicts[dataset_name] = _get_dataset_dict(files=dataset_files)
+            except Exception as e:
+                print(f'Unable to collect the files for dataset: {dataset_name}')
+                errors[dataset_name] = e
+    with instrumentation.span('schema.load', datasets=len(dataset_dicts)):
+        datasets, validation_errors = schemas.load_many(dataset_dicts=dataset_dicts)
+    for dataset_name, e in validation_errors.items():
+        print(f'Invalid configuration for dataset: {dataset_name}')
+        errors[dataset_name] = e
+    for dataset_name, dataset in datasets.items():
+        dataset_catalog.add_loaded_dataset(dataset_name=dataset_name, dataset=dataset, generation=generation)
+        loaded_datasets[dataset_name] = dataset
+    return loaded_datasets, errors
+
+
+def _get_catalog_file(dataset_catalog: 'models.DatasetCatalog', dataset_name: str, file_name: str,
+                      executor: 'Optional[Executor]' = None) -> 'Future':
+    """
+    Collects a file for a dataset from the dataset catalog, either right away or on the supplied executor
+
+    When the dataset catalog is indexed, files that are not in the index are reported as missing without a request.
+
+    Args:
+        dataset_catalog: dataset catalog that contains the dataset
+        dataset_name: the name of the dataset
+        file_name: the name of the file within the directory for the dataset
+        executor: an executor to collect the file on, the file is collected right away if this is not provided
+
+    Returns: a Future holding the contents of the file, or the exception raised while collecting it
+    """
+    file_path = f'catalog/{dataset_name}/{file_name}'
+    file = Future()
+    if dataset_catalog.indexed and not dataset_catalog.index.has_file(dataset_name=dataset_name, file_name=file_name):
+        file.set_exception(FileNotFoundError(file_path))
+        return file
+    if executor is not None:
+        return instrumentation.submit(executor, _fetch_catalog_file, dataset_catalog, file_path)
+    try:
+        file.set_result(_fetch_catalog_file(dataset_catalog=dataset_catalog, file_path=file_path))
+    except Exception as e:
+        file.set_exception(e)
+    return file
+
+
+def _fetch_catalog_file(dataset_catalog: 'models.DatasetCatalog', file_path: str) -> str:
+    """
+    Fetches a file from the dataset catalog's git client, timing the request
+
+    Args:
+        dataset_catalog: dataset catalog that contains the file
+        file_path: the path to the file within the repository
+
+    Returns: the contents of the file
+    """
+    with instrumentation.span('git.fetch', file_path=file_path) as fetch:
+        contents = dataset_catalog.git.get_file_contents(file_path)
+        fetch.attributes['bytes'] = len(contents.encode('utf-8'))
+        return contents
+
+
+def _get_dataset_dict(files: 'Dict[str, Union[Future, asyncio.Future]]') -> dict:
+    """
+    Puts the contents of the files for a dataset into a configuration dictionary
+
+    The config.yaml and definition.sql files are required. The actual.sql and expected.sql files are optional, but
+    are only used when both of them are present. Failures other than a missing actual.sql or expected.sql file, like
+    rate limits, authentication errors and unavailable servers, are raised rather than treated as a missing file.
+
+    Args:
+        files: a dictionary of file names to completed Futures holding the contents of each file
+
+    Returns: the configuration dictionary for the dataset
+    """
+    config = files['config.yaml'].result()
+    with instrumentation.span('yaml.parse', bytes=len(config.encode('utf-8'))):
+        dataset_dict = yaml.safe_load(config)
+    dataset_dict['definition'] = files['definition.sql'].result()
     try:
-        actual = dataset_catalog.git.get_file_contents(f'catalog/{dataset_name}/actual.sql')
-        expected = dataset_catalog.git.get_file_contents(f'catalog/{dataset_name}/expected.sql')
-    except exception as E:
+        actual = files['actual.sql'].result()
+        expected = files['expected.sql'].result()
+    except Exception as e:
+        if not git_client.is_not_found(e):
+            raise e
         actual = None
         expected = None
-    dataset_dict = yaml.safe_load(config_yaml)
-    dataset_dict['definition'] = definition
     dataset_dict['actual'] = actual
     dataset_dict['expected'] = expected
-    dataset_schema = schemas.DatasetSchema()
-    return dataset_schema.load(dataset_dict)
+    return dataset_dict
 
 
 def write_dataset(dataset: 'models.Dataset', dataset_container: 'models.DatasetContainer',
-                  username: str = None, password: str = None):
+                  username: str = None, password: str = None, stream: bool = False,
+                  skip_unchanged: bool = False, swap: bool = False) -> bool:
     """
     Writes the supplied dataset to the dataset container
 
@@ -119,17 +349,233 @@ def write_dataset(dataset: 'models.Dataset', dataset_container: 'models.DatasetC
     to ~/bcp/logs. On a successful write, the data file is deleted to avoid leaving copies of data behind on the
     application machine.
 
+    When streaming, the export writes to a named pipe that the import reads from at the same time, so the data is
+    never written to disk and the import does not wait for the export to finish. This requires a POSIX operating
+    system and a version of bcp that can read from and write to a named pipe. With bcp, streaming and compressed data
+    files are refused on other operating systems before the table is created or changed.
+
+    When the dataset is partitioned, each partition is exported and imported by its own pair of bcp processes at the
+    same time. The number of rows in the dataset container is then checked against the number of rows in the source.
+
+    When the dataset is incremental, the table in the dataset container is kept, and only the rows past the highest
+    watermark in it are exported. They are appended to the table, or loaded into a separate table and merged into it
+    by key.
+
+    When skipping unchanged datasets, a fingerprint of the dataset's definition, its fields and the result of its change
+    probe is stored in the dataset container after each write. The next write is skipped if the fingerprint is the
+    same and the table still exists. A dataset without a change probe is then only written again when its definition
+    or its fields change. Incremental datasets without a change probe are never skipped, since new rows past the
+    watermark wouldn't change their fingerprint.
+
+    When swapping, the dataset is loaded into a staging table next to the table in the dataset container, which is
+    then renamed into place in one transaction. Readers keep seeing the old data until the new data is ready, instead
+    of a missing or half loaded table. Incremental datasets are always loaded in place.
+
     Args:
         dataset: the dataset to be written
         dataset_container: the database to store the dataset in
         username: a user with select/execute permissions on the source database objects
         password: the password for the user
+        stream: stream the data from the source to the dataset container instead of writing it to a data file
+        skip_unchanged: skip the write if the dataset has not changed since it was last written
+        swap: load the dataset into a staging table, then swap it with the table in the dataset container
+
+    Returns: True if the dataset was written, False if it was skipped
     """
-    dataset_container.create_table(dataset=dataset)
     if username is None and dataset.user is not None:
         username = dataset.user.username
-    data_file = DataFile(delimiter='|~|')
-    source_bcp = dataset.database.bcp(username=username, password=password)
-    source_bcp.dump(query=dataset.definition, output_file=data_file)
-    dataset_container.bcp.load(input_file=data_file, table=dataset_container.database.full_table_name(dataset.name))
-    data_file.file.unlink()
+    skip_unchanged = skip_unchanged and (dataset.incremental is None or dataset.change_probe is not None)
+    with instrumentation.span('write_dataset', dataset=dataset.name) as write:
+        if skip_unchanged:
+            with instrumentation.span('fingerprint', dataset=dataset.name):
+                fingerprint = dataset.fingerprint(probe_result=dataset.probe_source(username=username,
+                                                                                    password=password))
+                unchanged = dataset_container.has_table(table_name=dataset.name) and \
+                    dataset_container.get_fingerprint(dataset_name=dataset.name) == fingerprint
+            write.attributes['skipped'] = unchanged
+            if unchanged:
+                return False
+            # a write that fails part way through must not leave the old fingerprint behind
+            dataset_container.set_fingerprint(dataset_name=dataset.name, fingerprint=None)
+        _write_dataset(dataset=dataset, dataset_container=dataset_container, username=username, password=password,
+                       stream=stream, swap=swap)
+        if skip_unchanged:
+            dataset_container.set_fingerprint(dataset_name=dataset.name, fingerprint=fingerprint)
+        return True
+
+
+def _write_dataset(dataset: 'models.Dataset', dataset_container: 'models.DatasetContainer', username: str = None,
+                   password: str = None, stream: bool = False, swap: bool = False):
+    """
+    Writes the supplied dataset to the dataset container, fully or incrementally
+
+    Args:
+        dataset: the dataset to be written
+        dataset_container: the database to store the dataset in
+        username: a user with select/execute permissions on the source database objects
+        password: the password for the user
+        stream: stream the data from the source to the dataset container instead of writing it to a data file
+        swap: load a full reload into a staging table, then swap it with the table in the dataset container
+    """
+    from datarade import transfer
+
+    transfer_engine = dataset_container.transfer_engine or transfer.get_transfer_engine(
+        source=dataset.database, target=dataset_container.database)
+    transfer_engine.check(dataset_container=dataset_container, stream=stream)
+    incremental = dataset.incremental
+    if incremental is None:
+        table_name = f'{dataset.name}_staging' if swap else dataset.name
+        dataset_container.create_table(dataset=dataset, table_name=table_name)
+        _copy_dataset(dataset=dataset, query=dataset.definition, dataset_container=dataset_container,
+                      table_name=table_name, transfer_engine=transfer_engine, username=username, password=password,
+                      stream=stream)
+        if swap:
+            dataset_container.swap_table(table_name=dataset.name, staging_table_name=table_name)
+        return
+    dataset_container.create_table(dataset=dataset, replace=False)
+    watermark = dataset_container.get_watermark(table_name=dataset.name, column_name=incremental.watermark)
+    query = dataset.definition
+    if watermark is not None:
+        # merged rows replace rows with the same key, so rows at the watermark can be loaded again safely
+        query = transfer.incremental_query(query=query, column_name=incremental.watermark, watermark=watermark,
+                                           inclusive=incremental.strategy == 'merge')
+    if incremental.strategy == 'merge':
+        delta_table_name = f'{dataset.name}_delta'
+        dataset_container.create_table(dataset=dataset, table_name=delta_table_name)
+        _copy_dataset(dataset=dataset, query=query, dataset_container=dataset_container, table_name=delta_table_name,
+                      transfer_engine=transfer_engine, username=username, password=password, stream=stream)
+        dataset_container.merge_table(dataset=dataset, source_table_name=delta_table_name)
+    else:
+        _copy_dataset(dataset=dataset, query=query, dataset_container=dataset_container, table_name=dataset.name,
+                      transfer_engine=transfer_engine, username=username, password=password, stream=stream)
+
+
+def _copy_dataset(dataset: 'models.Dataset', query: str, dataset_container: 'models.DatasetContainer',
+                  table_name: str, transfer_engine: 'transfer.AbstractTransferEngine', username: str = None,
+                  password: str = None, stream: bool = False):
+    """
+    Copies the results of a dataset's query into a table in the dataset container, partitioning it if the dataset is
+    partitioned
+
+    Args:
+        dataset: the dataset to be written
+        query: the query to copy the results of, the dataset's definition or a filtered version of it
+        dataset_container: the database to store the dataset in
+        table_name: the one part name of the table to load the data into, which should already exist
+        transfer_engine: the transfer engine to copy the data with
+        username: a user with select/execute permissions on the source database objects
+        password: the password for the user
+        stream: stream the data from the source to the dataset container instead of writing it to a data file
+    """
+    from datarade import transfer
+
+    def copy_query(partition_query: str):
+        transfer_engine.copy(query=partition_query, source=dataset.database, dataset_container=dataset_container,
+                             table_name=table_name, username=username, password=password, stream=stream)
+
+    if dataset.partition is None:
+        copy_query(query)
+        return
+    rows_before = dataset_container.count_rows(table_name=table_name)
+    source_engine = dataset.database.sqlalchemy_engine(username=username, password=password)
+    with instrumentation.span('partition.plan', dataset=dataset.name) as plan:
+        queries, expected_rows = transfer.partition_queries(query=query, partition=dataset.partition,
+                                                            engine=source_engine)
+        plan.attributes.update(partitions=len(queries), rows=expected_rows)
+    parallelism = dataset.partition.parallelism
+    if dataset_container.database.driver == 'sqlite':  # sqlite only allows one writer at a time
+        parallelism = 1
+    transfer.copy_partitions(queries=queries, copy_query=copy_query, parallelism=parallelism)
+    actual_rows = dataset_container.count_rows(table_name=table_name) - rows_before
+    if actual_rows != expected_rows:
+        table = dataset_container.database.full_table_name(table_name)
+        print(f'Expected {expected_rows} rows to be loaded into {table}, but found {actual_rows}')
+        raise models.RowCountMismatchException(f'{table} received {actual_rows} rows instead of {expected_rows}')
+
+
+def write_datasets(datasets: 'List[models.Dataset]', dataset_container: 'models.DatasetContainer',
+                   username: str = None, password: str = None, stream: bool = False, skip_unchanged: bool = False,
+                   swap: bool = False, dataset_containers: 'Dict[str, models.DatasetContainer]' = None,
+                   max_workers: int = 8, max_per_database: int = 2, max_per_container: int = 4,
+                   durations: 'Dict[str, float]' = None) -> 'Tuple[Dict[str, float], Dict[str, Exception]]':
+    """
+    Writes many datasets concurrently, in the order given by their dependencies
+
+    A dataset can list the datasets that need to be written before it in the depends_on section of its config.yaml.
+    Each dataset is written with write_dataset() once its dependencies have been written, while limiting how many
+    datasets are read from the same source database, and written to the same dataset container, at the same time.
+    Datasets with the longest chain of expected work ahead of them are started first. A dataset that fails does not
+    stop the others, but every dataset that depends on it is skipped.
+
+    Before the first write, the tables for every dataset are created or brought up to date with create_tables(), in one
+    transaction for each dataset container, so that each write only has to empty its table. Rows are kept by this
+    step, since a dataset can still be skipped. If the transaction fails, each write prepares its own table instead.
+
+    Args:
+        datasets: the datasets to be written
+        dataset_container: the database to store the datasets in
+        username: a user with select/execute permissions on the source database objects
+        password: the password for the user
+        stream: stream the data from the sources to the dataset containers instead of writing it to data files
+        skip_unchanged: skip the datasets that have not changed since they were last written
+        swap: load each dataset into a staging table, then swap it with the table in its dataset container
+        dataset_containers: a dictionary of dataset names to the database to store that dataset in, for datasets that
+            are not stored in dataset_container
+        max_workers: the maximum number of datasets to write at the same time
+        max_per_database: the maximum number of datasets to read from the same source database at the same time
+        max_per_container: the maximum number of datasets to write to the same dataset container at the same time
+        durations: the expected number of seconds each dataset takes to write, such as the durations returned by a
+            previous run, which is used to start the longest work first
+
+    Returns: a tuple of a dictionary of dataset names to the number of seconds each successful write took, and a
+        dictionary of dataset names to the exception raised by each failed or skipped write
+    """
+    dataset_containers = dataset_containers or {}
+
+    def container_for(dataset: 'models.Dataset') -> 'models.DatasetContainer':
+        return dataset_containers.get(dataset.name, dataset_container)
+
+    def source_key(dataset: 'models.Dataset') -> tuple:
+        if dataset.database is None:
+            return ()
+        return dataset.database.host, dataset.database.port, dataset.database.database_name
+
+    def write(dataset: 'models.Dataset'):
+        write_dataset(dataset=dataset, dataset_container=container_for(dataset), username=username, password=password,
+                      stream=stream, skip_unchanged=skip_unchanged, swap=swap)
+
+    def create_tables(scheduled_datasets: 'List[models.Dataset]'):
+        _create_tables(datasets=scheduled_datasets, container_for=container_for, swap=swap)
+
+    return scheduler.schedule(datasets=datasets, write=write, source_key=source_key,
+                              container_key=lambda dataset: id(container_for(dataset)), max_workers=max_workers,
+                              max_per_source=max_per_database, max_per_container=max_per_container,
+                              durations=durations, prepare=create_tables)
+
+
+def _create_tables(datasets: 'List[models.Dataset]',
+                   container_for: 'Callable[[models.Dataset], Optional[models.DatasetContainer]]', swap: bool = False):
+    """
+    Creates or updates the tables that the datasets will be loaded into, in one transaction for each dataset container
+
+    Args:
+        datasets: the datasets that will be written
+        container_for: a callable that finds the dataset container that a dataset is written to
+        swap: the datasets will be loaded into staging tables, which are prepared instead of their tables
+    """
+    tables: 'Dict[int, Tuple[models.DatasetContainer, List[models.Dataset], List[str]]]' = {}
+    for dataset in datasets:
+        dataset_container = container_for(dataset)
+        if dataset_container is None:
+            continue
+        # incremental datasets are always loaded in place, see _write_dataset()
+        table_name = f'{dataset.name}_staging' if swap and dataset.incremental is None else dataset.name
+        _, container_datasets, table_names = tables.setdefault(id(dataset_container), (dataset_container, [], []))
+        container_datasets.append(dataset)
+        table_names.append(table_name)
+    for dataset_container, container_datasets, table_names in tables.values():
+        try:
+            dataset_container.create_tables(datasets=container_datasets, table_names=table_names, replace=False)
+        except Exception as e:
+            # each write prepares its own table as well, and reports its own error if that fails too
+            print(f'Unable to prepare the tables in one transaction, they will be prepared one at a time: {e!r}')
@@ -0,0 +1,4 @@
+"""
+This package provides stand-ins for the services that datarade talks to, so that code built on datarade can be tested
+and load tested without the network.
+"""
@@ -0,0 +1,352 @@
+"""
+This module provides a local stand-in for the GitHub and Azure Repos endpoints that the git clients call, so that
+catalog resolution can be tested and load tested without the network. It's used by datarade's own tests and
+benchmarks, and it ships with the package so that code built on datarade can do the same.
+
+The server serves the files in a directory, which is laid out like the repository, for any organization, project,
+repository and branch. The git clients are pointed at it with their base_url:
+
+.. code-block:: python
+
+    from datarade.testing import git_server
+
+    with git_server.GitServer(root='/path/to/catalog_repo', latency=0.05, error_rate=0.01) as server:
+        dataset_catalog = datarade.get_dataset_catalog(repository='catalog_repo', organization='fivestack',
+                                                       platform='github', base_url=server.url)
+
+It emulates these endpoints:
+
+- GitHub raw files: /<organization>/<repository>/<branch>/<path>, with ETags and If-None-Match
+- GitHub archives: /<organization>/<repository>/tar.gz/<branch>
+- GitHub trees: /repos/<organization>/<repository>/git/trees/<branch>?recursive=1
+- Azure Repos items: /<organization>/<project>/_apis/git/repositories/<repository>/items, which returns the contents,
+  the metadata, a listing or a zip of the item depending on the query and the Accept header
+- Azure Repos blobs: /<organization>/<project>/_apis/git/repositories/<repository>/blobs/<object id>
+- the Azure DevOps resource location endpoints that the azure-devops package calls before its first request
+
+Every request waits for the configured latency, and can be failed or rate limited, before it's served. Response bodies
+are sent no faster than the configured bandwidth.
+"""
+import io
+import json
+import math
+import random
+import tarfile
+import threading
+import time
+import zipfile
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from datarade.git_client import git_blob_id
+
+AZURE_LOCATIONS = [
+    {'id': 'e81700f7-3be2-46de-8624-2eb35882fcaa', 'area': 'Location', 'resourceName': 'ResourceAreas',
+     'routeTemplate': '_apis/{resource}/{areaId}', 'resourceVersion': 1, 'minVersion': 3.2, 'maxVersion': 6.0,
+     'releasedVersion': '0.0'},
+    {'id': 'fb93c0db-47ed-4a31-8c20-47552878fb44', 'area': 'git', 'resourceName': 'items',
+     'routeTemplate': '{project}/_apis/{area}/repositories/{repositoryId}/{resource}/{*path}', 'resourceVersion': 1,
+     'minVersion': 1.0, 'maxVersion': 6.0, 'releasedVersion': '6.0'},
+    {'id': '7b28e929-2c99-405d-9c5c-6167a06e6816', 'area': 'git', 'resourceName': 'blobs',
+     'routeTemplate': '{project}/_apis/{area}/repositories/{repositoryId}/{resource}/{sha1}', 'resourceVersion': 1,
+     'minVersion': 1.0, 'maxVersion': 6.0, 'releasedVersion': '6.0'},
+]
+
+
+class GitServer:
+    """
+    A local HTTP server that emulates GitHub and Azure Repos, with configurable latency, bandwidth, errors and rate
+    limits
+
+    The server runs on a background thread once it's started, and can be used as a context manager to start and stop
+    it. The number of responses with each status code is kept in status_counts, which is updated under a lock because
+    each request is handled on its own thread.
+
+    Args:
+        root: the directory to serve, laid out like the repository
+        latency: the number of seconds to wait before responding to each request
+        bandwidth: the maximum number of bytes per second to send in each response body, unlimited if not provided
+        error_rate: the fraction of requests, between 0 and 1, that fail with a 503 Service Unavailable
+        rate_limit: the maximum number of requests to serve in each rate limit window, requests over the limit get a
+            429 Too Many Requests with a Retry-After header, unlimited if not provided
+        rate_limit_window: the length of the rate limit window in seconds
+        seed: the seed for choosing which requests fail, the same seed fails the same requests in a serial test
+        host: the interface to listen on
+        port: the port to listen on, any free port is used if this is 0
+    """
+
+    def __init__(self, root: str, latency: float = 0.0, bandwidth: int = None, error_rate: float = 0.0,
+                 rate_limit: int = None, rate_limit_window: float = 1.0, seed: int = None,
+                 host: str = '127.0.0.1', port: int = 0):
+        self.root = Path(root).resolve()
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.status_counts: 'Counter[int]' = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.git_server = self
+        self._thread: 'Optional[threading.Thread]' = None
+
+    @property
+    def url(self) -> str:
+        """
+        The base url to pass to the git clients
+
+        Returns: the url of the server, without a trailing slash
+        """
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'GitServer':
+        """
+        Starts serving requests on a background thread
+
+        Returns: the server
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, name='datarade-git-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops serving requests and closes the socket
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> 'GitServer':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def throttle(self) -> 'Optional[Tuple[int, Dict[str, str]]]':
+        """
+        Decides whether a request is rate limited or fails, counting it against the current rate limit window
+
+        Returns: the status code and headers to respond with instead of serving the request, or None to serve it
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= self.rate_limit_window:
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+            if self.rate_limit is not None and self._window_count > self.rate_limit:
+                retry_after = self._window_start + self.rate_limit_window - now
+                return 429, {'Retry-After': str(math.ceil(retry_after)), 'X-RateLimit-Remaining': '0'}
+            if self.error_rate and self._random.random() < self.error_rate:
+                return 503, {}
+        return None
+
+    def count_status(self, status_code: int):
+        """
+        Counts a response in status_counts
+
+        Args:
+            status_code: the status code of the response
+        """
+        with self._lock:
+            self.status_counts[status_code] += 1
+
+    def read_file(self, file_path: str) -> 'Optional[bytes]':
+        """
+        Reads a file from the root directory, refusing paths outside of it
+
+        Args:
+            file_path: the relative path to the file within the repo
+
+        Returns: the contents of the file, or None if there is no such file
+        """
+        path = (self.root / file_path.strip('/')).resolve()
+        if self.root != path and self.root not in path.parents or not path.is_file():
+            return None
+        return path.read_bytes()
+
+    def list_files(self, folder_path: str) -> 'Dict[str, bytes]':
+        """
+        Reads every file within a folder of the root directory
+
+        Args:
+            folder_path: the relative path to the folder within the repo, the whole repo is read if this is empty
+
+        Returns: a dictionary of relative file paths within the repo to file contents
+        """
+        folder = (self.root / folder_path.strip('/')).resolve()
+        if self.root != folder and self.root not in folder.parents or not folder.is_dir():
+            return {}
+        return {file.relative_to(self.root).as_posix(): file.read_bytes()
+                for file in sorted(folder.rglob('*')) if file.is_file()}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Routes each request to the GitHub or Azure Repos endpoint that it's addressed to
+    """
+    protocol_version = 'HTTP/1.1'
+    server: 'ThreadingHTTPServer'
+
+    @property
+    def git_server(self) -> 'GitServer':
+        return self.server.git_server
+
+    def log_message(self, format: str, *args):
+        pass
+
+    def do_OPTIONS(self):
+        if self._throttled():
+            return
+        self._send_json({'count': len(AZURE_LOCATIONS), 'value': AZURE_LOCATIONS})
+
+    def do_GET(self):
+        if self._throttled():
+            return
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if '_apis' in parts:
+            self._azure(parts=parts[parts.index('_apis') + 1:], query=query)
+        elif parts[0] == 'repos' and parts[3:5] == ['git', 'trees']:
+            self._github_tree()
+        elif len(parts) >= 4 and parts[2] == 'tar.gz':
+            self._github_archive(repository=parts[1], branch='/'.join(parts[3:]))
+        elif len(parts) >= 4:
+            self._github_file(file_path='/'.join(parts[3:]))
+        else:
+            self._send(404, b'Not Found')
+
+    def _throttled(self) -> bool:
+        """
+        Waits for the latency, then responds with an error instead of serving the request if it's throttled
+
+        Returns: True if the request was answered with an error
+        """
+        if self.git_server.latency:
+            time.sleep(self.git_server.latency)
+        throttled = self.git_server.throttle()
+        if throttled is None:
+            return False
+        status_code, headers = throttled
+        self._send(status_code, b'', headers=headers)
+        return True
+
+    def _github_file(self, file_path: str):
+        contents = self.git_server.read_file(file_path=file_path)
+        if contents is None:
+            self._send(404, b'404: Not Found')
+            return
+        etag = f'"{git_blob_id(contents=contents)}"'
+        if self.headers.get('If-None-Match') == etag:
+            self._send(304, b'', headers={'ETag': etag})
+            return
+        self._send(200, contents, headers={'ETag': etag, 'Content-Type': 'text/plain; charset=utf-8'})
+
+    def _github_archive(self, repository: str, branch: str):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+            for file_path, contents in self.git_server.list_files(folder_path='').items():
+                member = tarfile.TarInfo(name=f'{repository}-{branch}/{file_path}')
+                member.size = len(contents)
+                archive.addfile(member, io.BytesIO(contents))
+        self._send(200, buffer.getvalue(), headers={'Content-Type': 'application/x-gzip'})
+
+    def _github_tree(self):
+        tree = [{'path': file_path, 'type': 'blob', 'sha': git_blob_id(contents=contents)}
+                for file_path, contents in self.git_server.list_files(folder_path='').items()]
+        self._send_json({'tree': tree, 'truncated': False})
+
+    def _azure(self, parts: 'List[str]', query: 'Dict[str, str]'):
+        """
+        Serves the Azure DevOps REST API, where parts are the segments of the path after '_apis'
+        """
+        if parts == ['ResourceAreas'] or parts[:1] == ['ResourceAreas']:
+            # an empty list of resource areas makes the azure-devops package use the organization url for every area
+            self._send_json({'count': 0, 'value': []})
+        elif parts[:2] == ['git', 'repositories'] and parts[3:4] == ['items']:
+            self._azure_items(query=query)
+        elif parts[:2] == ['git', 'repositories'] and parts[3:4] == ['blobs'] and len(parts) == 5:
+            self._azure_blob(object_id=parts[4])
+        else:
+            self._send(404, b'Not Found')
+
+    def _azure_items(self, query: 'Dict[str, str]'):
+        accept = self.headers.get('Accept', '')
+        if 'scopePath' in query:
+            files = self.git_server.list_files(folder_path=query['scopePath'])
+            items = [_azure_item(file_path=file_path, contents=contents) for file_path, contents in files.items()]
+            self._send_json({'count': len(items), 'value': items})
+        elif 'application/zip' in accept:
+            folder_path = query.get('path', '').strip('/')
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, mode='w') as archive:
+                for file_path, contents in self.git_server.list_files(folder_path=folder_path).items():
+                    archive.writestr(file_path[len(folder_path):].lstrip('/'), contents)
+            self._send(200, buffer.getvalue(), headers={'Content-Type': 'application/zip'})
+        else:
+            file_path = query.get('path', '')
+            contents = self.git_server.read_file(file_path=file_path)
+            if contents is None:
+                self._send_json({'message': f'TF401174: The item \'{file_path}\' could not be found.'}, status_code=404)
+            elif accept.startswith('application/json'):
+                self._send_json(_azure_item(file_path=file_path, contents=contents))
+            else:
+                self._send(200, contents, headers={'Content-Type': 'application/octet-stream'})
+
+    def _azure_blob(self, object_id: str):
+        for contents in self.git_server.list_files(folder_path='').values():
+            if git_blob_id(contents=contents) == object_id:
+                self._send(200, contents, headers={'Content-Type': 'application/octet-stream'})
+                return
+        self._send_json({'message': f'TF401174: The blob \'{object_id}\' could not be found.'}, status_code=404)
+
+    def _send_json(self, body: 'Dict', status_code: int = 200):
+        self._send(status_code, json.dumps(body).encode('utf-8'),
+                   headers={'Content-Type': 'application/json; charset=utf-8'})
+
+    def _send(self, status_code: int, body: bytes, headers: 'Dict[str, str]' = None):
+        """
+        Sends the response, writing the body no faster than the server's bandwidth
+        """
+        self.git_server.count_status(status_code=status_code)
+        self.send_response(status_code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        bandwidth = self.git_server.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        # send the body in tenths of a second's worth of bytes
+        chunk_size = max(bandwidth // 10, 1)
+        for start in range(0, len(body), chunk_size):
+            self.wfile.write(body[start:start + chunk_size])
+            self.wfile.flush()
+            time.sleep(min(chunk_size, len(body) - start) / bandwidth)
+
+
+def _azure_item(file_path: str, contents: bytes) -> dict:
+    """
+    Describes a file the way the Azure Repos items endpoint does
+
+    Args:
+        file_path: the relative path to the file within the repo
+        contents: the contents of the file
+
+    Returns: a GitItem dictionary
+    """
+    return {'path': f'/{file_path.strip("/")}', 'objectId': git_blob_id(contents=contents), 'isFolder': False,
+            'gitObjectType': 'blob'}
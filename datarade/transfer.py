@@ -0,0 +1,714 @@
+"""
+This module moves the data for a dataset from its source database into a dataset container.
+
+The data is moved by a transfer engine. The bcp engine runs the bcp utility, and the DB-API engine reads rows from the
+source and inserts them into the target in large batches through sqlalchemy, which works on hosts without bcp and for
+databases that bcp doesn't support. The Arrow engine does the same through a typed, columnar file in between.
+
+With bcp, the data is dumped to a file under ~/bcp/data by default, which is loaded into the target once the dump has
+finished. bcp is run with a list of arguments rather than through a shell, so the same command line works on Windows
+and on POSIX operating systems. Alternatively, the data can be streamed through a named pipe, which runs the dump and
+the load at the same time and never writes the data to disk. Data files can also be compressed with gzip or zstd as
+they are written, by piping the dump through a compressor and the load through a decompressor. zstd requires the
+zstandard package, which is installed with the 'zstd' extra. Named pipes require a POSIX operating system, so the bcp
+engine refuses to stream or compress on Windows before any table is touched. The DB-API and Arrow engines compress
+their data files on every operating system.
+
+Large datasets can also be split into partitions, which are copied at the same time, and incremental datasets can be
+filtered down to the rows past a watermark.
+"""
+import abc
+import contextlib
+import datetime
+import decimal
+import errno
+import gzip
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import uuid
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+from sqlalchemy import column, inspect, table as table_clause, text, types
+
+from datarade import instrumentation
+
+# bcp is imported by copy(), so that it's only imported for copies between MS SQL Server databases
+if TYPE_CHECKING:
+    from bcp import BCP
+    from sqlalchemy.engine import Engine
+    from datarade import models
+
+DELIMITER = '|~|'
+BATCH_SIZE = 10000
+COMPRESSION_EXTENSIONS = {'gzip': 'gz', 'zstd': 'zst'}
+
+
+class AbstractTransferEngine(abc.ABC):
+
+    @abc.abstractmethod
+    def copy(self, query: str, source: 'models.Database', dataset_container: 'models.DatasetContainer',
+             table_name: str, username: str = None, password: str = None, stream: bool = False):
+        """
+        This copies the results of a query on the source database into a table in the dataset container.
+
+        Args:
+            query: the query whose results should be copied
+            source: the database to run the query on
+            dataset_container: the dataset container to load the data into
+            table_name: the one part name of the table to load the data into, which should already exist
+            username: a user with select/execute permissions on the source database objects
+            password: the password for the user
+            stream: stream the data instead of writing it to disk, where the engine writes to disk
+        """
+        raise NotImplementedError
+
+    def check(self, dataset_container: 'models.DatasetContainer', stream: bool = False):
+        """
+        This checks that the engine can copy data into the dataset container with these options, before any table in
+        it is created or changed. Every option is supported unless an engine overrides this.
+
+        Args:
+            dataset_container: the dataset container to load the data into
+            stream: stream the data instead of writing it to disk, where the engine writes to disk
+        """
+
+
+class BCPTransferEngine(AbstractTransferEngine):
+    """
+    Copies data with the bcp utility, which requires bcp to be installed and both databases to be MS SQL Server
+
+    Data files are written to the dataset container's spool directory, compressed with its compression. Streaming and
+    compression both run bcp against a named pipe, so they require a POSIX operating system.
+    """
+
+    def check(self, dataset_container: 'models.DatasetContainer', stream: bool = False):
+        if (stream or dataset_container.compression is not None) and not hasattr(os, 'mkfifo'):
+            print('Streaming and compressed data files require named pipes, which this operating system does not '
+                  'support. Use the DB-API or Arrow transfer engine to compress data files on this operating system.')
+            raise NotImplementedError('Streaming and compression with bcp require a POSIX operating system')
+
+    def copy(self, query: str, source: 'models.Database', dataset_container: 'models.DatasetContainer',
+             table_name: str, username: str = None, password: str = None, stream: bool = False):
+        copy(query=query, source=source.bcp(username=username, password=password), target=dataset_container.bcp,
+             table=dataset_container.database.full_table_name(table_name), stream=stream,
+             spool_dir=dataset_container.spool_dir, compression=dataset_container.compression)
+
+
+class DBAPITransferEngine(AbstractTransferEngine):
+    """
+    Copies data through sqlalchemy, fetching rows from the source and inserting them with executemany in batches
+
+    The rows are streamed from the source, so no more than one batch is held in memory, and the whole load is committed
+    in one transaction. pyodbc's fast_executemany is turned on for targets that use pyodbc.
+
+    Args:
+        batch_size: the number of rows to fetch and insert at a time
+    """
+
+    def __init__(self, batch_size: int = 10000):
+        self.batch_size = batch_size
+
+    def copy(self, query: str, source: 'models.Database', dataset_container: 'models.DatasetContainer',
+             table_name: str, username: str = None, password: str = None, stream: bool = False):
+        source_engine = source.sqlalchemy_engine(username=username, password=password)
+        with instrumentation.span('dbapi.copy', table=table_name) as dbapi_copy, \
+                source_engine.connect() as source_connection:
+            result = source_connection.execution_options(stream_results=True).execute(text(query))
+            batches = iter(lambda: result.fetchmany(self.batch_size), [])
+            dbapi_copy.attributes['rows'] = self._insert_batches(
+                dataset_container=dataset_container, table_name=table_name, column_names=list(result.keys()),
+                batches=([tuple(row) for row in rows] for rows in batches))
+
+    def _insert_batches(self, dataset_container: 'models.DatasetContainer', table_name: str,
+                        column_names: 'List[str]', batches: 'Iterable[List[tuple]]') -> int:
+        """
+        Inserts batches of rows into a table in the dataset container, in one transaction
+
+        Args:
+            dataset_container: the dataset container to load the data into
+            table_name: the one part name of the table to load the data into
+            column_names: the names of the columns, in the order of the values in each row
+            batches: the lists of rows to insert
+
+        Returns: the number of rows inserted
+        """
+        target_engine = dataset_container.metadata.bind
+        insert, parameter_names = self._insert_statement(engine=target_engine, table_name=table_name,
+                                                         schema_name=dataset_container.metadata.schema,
+                                                         column_names=column_names)
+        row_count = 0
+        target_connection = target_engine.raw_connection()
+        try:
+            cursor = target_connection.cursor()
+            if hasattr(cursor, 'fast_executemany'):
+                cursor.fast_executemany = True
+            for rows in batches:
+                if parameter_names is None:
+                    cursor.executemany(insert, rows)
+                else:
+                    cursor.executemany(insert, [dict(zip(parameter_names, row)) for row in rows])
+                row_count += len(rows)
+            cursor.close()
+            target_connection.commit()
+            return row_count
+        except Exception as e:
+            target_connection.rollback()
+            raise e
+        finally:
+            target_connection.close()
+
+    @staticmethod
+    def _insert_statement(engine: 'Engine', table_name: str, schema_name: 'Optional[str]',
+                          column_names: 'List[str]') -> 'Tuple[str, Optional[List[str]]]':
+        """
+        Builds an insert statement in the target database's DB-API parameter style
+
+        Args:
+            engine: the sqlalchemy Engine for the target database
+            table_name: the one part name of the table
+            schema_name: the name of the table's schema
+            column_names: the names of the columns to insert into, in the order of the source rows
+
+        Returns: a tuple of the insert statement and, for named parameter styles, the parameter names in column order
+        """
+        target_table = table_clause(table_name, *[column(column_name) for column_name in column_names],
+                                    schema=schema_name)
+        compiled = target_table.insert().compile(dialect=engine.dialect, column_keys=column_names)
+        if compiled.positional:
+            return str(compiled), None
+        return str(compiled), column_names
+
+
+class ArrowTransferEngine(DBAPITransferEngine):
+    """
+    Copies data through a typed, columnar file, written in the Arrow IPC or the Parquet format
+
+    The types of the columns in the file come from the table in the dataset container, which is built from the
+    dataset's fields, so numbers and dates are stored as numbers and dates rather than as delimited text. The rows are
+    fetched from the source in batches and written to the file, then the file is memory mapped and its batches are
+    inserted into the dataset container like the DB-API engine does. The file can be kept for auditing or for loading
+    again later.
+
+    The file is compressed with the dataset container's compression, which the Arrow IPC format only supports for zstd.
+    pyarrow is an optional dependency, which is installed with the 'arrow' extra.
+
+    Args:
+        file_format: the format of the intermediate file, one of: [arrow, parquet]
+        batch_size: the number of rows to fetch, write and insert at a time
+        spool_dir: the directory to write the intermediate files to, defaults to the dataset container's spool
+            directory, or ~/.datarade/spool if it doesn't have one
+        keep_files: keep the intermediate files after the load, instead of deleting them
+    """
+
+    def __init__(self, file_format: str = 'arrow', batch_size: int = 10000, spool_dir: str = None,
+                 keep_files: bool = False):
+        if file_format not in ('arrow', 'parquet'):
+            print(f'This file format is not supported: {file_format}')
+            raise ValueError(f'Unsupported file format: {file_format}')
+        super().__init__(batch_size=batch_size)
+        self.file_format = file_format
+        self.spool_dir = Path(spool_dir) if spool_dir else None
+        self.keep_files = keep_files
+
+    def copy(self, query: str, source: 'models.Database', dataset_container: 'models.DatasetContainer',
+             table_name: str, username: str = None, password: str = None, stream: bool = False):
+        spool_dir = self.spool_dir or dataset_container.spool_dir or Path.home() / Path('.datarade/spool')
+        spool_dir.mkdir(parents=True, exist_ok=True)
+        spool_file = spool_dir / Path(f'{table_name}_{uuid.uuid4().hex}.{self.file_format}')
+        try:
+            with instrumentation.span('arrow.dump', table=table_name, file_format=self.file_format) as dump:
+                column_names = self.dump(query=query, source=source, dataset_container=dataset_container,
+                                         table_name=table_name, spool_file=spool_file, username=username,
+                                         password=password)
+                dump.attributes['bytes'] = spool_file.stat().st_size
+            with instrumentation.span('arrow.load', table=table_name, file_format=self.file_format,
+                                      bytes=dump.attributes['bytes']) as load:
+                load.attributes['rows'] = self.load(spool_file=spool_file, dataset_container=dataset_container,
+                                                    table_name=table_name, column_names=column_names)
+        finally:
+            if not self.keep_files and spool_file.exists():
+                with instrumentation.span('cleanup', table=table_name):
+                    spool_file.unlink()
+
+    def dump(self, query: str, source: 'models.Database', dataset_container: 'models.DatasetContainer',
+             table_name: str, spool_file: 'Path', username: str = None, password: str = None) -> 'List[str]':
+        """
+        Writes the results of a query on the source database to an intermediate file
+
+        Args:
+            query: the query whose results should be written
+            source: the database to run the query on
+            dataset_container: the dataset container with the table whose column types should be used
+            table_name: the one part name of the table whose column types should be used
+            spool_file: the path to write the file to
+            username: a user with select/execute permissions on the source database objects
+            password: the password for the user
+
+        Returns: the names of the columns in the file
+        """
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        target_types = self._arrow_types(dataset_container=dataset_container, table_name=table_name)
+        source_engine = source.sqlalchemy_engine(username=username, password=password)
+        with source_engine.connect() as source_connection:
+            result = source_connection.execution_options(stream_results=True).execute(text(query))
+            column_names = list(result.keys())
+            arrow_schema = pyarrow.schema([(column_name, target_types.get(column_name, pyarrow.string()))
+                                           for column_name in column_names])
+            compression = dataset_container.compression
+            if self.file_format == 'parquet':
+                writer = pyarrow.parquet.ParquetWriter(str(spool_file), arrow_schema,
+                                                       compression=compression or 'snappy')
+            elif compression in (None, 'zstd'):
+                writer = pyarrow.ipc.new_file(str(spool_file), arrow_schema,
+                                              options=pyarrow.ipc.IpcWriteOptions(compression=compression))
+            else:
+                print(f'The Arrow IPC format does not support this compression: {compression}')
+                raise ValueError(f'Unsupported compression for Arrow IPC files: {compression}')
+            with writer:
+                for rows in iter(lambda: result.fetchmany(self.batch_size), []):
+                    arrays = [pyarrow.array(_arrow_values(values=values, arrow_type=field.type), type=field.type)
+                              for values, field in zip(zip(*rows), arrow_schema)]
+                    writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=arrow_schema))
+        return column_names
+
+    def load(self, spool_file: 'Path', dataset_container: 'models.DatasetContainer', table_name: str,
+             column_names: 'List[str]') -> int:
+        """
+        Inserts the rows in an intermediate file into a table in the dataset container
+
+        Args:
+            spool_file: the path to the file
+            dataset_container: the dataset container to load the data into
+            table_name: the one part name of the table to load the data into
+            column_names: the names of the columns in the file
+
+        Returns: the number of rows inserted
+        """
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        # sqlite can't store decimals, but it converts numeric strings into numbers
+        convert = str if dataset_container.metadata.bind.dialect.name == 'sqlite' else None
+
+        def rows(record_batch: 'pyarrow.RecordBatch') -> 'List[tuple]':
+            columns = [column.to_pylist() for column in record_batch.columns]
+            if convert is not None:
+                columns = [[convert(value) if isinstance(value, decimal.Decimal) else value for value in values]
+                           for values in columns]
+            return list(zip(*columns))
+
+        with pyarrow.memory_map(str(spool_file)) as memory_map:
+            if self.file_format == 'parquet':
+                record_batches = pyarrow.parquet.ParquetFile(memory_map).iter_batches(batch_size=self.batch_size)
+            else:
+                reader = pyarrow.ipc.open_file(memory_map)
+                record_batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+            return self._insert_batches(dataset_container=dataset_container, table_name=table_name,
+                                        column_names=column_names,
+                                        batches=(rows(record_batch) for record_batch in record_batches))
+
+    @staticmethod
+    def _arrow_types(dataset_container: 'models.DatasetContainer', table_name: str) -> 'Dict[str, Any]':
+        """
+        Finds the Arrow type for each column of a table in the dataset container
+
+        Args:
+            dataset_container: the dataset container with the table
+            table_name: the one part name of the table
+
+        Returns: a dictionary of column names to pyarrow DataType objects
+        """
+        import pyarrow
+
+        type_lookup = {
+            types.Boolean: pyarrow.bool_(),
+            types.Date: pyarrow.date32(),
+            types.DateTime: pyarrow.timestamp('us'),
+            types.Time: pyarrow.time64('us'),
+            types.Float: pyarrow.float64(),
+            types.Integer: pyarrow.int64(),
+            types.String: pyarrow.string(),
+            types.Text: pyarrow.string(),
+        }
+        arrow_types = {}
+        for target_column in inspect(dataset_container.metadata.bind).get_columns(
+                table_name, schema=dataset_container.metadata.schema):
+            column_type = target_column['type']
+            if column_type._type_affinity is types.Numeric:
+                arrow_types[target_column['name']] = pyarrow.decimal128(column_type.precision or 38,
+                                                                        column_type.scale or 0)
+            else:
+                arrow_types[target_column['name']] = type_lookup.get(column_type._type_affinity, pyarrow.string())
+        return arrow_types
+
+
+def _arrow_values(values: 'Iterable[Any]', arrow_type: 'Any') -> 'List[Any]':
+    """
+    Converts values from the source database into values that pyarrow accepts for a type
+
+    Some drivers, like sqlite's, return dates as strings and decimals as floats.
+
+    Args:
+        values: the values of one column
+        arrow_type: the pyarrow DataType of the column
+
+    Returns: the converted values
+    """
+    import pyarrow
+
+    if pyarrow.types.is_decimal(arrow_type):
+        return [decimal.Decimal(str(value)) if isinstance(value, float) else value for value in values]
+    if pyarrow.types.is_timestamp(arrow_type):
+        return [datetime.datetime.fromisoformat(value) if isinstance(value, str) else value for value in values]
+    if pyarrow.types.is_date(arrow_type):
+        return [datetime.date.fromisoformat(value) if isinstance(value, str) else value for value in values]
+    if pyarrow.types.is_time(arrow_type):
+        return [datetime.time.fromisoformat(value) if isinstance(value, str) else value for value in values]
+    if pyarrow.types.is_string(arrow_type):
+        return [str(value) if value is not None and not isinstance(value, str) else value for value in values]
+    return list(values)
+
+
+def get_transfer_engine(source: 'models.Database', target: 'models.Database') -> 'AbstractTransferEngine':
+    """
+    Picks the transfer engine to use between two databases
+
+    Args:
+        source: the database to copy the data from
+        target: the database to copy the data to
+
+    Returns: a BCPTransferEngine when both databases are MS SQL Server and bcp is installed, otherwise a
+        DBAPITransferEngine
+    """
+    if source.driver == 'mssql' and target.driver == 'mssql' and shutil.which('bcp') is not None:
+        return BCPTransferEngine()
+    return DBAPITransferEngine()
+
+
+def copy(query: str, source: 'BCP', target: 'BCP', table: str, stream: bool = False, spool_dir: 'Path' = None,
+         compression: str = None):
+    """
+    Copies the results of a query on the source database into a table on the target database
+
+    Args:
+        query: the query whose results should be copied
+        source: a BCP object for the source database
+        target: a BCP object for the target database
+        table: the name of the table to load the data into
+        stream: stream the data through a named pipe instead of a data file
+        spool_dir: the directory to write the data file to, defaults to ~/bcp/data
+        compression: compress the data file, one of: [gzip, zstd]
+    """
+    from bcp.config import BCP_DATA_DIR
+
+    if stream:
+        with instrumentation.span('bcp.stream', table=table):
+            run_through_pipe(dump=lambda pipe: bcp_dump(bcp=source, query=query, data_file_path=pipe),
+                             load=lambda pipe: bcp_load(bcp=target, table=table, data_file_path=pipe))
+        return
+    spool_dir = spool_dir or BCP_DATA_DIR
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    # bcp names default data files after the current time, which is not unique across concurrent copies
+    data_file_path = spool_dir / Path(f'{uuid.uuid4().hex}.dat')
+    if compression is None:
+        with instrumentation.span('bcp.dump', table=table) as dump:
+            bcp_dump(bcp=source, query=query, data_file_path=data_file_path)
+            dump.attributes['bytes'] = data_file_path.stat().st_size
+        with instrumentation.span('bcp.load', table=table, bytes=dump.attributes['bytes']):
+            bcp_load(bcp=target, table=table, data_file_path=data_file_path)
+    else:
+        # bcp can only read and write plain text, so the compression happens on the other end of a named pipe
+        data_file_path = data_file_path.with_suffix(f'.dat.{COMPRESSION_EXTENSIONS.get(compression, compression)}')
+        with instrumentation.span('bcp.dump', table=table, compression=compression) as dump:
+            run_through_pipe(dump=lambda pipe: bcp_dump(bcp=source, query=query, data_file_path=pipe),
+                             load=lambda pipe: _compress(pipe=pipe, data_file_path=data_file_path,
+                                                         compression=compression))
+            dump.attributes['bytes'] = data_file_path.stat().st_size
+        with instrumentation.span('bcp.load', table=table, compression=compression, bytes=dump.attributes['bytes']):
+            run_through_pipe(dump=lambda pipe: _decompress(data_file_path=data_file_path, pipe=pipe,
+                                                           compression=compression),
+                             load=lambda pipe: bcp_load(bcp=target, table=table, data_file_path=pipe))
+    with instrumentation.span('cleanup', table=table):
+        data_file_path.unlink()
+
+
+def bcp_dump(bcp: 'BCP', query: str, data_file_path: 'Path'):
+    """
+    Runs bcp to write the results of a query to a data file or a named pipe
+
+    Args:
+        bcp: a BCP object for the source database
+        query: the query whose results should be written
+        data_file_path: the path to the data file or named pipe
+    """
+    _run_bcp(bcp=bcp, arguments=[query, 'queryout', str(data_file_path)])
+
+
+def bcp_load(bcp: 'BCP', table: str, data_file_path: 'Path'):
+    """
+    Runs bcp to load a data file or a named pipe into a table, writing rejected rows to an error file in ~/bcp/data
+
+    Args:
+        bcp: a BCP object for the target database
+        table: the name of the table to load the data into
+        data_file_path: the path to the data file or named pipe
+    """
+    from bcp.config import BCP_DATA_DIR
+
+    error_file_path = BCP_DATA_DIR / Path(f'{uuid.uuid4().hex}.err')
+    _run_bcp(bcp=bcp, arguments=[table, 'in', str(data_file_path), '-b', str(BATCH_SIZE), '-e', str(error_file_path)])
+
+
+def _run_bcp(bcp: 'BCP', arguments: 'List[str]'):
+    """
+    Runs bcp with a list of arguments instead of a command string, so that it runs without a shell on every operating
+    system and arguments with spaces or quotes are passed through as they are
+
+    The bcp package only runs a command string, which POSIX operating systems treat as the name of a program. Its
+    connection details are used here instead, with the same options: character data, the datarade delimiter and a log
+    file in ~/bcp/logs.
+
+    Args:
+        bcp: a BCP object holding the connection details of the database
+        arguments: the arguments that come before the connection and format options
+    """
+    from bcp.config import BCP_LOGGING_DIR
+
+    connection = bcp.connection
+    server = f'{connection.host},{connection.port}' if connection.port else connection.host
+    if connection.auth.type == 'Trusted':
+        auth = ['-T']
+    else:
+        auth = ['-U', connection.auth.username, '-P', connection.auth.password]
+    log_file_path = BCP_LOGGING_DIR / Path(f'{uuid.uuid4().hex}.log')
+    command = ['bcp', *arguments, '-S', server, *auth, '-c', '-t', DELIMITER, '-o', str(log_file_path)]
+    return_code = subprocess.run(command).returncode
+    if return_code != 0:
+        print(f'bcp failed with exit code {return_code}, see the log file: {log_file_path}')
+        # the command is left out of the exception, since it holds the password
+        raise subprocess.CalledProcessError(returncode=return_code, cmd=['bcp', *arguments[:2]])
+
+
+def open_data_file(data_file_path: 'Path', mode: str, compression: str = None) -> 'BinaryIO':
+    """
+    Opens a data file, compressing what's written to it and decompressing what's read from it
+
+    Args:
+        data_file_path: the path to the data file
+        mode: the mode to open the file in, one of: [rb, wb]
+        compression: the compression of the file, one of: [gzip, zstd]
+
+    Returns: a binary file object
+    """
+    if compression is None:
+        return open(data_file_path, mode)
+    if compression == 'gzip':
+        return gzip.open(data_file_path, mode, compresslevel=1)  # the fastest level keeps up with bcp
+    if compression == 'zstd':
+        import zstandard
+
+        return zstandard.open(data_file_path, mode)
+    print(f'This compression is not supported: {compression}')
+    raise ValueError(f'Unsupported compression: {compression}')
+
+
+def _compress(pipe: 'Path', data_file_path: 'Path', compression: str):
+    """
+    Reads everything written to the pipe into a compressed data file
+
+    Args:
+        pipe: the path to the named pipe
+        data_file_path: the path to the data file
+        compression: the compression of the data file
+    """
+    with open(pipe, 'rb') as reader, open_data_file(data_file_path, 'wb', compression=compression) as writer:
+        shutil.copyfileobj(reader, writer, length=1024 * 1024)
+
+
+def _decompress(data_file_path: 'Path', pipe: 'Path', compression: str):
+    """
+    Writes the contents of a compressed data file to the pipe
+
+    Args:
+        data_file_path: the path to the data file
+        pipe: the path to the named pipe
+        compression: the compression of the data file
+    """
+    with open_data_file(data_file_path, 'rb', compression=compression) as reader, open(pipe, 'wb') as writer:
+        shutil.copyfileobj(reader, writer, length=1024 * 1024)
+
+
+def partition_queries(query: str, partition: 'models.Partition',
+                      engine: 'Engine') -> 'Tuple[List[str], int]':
+    """
+    Splits a query into one query for each partition, and counts the rows that the whole query returns
+
+    For a key column partition, the range of the key column and the row count are found with a single query against
+    the source. The query is used as a derived table, so it can't contain an order by clause or a common table
+    expression.
+
+    Args:
+        query: the query that defines the dataset
+        partition: the Partition object that describes how to split the dataset
+        engine: a sqlalchemy Engine for the source database
+
+    Returns: a tuple of the list of partition queries and the number of rows returned by the whole query
+    """
+    with engine.connect() as connection:
+        if partition.predicates is not None:
+            predicates = partition.predicates
+            row_count = connection.execute(text(f'select count(*) from ({query}) as dataset')).scalar()
+        else:
+            minimum, maximum, row_count = connection.execute(text(
+                f'select min({partition.column}), max({partition.column}), count(*) from ({query}) as dataset'
+            )).fetchone()
+            if row_count == 0 or minimum is None:
+                predicates = ['1 = 1']
+            else:
+                predicates = partition.range_predicates(minimum=minimum, maximum=maximum)
+    return [f'select * from ({query}) as dataset where {predicate}' for predicate in predicates], row_count
+
+
+def incremental_query(query: str, column_name: str, watermark: 'Any', inclusive: bool = False) -> str:
+    """
+    Filters a query down to the rows past a watermark
+
+    The watermark is written into the query as a literal, since bcp does not take query parameters.
+
+    Args:
+        query: the query that defines the dataset
+        column_name: the watermark column of the dataset
+        watermark: the highest value of the watermark column that has already been loaded
+        inclusive: also return the rows that are at the watermark
+
+    Returns: the filtered query
+    """
+    operator = '>=' if inclusive else '>'
+    return f'select * from ({query}) as dataset where {column_name} {operator} {_sql_literal(watermark)}'
+
+
+def _sql_literal(value: 'Any') -> str:
+    """
+    Writes a watermark value as a sql literal
+
+    Args:
+        value: a number, string, date or datetime
+
+    Returns: the sql literal
+    """
+    if isinstance(value, datetime.datetime):
+        # datetime columns only hold milliseconds, and sql server won't convert a longer literal to a datetime
+        timespec = 'milliseconds' if value.microsecond % 1000 == 0 else 'microseconds'
+        return f"'{value.isoformat(sep=' ', timespec=timespec)}'"
+    if isinstance(value, (datetime.date, datetime.time)):
+        return f"'{value.isoformat()}'"
+    if isinstance(value, str):
+        escaped = value.replace("'", "''")
+        return f"'{escaped}'"
+    return str(value)
+
+
+def copy_partitions(queries: 'List[str]', copy_query: 'Callable[[str], None]', parallelism: int = None):
+    """
+    Copies the results of several queries into the same table at the same time
+
+    Args:
+        queries: the queries whose results should be copied
+        copy_query: a callable that copies the results of one query
+        parallelism: the maximum number of queries to copy at the same time, defaults to all of them
+    """
+    parallelism = parallelism or len(queries)
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='datarade_partition') as executor:
+        copies = [instrumentation.submit(executor, copy_query, query) for query in queries]
+        for partition_copy in copies:
+            partition_copy.result()
+
+
+@contextlib.contextmanager
+def named_pipe() -> 'Iterator[Path]':
+    """
+    Creates a named pipe in a new temporary directory, and removes both when the context exits
+
+    Returns: the path to the named pipe
+    """
+    if not hasattr(os, 'mkfifo'):
+        print('Named pipes are not supported on this operating system.')
+        raise NotImplementedError('Named pipes require a POSIX operating system')
+    pipe_dir = Path(tempfile.mkdtemp(prefix='datarade_'))
+    pipe = pipe_dir / Path('data.pipe')
+    try:
+        os.mkfifo(pipe, mode=0o600)
+        yield pipe
+    finally:
+        shutil.rmtree(pipe_dir, ignore_errors=True)
+
+
+def run_through_pipe(dump: 'Callable[[Path], None]', load: 'Callable[[Path], None]'):
+    """
+    Runs a dump that writes to a named pipe and a load that reads from it at the same time
+
+    If either side fails, the other end of the pipe is opened and closed on its behalf so that the side that is still
+    running sees the end of the data (or a reader that drains it) instead of waiting on the pipe forever. Data that was
+    loaded before a failure is left in place, just like a failed load from a data file.
+
+    Args:
+        dump: a callable that writes all of the data to the pipe that it's passed
+        load: a callable that reads all of the data from the pipe that it's passed
+    """
+    with named_pipe() as pipe:
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='datarade_pipe') as executor:
+            dumped = instrumentation.submit(executor, dump, pipe)
+            loaded = instrumentation.submit(executor, load, pipe)
+            wait([dumped, loaded], return_when=FIRST_EXCEPTION)
+            if dumped.done() and dumped.exception() is not None:
+                _close_writer(pipe=pipe, reader=loaded)
+            if loaded.done() and loaded.exception() is not None:
+                _drain_reader(pipe=pipe, writer=dumped)
+            dumped.result()
+            loaded.result()
+
+
+def _close_writer(pipe: 'Path', reader: 'Future'):
+    """
+    Opens and closes the write end of the pipe, which tells a waiting reader that there is no more data
+
+    Args:
+        pipe: the path to the named pipe
+        reader: the Future of the reader, nothing is done once it has finished
+    """
+    while not reader.done():
+        try:
+            os.close(os.open(pipe, os.O_WRONLY | os.O_NONBLOCK))
+        except OSError as e:
+            if e.errno != errno.ENXIO:  # ENXIO means the reader has not opened the pipe yet
+                raise e
+        time.sleep(0.1)
+
+
+def _drain_reader(pipe: 'Path', writer: 'Future'):
+    """
+    Reads and discards everything that is written to the pipe until the writer finishes
+
+    Args:
+        pipe: the path to the named pipe
+        writer: the Future of the writer
+    """
+    file_descriptor = os.open(pipe, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        while not writer.done():
+            try:
+                if not os.read(file_descriptor, 65536):
+                    time.sleep(0.1)
+            except BlockingIOError:
+                time.sleep(0.1)
+    finally:
+        os.close(file_descriptor)
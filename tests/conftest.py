@@ -1,9 +1,19 @@
 from pathlib import Path
 import sys
 
+import pytest
+
 PACKAGE_ROOT = Path(__file__).parent
 PROJECT_ROOT = PACKAGE_ROOT.parent
 
 sys.path.insert(0, str(PROJECT_ROOT.absolute()))
 
-from datarade import services, git_client, models, schemas
+from datarade import services, git_client, models, schemas, cache, transfer, scheduler, instrumentation
+
+
+@pytest.fixture
+def recorded_spans() -> list:
+    spans = []
+    instrumentation.add_listener(spans.append)
+    yield spans
+    instrumentation.remove_listener(spans.append)
@@ -1,3 +1,5 @@
+import requests
+
 from tests.conftest import git_client, models
 
 
@@ -6,7 +8,21 @@ class FakeGitClient(git_client.AbstractGitClient):
     files = {}
 
     def get_file_contents(self, file_path: str) -> str:
-        return self.files[file_path]
+        self.requested_files = getattr(self, 'requested_files', []) + [file_path]
+        if file_path not in self.files:
+            raise FileNotFoundError(file_path)
+        if isinstance(self.files[file_path], Exception):
+            raise self.files[file_path]
+        return git_client.decode_contents(contents=self.files[file_path])
+
+    def list_files(self, folder_path: str) -> dict:
+        return {file_path: git_client.git_blob_id(file_contents) for file_path, file_contents in self.files.items()
+                if file_path.startswith(f'{folder_path}/')}
+
+    def get_archive(self, folder_path: str) -> dict:
+        self.archive_requests = getattr(self, 'archive_requests', 0) + 1
+        return {file_path: file_contents for file_path, file_contents in self.files.items()
+                if file_path.startswith(f'{folder_path}/')}
 
     def add(self, file_path: str, file_contents: str):
         self.files.update({file_path: bytes(file_contents, encoding='utf8')})
@@ -15,17 +31,87 @@ class FakeGitClient(git_client.AbstractGitClient):
         self.files = {}
 
 
+class FakeResponse:
+
+    def __init__(self, status_code: int, content: bytes, headers: dict = None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} Error', response=self)
+
+
+class FakeSession:
+
+    def __init__(self, responses: list):
+        self.responses = responses
+        self.requests = []
+
+    def get(self, url: str, headers: dict = None, timeout: float = None) -> 'FakeResponse':
+        self.requests.append(headers)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class FakeAzureReposGitClient:
+
+    def __init__(self, chunks: list):
+        self.chunks = chunks
+
+    def get_item_content(self, **kwargs):
+        return iter(self.chunks)
+
+
+class FakeAsyncGitClient(git_client.AsyncGitClient):
+
+    def __init__(self, files: dict):
+        self.files = files
+
+    async def get_file_contents(self, file_path: str) -> str:
+        if file_path not in self.files:
+            raise FileNotFoundError(file_path)
+        return git_client.decode_contents(contents=self.files[file_path])
+
+
+class FakeAsyncResponse(FakeResponse):
+
+    @property
+    def status(self) -> int:
+        return self.status_code
+
+    async def read(self) -> bytes:
+        return self.content
+
+    async def __aenter__(self) -> 'FakeAsyncResponse':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
 class FakeDatasetCatalog(models.DatasetCatalog):
 
     def _get_git_client(self, platform: str = None) -> 'FakeGitClient':
-        return FakeGitClient()
+        self.fake_git = FakeGitClient()
+        return self.fake_git
 
     def add(self, dataset: dict):
         dataset_name = dataset['name']
         config_file = str(dataset['config'])
         definition_file = str(dataset['definition'])
-        self.git.add(file_path=f'catalog/{dataset_name}/config.yaml', file_contents=config_file)
-        self.git.add(file_path=f'catalog/{dataset_name}/definition.sql', file_contents=definition_file)
+        self.fake_git.add(file_path=f'catalog/{dataset_name}/config.yaml', file_contents=config_file)
+        self.fake_git.add(file_path=f'catalog/{dataset_name}/definition.sql', file_contents=definition_file)
 
     def reset(self):
-        self.git.reset()
+        self.fake_git.reset()
+
+
+class FakeAsyncDatasetCatalog(models.AsyncDatasetCatalog):
+
+    def _get_git_client(self, platform: str = None) -> 'FakeAsyncGitClient':
+        return FakeAsyncGitClient(files={})
+
@@ -1,6 +1,9 @@
+import os
+import shutil
+
 import pytest
 
-from tests.conftest import services, schemas
+from tests.conftest import services, schemas, transfer
 from tests.infrastructure import TestSchema
 
 ORGANIZATION = 'fivestack'
@@ -101,3 +104,14 @@ class TestSQLServer:
         services.write_dataset(dataset=fake_dataset, dataset_container=self.dataset_container, password=password)
         assert self.schema.table_exists(table_name=table_name)
         assert self.schema.get_table_record_count(table_name=table_name) > 0
+
+    @pytest.mark.skipif(shutil.which('bcp') is None or not hasattr(os, 'mkfifo'),
+                        reason='requires bcp and named pipes')
+    @pytest.mark.parametrize('stream,compression', [(False, None), (True, None), (False, 'gzip')])
+    def test_write_dataset_with_bcp(self, stream: bool, compression: str):
+        dataset_container = services.get_dataset_container(**test_database_config,
+                                                           transfer_engine=transfer.BCPTransferEngine(),
+                                                           compression=compression)
+        fake_dataset = schemas.DatasetSchema().load(dataset_base)
+        services.write_dataset(dataset=fake_dataset, dataset_container=dataset_container, stream=stream)
+        assert self.schema.get_table_record_count(table_name=dataset_base['name']) > 0
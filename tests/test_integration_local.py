@@ -0,0 +1,493 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+import requests
+import sqlalchemy
+
+from tests.conftest import services, git_client, cache, models, schemas, transfer
+from benchmarks import imports as import_benchmarks, run as benchmarks
+from datarade.testing import git_server
+
+requires_git = pytest.mark.skipif(shutil.which('git') is None, reason='git is not installed')
+requires_named_pipes = pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='named pipes require a POSIX system')
+
+
+@pytest.fixture
+def catalog_repo(tmp_path) -> 'Path':
+    dataset_dir = tmp_path / 'catalog' / 'my_dataset'
+    dataset_dir.mkdir(parents=True)
+    (dataset_dir / 'config.yaml').write_text(str({'name': 'my_dataset', 'fields': []}))
+    (dataset_dir / 'definition.sql').write_text('select my_dataset')
+    return tmp_path
+
+
+@pytest.fixture
+def local_catalog_repo(catalog_repo: 'Path') -> str:
+    git = ['git', '-C', str(catalog_repo), '-c', 'user.name=pytest', '-c', 'user.email=pytest@example.com']
+    subprocess.run(git[:3] + ['init', '-q', '-b', 'master'], check=True)
+    subprocess.run(git + ['add', '.'], check=True)
+    subprocess.run(git + ['commit', '-q', '-m', 'add my_dataset'], check=True)
+    (catalog_repo / 'catalog' / 'my_dataset' / 'definition.sql').write_text('select my_uncommitted_dataset')
+    return str(catalog_repo)
+
+
+@requires_git
+@pytest.mark.parametrize('branch,definition', [('master', 'select my_dataset'),
+                                               (None, 'select my_uncommitted_dataset')])
+def test_get_dataset_from_local_dataset_catalog(local_catalog_repo: str, branch: str, definition: str):
+    dataset_catalog = services.get_dataset_catalog(repository=local_catalog_repo, organization='', platform='local',
+                                                   branch=branch)
+    dataset = services.get_dataset(dataset_catalog=dataset_catalog, dataset_name='my_dataset')
+    assert dataset.definition == definition
+    with pytest.raises(FileNotFoundError):
+        dataset_catalog.git.get_file_contents('catalog/my_dataset/actual.sql')
+    assert sorted(dataset_catalog.git.get_archive(folder_path='catalog')) == ['catalog/my_dataset/config.yaml',
+                                                                            'catalog/my_dataset/definition.sql']
+
+
+@requires_git
+def test_local_git_client_stops_its_git_process(local_catalog_repo: str):
+    spaced_path = Path(local_catalog_repo) / 'catalog' / 'my dataset' / 'definition.sql'
+    spaced_path.parent.mkdir()
+    spaced_path.write_text('select my spaced dataset')
+    git = ['git', '-C', local_catalog_repo, '-c', 'user.name=pytest', '-c', 'user.email=pytest@example.com']
+    subprocess.run(git + ['add', '.'], check=True)
+    subprocess.run(git + ['commit', '-q', '-m', 'add my dataset'], check=True)
+    with services.get_dataset_catalog(repository=local_catalog_repo, organization='', platform='local') as catalog:
+        assert catalog.git.get_file_contents('catalog/my dataset/definition.sql') == 'select my spaced dataset'
+        with pytest.raises(FileNotFoundError):
+            catalog.git.get_file_contents('catalog/my dataset/actual.sql')
+        process = catalog.git._process
+    assert process.poll() is not None
+    client = git_client.LocalGitClient(repository=local_catalog_repo, branch='master')
+    client.get_file_contents('catalog/my_dataset/config.yaml')
+    process = client._process
+    del client
+    assert process.poll() is not None
+
+
+@requires_git
+def test_local_git_client_blob_ids_match_git(local_catalog_repo: str):
+    committed = git_client.LocalGitClient(repository=local_catalog_repo, branch='master')
+    working_tree = git_client.LocalGitClient(repository=local_catalog_repo)
+    committed_files = committed.list_files(folder_path='catalog')
+    working_tree_files = working_tree.list_files(folder_path='catalog')
+    assert committed_files['catalog/my_dataset/config.yaml'] == working_tree_files['catalog/my_dataset/config.yaml']
+    assert committed_files['catalog/my_dataset/definition.sql'] == git_client.git_blob_id(b'select my_dataset')
+
+
+@requires_named_pipes
+def test_run_through_pipe():
+    rows = [f'{i}|~|row {i}\n' for i in range(10000)]
+    loaded_rows = []
+
+    def dump(pipe):
+        with open(pipe, 'w') as data_file:
+            data_file.writelines(rows)
+
+    def load(pipe):
+        with open(pipe) as data_file:
+            loaded_rows.extend(data_file)
+
+    transfer.run_through_pipe(dump=dump, load=load)
+    assert loaded_rows == rows
+
+
+@requires_named_pipes
+def test_run_through_pipe_releases_the_reader_when_the_dump_fails():
+    def dump(pipe):
+        raise RuntimeError('bcp failed to connect to the source')
+
+    def load(pipe):
+        with open(pipe) as data_file:
+            data_file.read()
+
+    with pytest.raises(RuntimeError):
+        transfer.run_through_pipe(dump=dump, load=load)
+
+
+@pytest.mark.parametrize('partition', [models.Partition(column='id', count=4),
+                                       models.Partition(column='id', count=50),
+                                       models.Partition(predicates=['id < 10', 'id >= 10 or id is null'])])
+def test_partition_queries_select_every_row_once(partition: 'models.Partition'):
+    engine = sqlalchemy.create_engine('sqlite://')
+    with engine.connect() as connection:
+        connection.execute(sqlalchemy.text('create table source (id integer, name text)'))
+        for i in list(range(3, 26)) + [None]:
+            connection.execute(sqlalchemy.text('insert into source values (:id, :name)'), {'id': i, 'name': f'{i}'})
+        queries, row_count = transfer.partition_queries(query='select id, name from source', partition=partition,
+                                                        engine=engine)
+        rows = [tuple(row) for query in queries for row in connection.execute(sqlalchemy.text(query))]
+    assert row_count == 24
+    assert len(rows) == 24
+    assert len(set(rows)) == 24
+
+
+@pytest.fixture
+def sqlite_container(tmp_path) -> 'models.DatasetContainer':
+    dataset_container = services.get_dataset_container(driver='sqlite', database_name=str(tmp_path / 'datarade.db'))
+    with dataset_container.metadata.bind.begin() as connection:
+        connection.execute(sqlalchemy.text('create table source (id integer, name text, modified integer)'))
+        connection.execute(sqlalchemy.text("insert into source values (1, 'a', 1), (2, 'b', 1)"))
+    return dataset_container
+
+
+def generate_sqlite_dataset(dataset_container: 'models.DatasetContainer', incremental: dict = None) -> 'models.Dataset':
+    dataset = {
+        'name': 'my_dataset',
+        'definition': 'select id, name, modified from source',
+        'fields': [{'name': 'id', 'type': 'Integer'}, {'name': 'name', 'type': 'String'},
+                   {'name': 'modified', 'type': 'Integer'}],
+        'database': {'driver': 'sqlite', 'database_name': dataset_container.database.database_name},
+    }
+    if incremental is not None:
+        dataset['incremental'] = incremental
+    return schemas.DatasetSchema().load(dataset)
+
+
+@pytest.mark.parametrize('incremental,expected_rows', [
+    ({'watermark': 'modified'}, [(1, 'a', 1), (2, 'b', 1), (2, 'b2', 2), (3, 'c', 2)]),
+    ({'watermark': 'modified', 'strategy': 'merge', 'key': ['id']}, [(1, 'a', 1), (2, 'b2', 2), (3, 'c', 2)]),
+])
+def test_write_incremental_dataset(sqlite_container: 'models.DatasetContainer', incremental: dict,
+                                   expected_rows: list):
+    dataset = generate_sqlite_dataset(dataset_container=sqlite_container, incremental=incremental)
+    services.write_dataset(dataset=dataset, dataset_container=sqlite_container)
+    with sqlite_container.metadata.bind.begin() as connection:
+        connection.execute(sqlalchemy.text("update source set name = 'b2', modified = 2 where id = 2"))
+        connection.execute(sqlalchemy.text("insert into source values (3, 'c', 2)"))
+    services.write_dataset(dataset=dataset, dataset_container=sqlite_container)
+    rows = sqlite_container.metadata.bind.execute(sqlalchemy.text('select * from my_dataset')).fetchall()
+    assert sorted(tuple(row) for row in rows) == expected_rows
+
+
+def test_write_dataset_skips_unchanged_datasets(sqlite_container: 'models.DatasetContainer', monkeypatch):
+    dataset = generate_sqlite_dataset(dataset_container=sqlite_container)
+    probe_results = iter([[(1,)], [(1,)], [(2,)]])
+    monkeypatch.setattr(dataset, 'probe_source', lambda username=None, password=None: next(probe_results))
+    written = [services.write_dataset(dataset=dataset, dataset_container=sqlite_container, skip_unchanged=True)
+               for _ in range(3)]
+    assert written == [True, False, True]
+    sqlite_container.metadata.bind.execute(sqlalchemy.text('drop table my_dataset'))
+    monkeypatch.setattr(dataset, 'probe_source', lambda username=None, password=None: [(2,)])
+    assert services.write_dataset(dataset=dataset, dataset_container=sqlite_container, skip_unchanged=True)
+
+
+def test_write_dataset_never_skips_incremental_datasets_without_a_change_probe(
+        sqlite_container: 'models.DatasetContainer'):
+    dataset = generate_sqlite_dataset(dataset_container=sqlite_container, incremental={'watermark': 'modified'})
+    assert services.write_dataset(dataset=dataset, dataset_container=sqlite_container, skip_unchanged=True)
+    with sqlite_container.metadata.bind.begin() as connection:
+        connection.execute(sqlalchemy.text("insert into source values (3, 'c', 2)"))
+    assert services.write_dataset(dataset=dataset, dataset_container=sqlite_container, skip_unchanged=True)
+    assert sqlite_container.count_rows(table_name='my_dataset') == 3
+
+
+def test_dataset_fingerprint_changes_with_definition_fields_and_probe(sqlite_container: 'models.DatasetContainer'):
+    dataset = generate_sqlite_dataset(dataset_container=sqlite_container)
+    fingerprint = dataset.fingerprint(probe_result=[(1,)])
+    assert dataset.fingerprint(probe_result=[(1,)]) == fingerprint
+    assert dataset.fingerprint(probe_result=[(2,)]) != fingerprint
+    dataset.fields = dataset.fields[:2]
+    assert dataset.fingerprint(probe_result=[(1,)]) != fingerprint
+
+
+def test_write_datasets_creates_every_table_in_one_transaction(sqlite_container: 'models.DatasetContainer'):
+    datasets = [generate_sqlite_dataset(dataset_container=sqlite_container) for _ in range(3)]
+    for dataset, dataset_name in zip(datasets, ['first', 'second', 'third']):
+        dataset.name = dataset_name
+    engine = sqlite_container.metadata.bind
+    transactions = []
+    creates = []
+    sqlalchemy.event.listen(engine, 'begin', lambda connection: transactions.append(connection))
+    sqlalchemy.event.listen(engine, 'before_cursor_execute', lambda connection, cursor, statement, *args: creates.append(
+        len(transactions)) if statement.lstrip().lower().startswith('create table') else None)
+    durations, errors = services.write_datasets(datasets=datasets, dataset_container=sqlite_container)
+    assert not errors
+    assert len(creates) == 3 and len(set(creates)) == 1
+    assert [sqlite_container.count_rows(table_name=dataset.name) for dataset in datasets] == [2, 2, 2]
+
+
+def test_write_dataset_swaps_in_the_staging_table(sqlite_container: 'models.DatasetContainer', monkeypatch):
+    dataset = generate_sqlite_dataset(dataset_container=sqlite_container)
+    services.write_dataset(dataset=dataset, dataset_container=sqlite_container, swap=True)
+    rows_during_load = []
+
+    copy = transfer.DBAPITransferEngine.copy
+
+    def copy_and_read(self, **kwargs):
+        rows_during_load.extend(sqlite_container.metadata.bind.execute(
+            sqlalchemy.text('select * from my_dataset')).fetchall())
+        copy(self, **kwargs)
+
+    monkeypatch.setattr(transfer.DBAPITransferEngine, 'copy', copy_and_read)
+    with sqlite_container.metadata.bind.begin() as connection:
+        connection.execute(sqlalchemy.text("insert into source values (3, 'c', 2)"))
+    services.write_dataset(dataset=dataset, dataset_container=sqlite_container, swap=True)
+    rows = sqlite_container.metadata.bind.execute(sqlalchemy.text('select * from my_dataset')).fetchall()
+    assert len(rows_during_load) == 2
+    assert len(rows) == 3
+    assert sqlalchemy.inspect(sqlite_container.metadata.bind).get_table_names() == ['my_dataset', 'source']
+
+
+def test_create_table_reconciles_an_existing_table(sqlite_container: 'models.DatasetContainer'):
+    dataset = schemas.DatasetSchema().load({
+        'name': 'my_dataset',
+        'definition': 'select 1',
+        'fields': [{'name': field_type.lower(), 'type': field_type} for field_type in
+                   ['Boolean', 'Date', 'DateTime', 'Time', 'Float', 'Integer', 'Numeric', 'String', 'Text']],
+    })
+    engine = sqlite_container.metadata.bind
+    statements = []
+    sqlalchemy.event.listen(engine, 'before_cursor_execute',
+                            lambda conn, cursor, statement, *args: statements.append(statement.split()[0].lower()))
+    sqlite_container.create_table(dataset=dataset)
+    engine.execute(sqlalchemy.text('insert into my_dataset (integer) values (1)'))
+    statements.clear()
+    sqlite_container.create_table(dataset=dataset)
+    assert 'delete' in statements
+    assert not {'create', 'drop', 'alter'} & set(statements)
+
+    dataset.fields.append(models.Field(name='added', type='Integer'))
+    engine.execute(sqlalchemy.text('insert into my_dataset (integer) values (1)'))
+    sqlite_container.create_table(dataset=dataset, replace=False)
+    assert engine.execute(sqlalchemy.text('select integer, added from my_dataset')).fetchall() == [(1, None)]
+
+    dataset.fields.reverse()
+    sqlite_container.create_table(dataset=dataset, replace=False)
+    columns = sqlalchemy.inspect(engine).get_columns('my_dataset')
+    assert [column['name'] for column in columns] == [field.name for field in dataset.fields]
+
+
+def test_write_partitioned_dataset_with_the_dbapi_transfer_engine(sqlite_container: 'models.DatasetContainer'):
+    sqlite_container.transfer_engine = transfer.DBAPITransferEngine(batch_size=7)
+    with sqlite_container.metadata.bind.begin() as connection:
+        connection.execute(sqlalchemy.text('insert into source values (:id, :name, 1)'),
+                           [{'id': i, 'name': f'row {i}'} for i in range(3, 100)])
+    dataset = generate_sqlite_dataset(dataset_container=sqlite_container)
+    dataset.partition = models.Partition(column='id', count=4)
+    services.write_dataset(dataset=dataset, dataset_container=sqlite_container)
+    assert sqlite_container.count_rows(table_name='my_dataset') == 99
+
+
+@pytest.mark.parametrize('file_format', ['arrow', 'parquet'])
+def test_write_dataset_with_the_arrow_transfer_engine(sqlite_container: 'models.DatasetContainer', tmp_path,
+                                                      file_format: str):
+    pyarrow = pytest.importorskip('pyarrow')
+    sqlite_container.transfer_engine = transfer.ArrowTransferEngine(file_format=file_format, batch_size=2,
+                                                                    spool_dir=str(tmp_path / 'spool'), keep_files=True)
+    with sqlite_container.metadata.bind.begin() as connection:
+        connection.execute(sqlalchemy.text('create table orders (id integer, amount numeric(18, 2), ordered datetime)'))
+        connection.execute(sqlalchemy.text("insert into orders values (1, 1.5, '2020-01-02 03:04:05.000000'), "
+                                           "(2, null, null), (3, 1000.25, '2020-02-03 04:05:06.000000')"))
+    dataset = schemas.DatasetSchema().load({
+        'name': 'my_dataset',
+        'definition': 'select id, amount, ordered from orders',
+        'fields': [{'name': 'id', 'type': 'Integer'}, {'name': 'amount', 'type': 'Numeric'},
+                   {'name': 'ordered', 'type': 'DateTime'}],
+        'database': {'driver': 'sqlite', 'database_name': sqlite_container.database.database_name},
+    })
+    services.write_dataset(dataset=dataset, dataset_container=sqlite_container)
+    rows = sqlite_container.metadata.bind.execute(sqlalchemy.text('select * from my_dataset order by id')).fetchall()
+    assert [tuple(row) for row in rows] == [(1, 1.5, '2020-01-02 03:04:05'), (2, None, None),
+                                            (3, 1000.25, '2020-02-03 04:05:06')]
+    spool_file, = (tmp_path / 'spool').iterdir()
+    if file_format == 'parquet':
+        arrow_schema = pytest.importorskip('pyarrow.parquet').read_schema(str(spool_file))
+    else:
+        arrow_schema = pyarrow.ipc.open_file(pyarrow.memory_map(str(spool_file))).schema
+    assert arrow_schema.field('amount').type == pyarrow.decimal128(18, 2)
+    assert arrow_schema.field('ordered').type == pyarrow.timestamp('us')
+
+
+# a stand-in for the bcp utility, which writes rows for 'queryout' and loads a data file or pipe for 'in'
+FAKE_BCP = """#!{python}
+import json, os, sys
+source, direction, data_file_path = sys.argv[1:4]
+spool_dir = os.environ['FAKE_BCP_SPOOL']
+spooled = [(name, os.path.getsize(os.path.join(spool_dir, name))) for name in sorted(os.listdir(spool_dir))]
+with open(os.environ['FAKE_BCP_CALLS'], 'a') as calls:
+    calls.write(json.dumps({{'argv': sys.argv[1:], 'spooled': spooled}}) + '\\n')
+if source == 'fail':
+    sys.exit(1)
+if direction == 'queryout':
+    with open(data_file_path, 'w') as data_file:
+        data_file.write(''.join(f'{{i}}|~|row {{i}}\\n' for i in range(10000)))
+else:
+    with open(data_file_path) as data_file, open(os.environ['FAKE_BCP_LOADED'], 'a') as loaded:
+        loaded.write(data_file.read())
+"""
+
+
+@pytest.fixture
+def fake_bcp(tmp_path, monkeypatch) -> 'Path':
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    (bin_dir / 'bcp').write_text(FAKE_BCP.format(python=sys.executable))
+    (bin_dir / 'bcp').chmod(0o755)
+    for directory in ('spool', 'logs'):
+        (tmp_path / directory).mkdir()
+    monkeypatch.setenv('PATH', os.pathsep.join([str(bin_dir), os.environ.get('PATH', '')]))
+    monkeypatch.setenv('FAKE_BCP_SPOOL', str(tmp_path / 'spool'))
+    monkeypatch.setenv('FAKE_BCP_CALLS', str(tmp_path / 'calls.jsonl'))
+    monkeypatch.setenv('FAKE_BCP_LOADED', str(tmp_path / 'loaded.dat'))
+    monkeypatch.setattr('bcp.config.BCP_DATA_DIR', tmp_path / 'spool')
+    monkeypatch.setattr('bcp.config.BCP_LOGGING_DIR', tmp_path / 'logs')
+    return tmp_path
+
+
+def fake_bcp_calls(fake_bcp: 'Path') -> 'List[dict]':
+    return [json.loads(line) for line in (fake_bcp / 'calls.jsonl').read_text().splitlines()]
+
+
+def bcp_for(username: str = None, password: str = None):
+    import bcp
+
+    return bcp.BCP(bcp.Connection(driver='mssql', host='my_host', port=1433, username=username, password=password))
+
+
+@requires_named_pipes
+@pytest.mark.parametrize('compression,extension', [(None, '.dat'), ('gzip', '.gz'), ('zstd', '.zst')])
+def test_copy_compresses_the_spooled_data_file(fake_bcp: 'Path', compression: str, extension: str):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    transfer.copy(query='select 1', source=bcp_for(), target=bcp_for(), table='my_table',
+                  spool_dir=fake_bcp / 'spool', compression=compression)
+    assert (fake_bcp / 'loaded.dat').read_text() == ''.join(f'{i}|~|row {i}\n' for i in range(10000))
+    dump, load = fake_bcp_calls(fake_bcp)
+    (spooled_file, size), = load['spooled']
+    assert Path(spooled_file).suffix == extension
+    assert size < len((fake_bcp / 'loaded.dat').read_text()) / 3 or compression is None
+    assert not list((fake_bcp / 'spool').glob('*.dat*'))
+
+
+@requires_named_pipes
+def test_copy_streams_bcp_through_a_named_pipe(fake_bcp: 'Path'):
+    transfer.copy(query='select 1', source=bcp_for(), target=bcp_for(username='my_user', password='my "pass word"'),
+                  table='my_schema.my_table', stream=True, spool_dir=fake_bcp / 'spool')
+    assert len((fake_bcp / 'loaded.dat').read_text().splitlines()) == 10000
+    calls = {call['argv'][1]: call for call in fake_bcp_calls(fake_bcp)}
+    dump, load = calls['queryout'], calls['in']
+    assert dump['argv'][:2] == ['select 1', 'queryout'] and '-T' in dump['argv']
+    assert load['argv'][:2] == ['my_schema.my_table', 'in'] and not load['spooled']
+    # the arguments reach bcp as they are, without a shell splitting them
+    assert load['argv'][3:] == ['-b', '10000', '-e', load['argv'][6], '-S', 'my_host,1433', '-U', 'my_user', '-P',
+                                'my "pass word"', '-c', '-t', '|~|', '-o', load['argv'][-1]]
+
+
+@requires_named_pipes
+def test_copy_reports_failed_bcp_runs_without_the_password(fake_bcp: 'Path'):
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        transfer.copy(query='fail', source=bcp_for(username='my_user', password='my_password'), target=bcp_for(),
+                      table='my_table', spool_dir=fake_bcp / 'spool')
+    assert 'my_password' not in str(error.value)
+
+
+@pytest.mark.parametrize('stream,compression', [(True, None), (False, 'gzip')])
+def test_bcp_refuses_to_stream_or_compress_without_named_pipes(sqlite_container: 'models.DatasetContainer',
+                                                                monkeypatch, stream: bool, compression: str):
+    monkeypatch.delattr(os, 'mkfifo', raising=False)
+    sqlite_container.transfer_engine = transfer.BCPTransferEngine()
+    sqlite_container.compression = compression
+    dataset = generate_sqlite_dataset(dataset_container=sqlite_container)
+    with pytest.raises(NotImplementedError):
+        services.write_dataset(dataset=dataset, dataset_container=sqlite_container, stream=stream)
+    assert not sqlite_container.has_table(table_name='my_dataset')
+
+
+def test_write_dataset_records_spans(sqlite_container: 'models.DatasetContainer', recorded_spans: list):
+    dataset = generate_sqlite_dataset(dataset_container=sqlite_container)
+    services.write_dataset(dataset=dataset, dataset_container=sqlite_container)
+    spans = {span.name: span for span in recorded_spans}
+    assert [span.name for span in recorded_spans] == ['container.ddl', 'dbapi.copy', 'write_dataset']
+    assert spans['dbapi.copy'].attributes['rows'] == 2
+    assert spans['dbapi.copy'].parent == 'write_dataset'
+    assert spans['dbapi.copy'].rows_per_second > 0
+    assert spans['write_dataset'].to_dict()['attributes']['dataset'] == 'my_dataset'
+
+
+def test_benchmarks_record_comparable_results(tmp_path):
+    report = benchmarks.main(['--sizes', '3', '--fields', '4', '--definition-lines', '10', '--sample', '2',
+                              '--rows', '20', '--repeat', '1', '--workdir', str(tmp_path),
+                              '--output', str(tmp_path / 'results.json')])
+    assert [(result['benchmark'], result['size']) for result in report['results']] == [
+        ('list_datasets', 3), ('get_dataset', 3), ('get_dataset.archive', 3), ('schema.load', 3),
+        ('field.sqlalchemy_column', 3), ('write_dataset', 20)]
+    assert report['results'][-1]['stages']['dbapi.copy'] > 0
+    comparisons = benchmarks.compare(baseline=json.loads((tmp_path / 'results.json').read_text()), current=report)
+    assert all(comparison['ratio'] == 1 for comparison in comparisons)
+
+
+@pytest.mark.parametrize('platform,archive', [('github', False), ('github', True), ('azure-devops', False),
+                                              ('azure-devops', True)])
+def test_git_server_stands_in_for_the_platform(catalog_repo, platform: str, archive: bool):
+    with git_server.GitServer(root=str(catalog_repo)) as server:
+        dataset_catalog = services.get_dataset_catalog(repository='datarade_test_catalog', organization='fivestack',
+                                                       platform=platform, project='datarade', username='user',
+                                                       password='password', archive=archive, indexed=True,
+                                                       base_url=server.url)
+        dataset = services.get_dataset(dataset_catalog=dataset_catalog, dataset_name='my_dataset')
+    assert dataset.definition == 'select my_dataset'
+
+
+def test_git_server_revalidates_cached_files(catalog_repo, tmp_path):
+    with git_server.GitServer(root=str(catalog_repo)) as server:
+        client = git_client.GitHubClient(repository='datarade_test_catalog', organization='fivestack',
+                                         branch='master', cache=cache.FileCache(cache_dir=str(tmp_path / 'cache')),
+                                         base_url=server.url)
+        contents = [client.get_file_contents(file_path='catalog/my_dataset/definition.sql') for _ in range(2)]
+    assert contents == ['select my_dataset'] * 2
+    assert server.status_counts == {200: 1, 304: 1}
+
+
+def test_git_server_injects_errors_rate_limits_and_latency(catalog_repo):
+    transport = git_client.HTTPTransport(max_retries=0)
+    with git_server.GitServer(root=str(catalog_repo), latency=0.05, rate_limit=1, rate_limit_window=60) as server:
+        client = git_client.GitHubClient(repository='datarade_test_catalog', organization='fivestack',
+                                         branch='master', transport=transport, base_url=server.url)
+        start = time.perf_counter()
+        client.get_file_contents(file_path='catalog/my_dataset/definition.sql')
+        assert time.perf_counter() - start >= 0.05
+        with pytest.raises(requests.HTTPError):
+            client.get_file_contents(file_path='catalog/my_dataset/definition.sql')
+    with git_server.GitServer(root=str(catalog_repo), error_rate=1.0) as server:
+        client = git_client.GitHubClient(repository='datarade_test_catalog', organization='fivestack',
+                                         branch='master', transport=transport, base_url=server.url)
+        with pytest.raises(requests.HTTPError):
+            client.get_file_contents(file_path='catalog/my_dataset/definition.sql')
+    assert server.status_counts == {503: 1}
+
+
+@pytest.mark.parametrize('scenario,unexpected_modules', [
+    ('import', ['asyncio', 'azure.devops', 'bcp', 'marshmallow', 'msrest', 'requests', 'sqlalchemy', 'yaml']),
+    ('github_catalog', ['asyncio', 'azure.devops', 'bcp', 'msrest', 'sqlalchemy']),
+    ('schema_load', ['asyncio', 'azure.devops', 'bcp', 'msrest', 'requests', 'sqlalchemy']),
+    ('sqlite_container', ['azure.devops', 'bcp', 'msrest', 'requests']),
+])
+def test_heavy_dependencies_are_imported_lazily(scenario: str, unexpected_modules: list):
+    timing = import_benchmarks.time_scenario(code=import_benchmarks.SCENARIOS[scenario])
+    assert not set(timing['modules']) & set(unexpected_modules)
+
+
+@pytest.mark.parametrize('submodule', ['cache', 'git_client', 'instrumentation', 'models', 'scheduler', 'schemas',
+                                       'services', 'testing', 'transfer'])
+def test_submodules_are_attributes_of_datarade(submodule: str):
+    # a new interpreter, since importing a submodule anywhere else would set the attribute already
+    code = f'import datarade\nassert datarade.{submodule}.__name__ == "datarade.{submodule}"\n' \
+           f'assert "{submodule}" in dir(datarade)'
+    subprocess.run([sys.executable, '-c', code], cwd=str(import_benchmarks.PROJECT_ROOT), check=True)
+
+
+def test_importing_datarade_prints_nothing():
+    code = 'import datarade\nfrom datarade import git_client, models, schemas, services'
+    result = subprocess.run([sys.executable, '-c', code], cwd=str(import_benchmarks.PROJECT_ROOT),
+                            stdout=subprocess.PIPE, check=True)
+    assert result.stdout == b''
+
@@ -1,7 +1,22 @@
+import asyncio
+import hashlib
+import io
+import os
+import sys
+import tarfile
+import threading
+import time
+import types
+from collections import Counter
+
+import marshmallow as ma
 import pytest
+import requests
+import sqlalchemy.dialects.mssql
 
-from tests.conftest import services, git_client
-from tests.fakes import FakeDatasetCatalog
+from tests.conftest import services, git_client, cache, models, schemas, instrumentation, transfer
+from tests.fakes import FakeAsyncDatasetCatalog, FakeAsyncResponse, FakeAzureReposGitClient, FakeDatasetCatalog, \
+    FakeResponse, FakeSession
 
 
 def generate_dataset(dataset_name: str, username: str = None) -> dict:
@@ -52,3 +67,512 @@ def test_get_dataset(dataset_config: dict):
     assert dataset.name == dataset_config['name']
     if dataset_config['config'].get('user', None) is not None:
         assert dataset.user.username == dataset_config['config']['user']['username']
+
+
+def test_file_cache_stores_identical_blobs_once(tmp_path):
+    file_cache = cache.FileCache(cache_dir=str(tmp_path))
+    file_cache.put('github/fivestack/catalog/uat/catalog/my_dataset/config.yaml', 'etag-1', b'name: my_dataset')
+    file_cache.put('github/fivestack/catalog/master/catalog/my_dataset/config.yaml', 'etag-1', b'name: my_dataset')
+    assert len(list(file_cache.blob_dir.iterdir())) == 1
+    assert file_cache.get('github/fivestack/catalog/master/catalog/my_dataset/config.yaml') == \
+        ('etag-1', b'name: my_dataset')
+    assert file_cache.get('github/fivestack/catalog/master/catalog/my_dataset/definition.sql') is None
+
+
+def test_file_cache_evicts_least_recently_used(tmp_path):
+    file_cache = cache.FileCache(cache_dir=str(tmp_path), max_size=10)
+    file_cache.put('first', 'v1', b'12345')
+    file_cache.put('second', 'v1', b'67890')
+    os.utime(file_cache.blob_dir / hashlib.sha256(b'12345').hexdigest(), (0, 0))
+    file_cache.put('third', 'v1', b'abcde')
+    assert file_cache.get('first') is None
+    assert file_cache.get('second') == ('v1', b'67890')
+    assert file_cache.get('third') == ('v1', b'abcde')
+
+
+def test_file_cache_skips_files_larger_than_the_cache(tmp_path):
+    file_cache = cache.FileCache(cache_dir=str(tmp_path), max_size=10)
+    file_cache.put('first', 'v1', b'12345')
+    file_cache.put('first', 'v2', b'0123456789abcdef')
+    assert file_cache.get('first') is None
+    file_cache.put('second', 'v1', b'67890')
+    (file_cache.blob_dir / hashlib.sha256(b'67890').hexdigest()).unlink()
+    assert file_cache.get('second') is None
+
+
+def test_github_client_revalidates_cached_file(tmp_path):
+    session = FakeSession(responses=[FakeResponse(status_code=200, content=b'select 1', headers={'ETag': '"abc"'}),
+                                     FakeResponse(status_code=304, content=b'', headers={'ETag': '"abc"'})])
+    client = git_client.GitHubClient(repository='datarade_test_catalog', organization='fivestack', branch='master',
+                                     cache=cache.FileCache(cache_dir=str(tmp_path)))
+    client.transport.session = session
+    assert client.get_file_contents('catalog/my_dataset/definition.sql') == 'select 1'
+    assert client.get_file_contents('catalog/my_dataset/definition.sql') == 'select 1'
+    assert session.requests == [{}, {'If-None-Match': '"abc"'}]
+
+
+@pytest.mark.parametrize('status_code,headers,expected_delay', [
+    (200, {}, None),
+    (404, {}, None),
+    (429, {'Retry-After': '7'}, 7.0),
+    (429, {'Retry-After': 'soon'}, 2.0),
+    (403, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '0'}, 0.0),
+    (403, {'X-RateLimit-Remaining': '10'}, None),
+    (403, {'Retry-After': '60'}, 60.0),
+    (403, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': 'tomorrow'}, 2.0),
+    (503, {}, 2.0),
+])
+def test_retry_delay(status_code: int, headers: dict, expected_delay: float):
+    assert git_client.retry_delay(status_code=status_code, headers=headers, attempt=2,
+                                  backoff_factor=0.5) == expected_delay
+
+
+def test_github_client_retries_rate_limited_requests(monkeypatch):
+    waits = []
+    monkeypatch.setattr(git_client.time, 'sleep', waits.append)
+    client = git_client.GitHubClient(repository='datarade_test_catalog', organization='fivestack', branch='master')
+    client.transport.session = FakeSession(responses=[
+        FakeResponse(status_code=429, content=b'rate limited', headers={'Retry-After': '3'}),
+        FakeResponse(status_code=200, content=b'select 1'),
+    ])
+    assert client.get_file_contents('catalog/my_dataset/definition.sql') == 'select 1'
+    assert waits == [3.0]
+
+
+def test_http_transport_retries_connection_errors(monkeypatch):
+    waits = []
+    monkeypatch.setattr(git_client.time, 'sleep', waits.append)
+    transport = git_client.HTTPTransport(max_retries=2, backoff_factor=0.5)
+    transport.session = FakeSession(responses=[requests.ConnectionError('connection reset'),
+                                               requests.Timeout('read timed out'),
+                                               FakeResponse(status_code=200, content=b'select 1')])
+    assert transport.get(url='https://raw.githubusercontent.com/fivestack').content == b'select 1'
+    assert waits == [0.5, 1.0]
+    transport.session = FakeSession(responses=[requests.ConnectionError('connection reset')] * 3)
+    with pytest.raises(requests.ConnectionError):
+        transport.get(url='https://raw.githubusercontent.com/fivestack')
+
+
+def test_github_client_raises_on_missing_file():
+    client = git_client.GitHubClient(repository='datarade_test_catalog', organization='fivestack', branch='master')
+    client.transport.session = FakeSession(responses=[FakeResponse(status_code=404, content=b'404: Not Found')])
+    with pytest.raises(requests.HTTPError):
+        client.get_file_contents('catalog/my_dataset/actual.sql')
+
+
+def test_archive_dataset_catalog_downloads_catalog_once():
+    fake_dataset_catalog = FakeDatasetCatalog(repository='', organization='', platform='', archive=True)
+    fake_dataset_catalog.reset()
+    fake_dataset_catalog.add(dataset=generate_dataset(dataset_name='my_dataset'))
+    fake_dataset_catalog.add(dataset=generate_dataset(dataset_name='my_other_dataset'))
+    git = fake_dataset_catalog.git
+    assert git.get_file_contents('catalog/my_dataset/definition.sql') == 'select my_dataset'
+    assert git.get_file_contents('catalog/my_other_dataset/definition.sql') == 'select my_other_dataset'
+    assert fake_dataset_catalog.fake_git.archive_requests == 1
+    with pytest.raises(FileNotFoundError):
+        git.get_file_contents('catalog/my_dataset/actual.sql')
+
+
+def test_github_client_get_archive():
+    tarball = io.BytesIO()
+    with tarfile.open(fileobj=tarball, mode='w:gz') as archive:
+        for file_path, file_contents in [('datarade_test_catalog-master/catalog/my_dataset/config.yaml', b'name: x'),
+                                         ('datarade_test_catalog-master/README.md', b'# readme')]:
+            member = tarfile.TarInfo(name=file_path)
+            member.size = len(file_contents)
+            archive.addfile(member, io.BytesIO(file_contents))
+    client = git_client.GitHubClient(repository='datarade_test_catalog', organization='fivestack', branch='master')
+    client.transport.session = FakeSession(responses=[FakeResponse(status_code=200, content=tarball.getvalue())])
+    assert client.get_archive(folder_path='catalog') == {'catalog/my_dataset/config.yaml': b'name: x'}
+
+
+def test_get_datasets_reports_errors_per_dataset():
+    fake_dataset_catalog = FakeDatasetCatalog(repository='', organization='', platform='')
+    fake_dataset_catalog.reset()
+    fake_dataset_catalog.add(dataset=generate_dataset(dataset_name='my_dataset'))
+    fake_dataset_catalog.add(dataset=generate_dataset(dataset_name='my_other_dataset'))
+    invalid_dataset = generate_dataset(dataset_name='my_invalid_dataset')
+    invalid_dataset['config'].pop('fields')
+    fake_dataset_catalog.add(dataset=invalid_dataset)
+    dataset_names = ['my_dataset', 'my_invalid_dataset', 'my_missing_dataset', 'my_other_dataset']
+    datasets, errors = services.get_datasets(dataset_catalog=fake_dataset_catalog, dataset_names=dataset_names,
+                                             max_workers=4)
+    assert sorted(datasets) == ['my_dataset', 'my_other_dataset']
+    assert datasets['my_other_dataset'].definition == 'select my_other_dataset'
+    assert isinstance(errors['my_missing_dataset'], FileNotFoundError)
+    assert 'fields' in errors['my_invalid_dataset'].messages
+
+
+@pytest.mark.parametrize('status_code,raised', [(404, False), (403, True), (429, True), (503, True)])
+def test_get_datasets_only_treats_missing_optional_files_as_missing(status_code: int, raised: bool):
+    fake_dataset_catalog = FakeDatasetCatalog(repository='', organization='', platform='')
+    fake_dataset_catalog.reset()
+    fake_dataset_catalog.add(dataset=generate_dataset(dataset_name='my_dataset'))
+    fake_dataset_catalog.fake_git.files['catalog/my_dataset/actual.sql'] = requests.HTTPError(
+        f'{status_code} Error', response=FakeResponse(status_code=status_code, content=b''))
+    fake_dataset_catalog.fake_git.add(file_path='catalog/my_dataset/expected.sql', file_contents='select 1')
+    datasets, errors = services.get_datasets(dataset_catalog=fake_dataset_catalog, dataset_names=['my_dataset'])
+    if raised:
+        assert isinstance(errors['my_dataset'], requests.HTTPError)
+    else:
+        assert datasets['my_dataset'].actual is None
+
+
+@pytest.mark.parametrize('fields', [
+    [{'name': 'id', 'type': 'Integer', 'description': 'the id'}, {'name': 'name', 'type': 'String'}],
+    [{'name': 'id', 'type': 'Integer'}, {'name': 'name'}],
+    [{'name': 'id', 'type': 'Integer', 'length': 10}],
+    [{'name': 'id', 'type': None}],
+    [{'name': b'id', 'type': 'Integer'}],
+    {'name': 'id', 'type': 'Integer'},
+    [],
+])
+def test_load_many_matches_dataset_schema(fields):
+    dataset_dict = {'name': 'my_dataset', 'definition': 'select my_dataset', 'fields': fields}
+    datasets, errors = schemas.load_many(dataset_dicts={'my_dataset': dataset_dict})
+    try:
+        expected = schemas.DatasetSchema().load(dataset_dict)
+    except ma.ValidationError as e:
+        assert errors['my_dataset'].messages == e.messages
+        assert datasets == {}
+    else:
+        assert [vars(field) for field in datasets['my_dataset'].fields] == [vars(field) for field in expected.fields]
+        assert errors == {}
+
+
+def test_get_dataset_async():
+    fake_dataset_catalog = FakeDatasetCatalog(repository='', organization='', platform='')
+    fake_dataset_catalog.reset()
+    fake_dataset_catalog.add(dataset=generate_dataset(dataset_name='my_dataset', username='my_user'))
+    fake_async_dataset_catalog = FakeAsyncDatasetCatalog(repository='', organization='', platform='')
+    fake_async_dataset_catalog.git.files = fake_dataset_catalog.fake_git.files
+    dataset = asyncio.run(services.get_dataset_async(dataset_catalog=fake_async_dataset_catalog,
+                                                     dataset_name='my_dataset'))
+    assert dataset.name == 'my_dataset'
+    assert dataset.user.username == 'my_user'
+    assert dataset.actual is None
+
+
+def test_async_dataset_catalog_only_has_async_entry_points():
+    fake_async_dataset_catalog = FakeAsyncDatasetCatalog(repository='', organization='', platform='')
+    assert not isinstance(fake_async_dataset_catalog, models.DatasetCatalog)
+    for name in ('list_datasets', 'index', 'get_or_load', 'invalidate', '__enter__', '__exit__'):
+        assert not hasattr(fake_async_dataset_catalog, name)
+    closed = []
+
+    async def close():
+        closed.append(True)
+
+    async def use_catalog():
+        async with fake_async_dataset_catalog as dataset_catalog:
+            assert dataset_catalog is fake_async_dataset_catalog
+
+    fake_async_dataset_catalog.git.close = close
+    asyncio.run(use_catalog())
+    assert closed == [True]
+
+
+def test_async_github_client_retries_rate_limited_requests(monkeypatch):
+    waits = []
+
+    async def fake_sleep(delay: float):
+        waits.append(delay)
+
+    monkeypatch.setattr(asyncio, 'sleep', fake_sleep)
+    client = git_client.AsyncGitHubClient(repository='datarade_test_catalog', organization='fivestack',
+                                          branch='master')
+    client._session = FakeSession(responses=[
+        FakeAsyncResponse(status_code=403, content=b'', headers={'X-RateLimit-Remaining': '0', 'Retry-After': '2'}),
+        FakeAsyncResponse(status_code=200, content=b'select 1'),
+    ])
+    assert asyncio.run(client.get_file_contents('catalog/my_dataset/definition.sql')) == 'select 1'
+    assert waits == [2.0]
+
+
+def test_async_azure_repos_client_uses_the_cache_off_the_event_loop(tmp_path):
+    file_cache = cache.FileCache(cache_dir=str(tmp_path))
+    cache_threads = []
+
+    def record_thread(method):
+        def recorded_method(*args):
+            cache_threads.append(threading.get_ident())
+            return method(*args)
+        return recorded_method
+
+    file_cache.get, file_cache.put = record_thread(file_cache.get), record_thread(file_cache.put)
+    client = git_client.AsyncAzureReposClient(repository='datarade_test_catalog', organization='fivestack',
+                                              project='FiveStack', branch='master', username='', password='',
+                                              cache=file_cache)
+    client._session = FakeSession(responses=[
+        FakeAsyncResponse(status_code=200, content=b'select 1', headers={'ETag': '"abc"'}),
+        FakeAsyncResponse(status_code=304, content=b''),
+    ])
+
+    async def get_file_contents_twice() -> list:
+        return [await client.get_file_contents('catalog/my_dataset/definition.sql') for _ in range(2)]
+
+    assert asyncio.run(get_file_contents_twice()) == ['select 1', 'select 1']
+    assert client._session.requests == [{}, {'If-None-Match': '"abc"'}]
+    assert len(cache_threads) == 3 and threading.get_ident() not in cache_threads
+    assert all(key.startswith('azure-devops-items/') for key in file_cache._index)
+
+
+def test_shared_dataset_catalog_loads_each_dataset_once():
+    fake_dataset_catalog = FakeDatasetCatalog(repository='', organization='', platform='', shared=True)
+    fake_dataset_catalog.reset()
+    fake_dataset_catalog.add(dataset=generate_dataset(dataset_name='my_dataset'))
+    requested_files = []
+    get_file_contents = fake_dataset_catalog.fake_git.get_file_contents
+
+    def slow_get_file_contents(file_path: str) -> str:
+        requested_files.append(file_path)
+        time.sleep(0.05)
+        return get_file_contents(file_path)
+
+    fake_dataset_catalog.fake_git.get_file_contents = slow_get_file_contents
+    datasets = []
+    threads = [threading.Thread(target=lambda: datasets.append(
+        services.get_dataset(dataset_catalog=fake_dataset_catalog, dataset_name='my_dataset'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(datasets) == 8
+    assert all(dataset is datasets[0] for dataset in datasets)
+    assert len(requested_files) == len(services.DATASET_FILE_NAMES)
+    fake_dataset_catalog.invalidate(dataset_name='my_dataset')
+    assert services.get_dataset(dataset_catalog=fake_dataset_catalog, dataset_name='my_dataset') is not datasets[0]
+
+
+def test_shared_dataset_catalog_drops_loads_that_were_invalidated():
+    fake_dataset_catalog = FakeDatasetCatalog(repository='', organization='', platform='', shared=True)
+    stale_dataset, fresh_dataset = object(), object()
+
+    def load_while_the_catalog_changes() -> object:
+        fake_dataset_catalog.invalidate(dataset_name='my_dataset')
+        return stale_dataset
+
+    assert fake_dataset_catalog.get_or_load(dataset_name='my_dataset', load=load_while_the_catalog_changes) is \
+        stale_dataset
+    assert fake_dataset_catalog.get_or_load(dataset_name='my_dataset', load=lambda: fresh_dataset) is fresh_dataset
+    generation = fake_dataset_catalog.generation
+    fake_dataset_catalog.invalidate()
+    fake_dataset_catalog.add_loaded_dataset(dataset_name='my_dataset', dataset=stale_dataset, generation=generation)
+    assert fake_dataset_catalog.get_loaded_dataset(dataset_name='my_dataset') is None
+
+
+def test_azure_repos_client_decodes_characters_split_across_chunks(monkeypatch):
+    contents = "select 'café' as name union all select 'naïve' as name"
+    encoded_contents = contents.encode('utf-8')
+    chunks = [encoded_contents[i:i + 3] for i in range(0, len(encoded_contents), 3)]
+    monkeypatch.setattr(git_client.AzureReposClient, '_get_client',
+                        staticmethod(lambda **kwargs: FakeAzureReposGitClient(chunks=chunks)))
+    client = git_client.AzureReposClient(repository='datarade_test_catalog', organization='fivestack',
+                                         project='FiveStack', branch='master', username='', password='')
+    assert client.get_file_contents('catalog/my_dataset/definition.sql') == contents
+    assert ''.join(client.iter_file_contents('catalog/my_dataset/definition.sql')) == contents
+
+
+def test_indexed_dataset_catalog_skips_missing_files():
+    fake_dataset_catalog = FakeDatasetCatalog(repository='', organization='', platform='', indexed=True)
+    fake_dataset_catalog.reset()
+    fake_dataset_catalog.add(dataset=generate_dataset(dataset_name='my_dataset'))
+    fake_dataset_catalog.add(dataset=generate_dataset(dataset_name='my_other_dataset'))
+    fake_dataset_catalog.fake_git.add(file_path='catalog/README.md', file_contents='# catalog')
+    assert services.list_datasets(dataset_catalog=fake_dataset_catalog) == ['my_dataset', 'my_other_dataset']
+    dataset = services.get_dataset(dataset_catalog=fake_dataset_catalog, dataset_name='my_dataset')
+    assert dataset.actual is None
+    assert fake_dataset_catalog.fake_git.requested_files == ['catalog/my_dataset/config.yaml',
+                                                             'catalog/my_dataset/definition.sql']
+    assert fake_dataset_catalog.index.blob_id(dataset_name='my_dataset', file_name='definition.sql') == \
+        git_client.git_blob_id(b'select my_dataset')
+
+
+def test_get_engine_reuses_engines():
+    engine = models.get_engine(url='sqlite://', pool_size=2)
+    assert models.get_engine(url='sqlite://', pool_size=2) is engine
+    assert models.get_engine(url='sqlite://', pool_size=3) is not engine
+    models.dispose_engines()
+    assert models.get_engine(url='sqlite://', pool_size=2) is not engine
+
+
+@pytest.mark.parametrize('field_type,reflected_type,reflected_arguments', [
+    ('Boolean', 'bit', {}),
+    ('Date', 'date', {}),
+    ('DateTime', 'datetime', {}),
+    ('Time', 'time', {}),
+    ('Float', 'float', {'precision': 53}),
+    ('Integer', 'int', {}),
+    ('Numeric', 'numeric', {'precision': 18, 'scale': 2}),
+    ('String', 'varchar', {'length': None}),
+    ('Text', 'varchar', {'length': None}),
+])
+def test_reflected_sql_server_types_match_their_fields(field_type: str, reflected_type: str,
+                                                       reflected_arguments: dict):
+    dialect = sqlalchemy.dialects.mssql.dialect()
+    dialect.server_version_info = (15,)  # what initialize() finds on SQL Server 2019
+    dialect._setup_version_attributes()
+    reflected = dialect.ischema_names[reflected_type](**reflected_arguments)
+    defined = models.Field(name='my_field', type=field_type).sqlalchemy_column.type
+    assert models._same_type(reflected=reflected, defined=defined, dialect=dialect)
+    other = dialect.ischema_names['varchar'](length=50 if field_type in ('String', 'Text') else None)
+    assert not models._same_type(reflected=other, defined=defined, dialect=dialect)
+
+
+def test_odbc_driver_lookup_is_remembered(monkeypatch):
+    lookups = []
+
+    def drivers() -> list:
+        lookups.append(1)
+        return ['SQL Server Native Client 11.0', 'ODBC Driver 17 for SQL Server']
+
+    monkeypatch.setitem(sys.modules, 'pyodbc', types.SimpleNamespace(drivers=drivers))
+    models._find_odbc_driver.cache_clear()
+    database = models.Database(driver='mssql', database_name='my_db', host='my_host')
+    assert database._odbc_driver_name == 'SQL Server Native Client 11.0'
+    assert database._odbc_driver_name == 'SQL Server Native Client 11.0'
+    assert len(lookups) == 1
+    models._find_odbc_driver.cache_clear()
+
+
+def generate_writable_dataset(dataset_name: str, host: str = 'my_host', depends_on: list = None) -> 'models.Dataset':
+    return schemas.DatasetSchema().load({
+        'name': dataset_name,
+        'definition': f'select {dataset_name}',
+        'fields': [],
+        'database': {'driver': 'mssql', 'database_name': 'my_db', 'host': host},
+        'depends_on': depends_on or [],
+    })
+
+
+def test_write_datasets_respects_dependencies_and_limits(monkeypatch):
+    running_hosts = []
+    max_running_per_host = Counter()
+    written = []
+    lock = threading.Lock()
+
+    def fake_write_dataset(dataset, dataset_container, username=None, password=None, stream=False,
+                           skip_unchanged=False, swap=False):
+        with lock:
+            running_hosts.append(dataset.database.host)
+            host_count = running_hosts.count(dataset.database.host)
+            max_running_per_host[dataset.database.host] = max(max_running_per_host[dataset.database.host], host_count)
+        time.sleep(0.02)
+        with lock:
+            running_hosts.remove(dataset.database.host)
+            written.append(dataset.name)
+        if dataset.name == 'broken':
+            raise RuntimeError('bcp failed')
+
+    monkeypatch.setattr(services, 'write_dataset', fake_write_dataset)
+    datasets = [generate_writable_dataset(dataset_name=f'dim_{i}', host='warehouse') for i in range(6)]
+    datasets += [generate_writable_dataset(dataset_name='fact', host='warehouse', depends_on=['dim_0', 'dim_1']),
+                 generate_writable_dataset(dataset_name='report', host='reporting', depends_on=['fact', 'external']),
+                 generate_writable_dataset(dataset_name='broken', host='reporting'),
+                 generate_writable_dataset(dataset_name='after_broken', host='reporting', depends_on=['broken'])]
+    durations, errors = services.write_datasets(datasets=datasets, dataset_container=None, max_workers=4,
+                                                max_per_database=2)
+    assert written.index('fact') > max(written.index('dim_0'), written.index('dim_1'))
+    assert written.index('report') > written.index('fact')
+    assert max_running_per_host['warehouse'] == 2
+    assert set(errors) == {'broken', 'after_broken'}
+    assert isinstance(errors['after_broken'], models.DatasetDependencyException)
+    assert 'after_broken' not in written
+    assert len(durations) == 8
+
+
+@pytest.mark.parametrize('limits', [{'max_workers': 0}, {'max_per_database': 0}, {'max_per_container': -1}])
+def test_write_datasets_rejects_limits_below_one(limits: dict):
+    with pytest.raises(ValueError):
+        services.write_datasets(datasets=[generate_writable_dataset(dataset_name='a')], dataset_container=None,
+                                **limits)
+
+
+def test_write_datasets_rejects_duplicate_dataset_names():
+    datasets = [generate_writable_dataset(dataset_name='a'), generate_writable_dataset(dataset_name='a', host='other')]
+    with pytest.raises(ValueError):
+        services.write_datasets(datasets=datasets, dataset_container=None)
+
+
+def test_write_datasets_rejects_circular_dependencies():
+    datasets = [generate_writable_dataset(dataset_name='a', depends_on=['b']),
+                generate_writable_dataset(dataset_name='b', depends_on=['a'])]
+    with pytest.raises(models.DatasetDependencyException):
+        services.write_datasets(datasets=datasets, dataset_container=None)
+
+
+@pytest.mark.parametrize('partition', [{'column': 'id'}, {'predicates': []},
+                                       {'column': 'id', 'count': 4, 'predicates': ['id < 10']}])
+def test_partition_schema_rejects_incomplete_partitions(partition: dict):
+    with pytest.raises(ma.ValidationError):
+        schemas.PartitionSchema().load(partition)
+
+
+def test_incremental_schema_requires_a_key_to_merge():
+    with pytest.raises(ma.ValidationError):
+        schemas.IncrementalSchema().load({'watermark': 'modified', 'strategy': 'merge'})
+
+
+def test_get_dataset_records_spans(recorded_spans: list):
+    dataset_catalog = FakeDatasetCatalog(repository='', organization='', platform='')
+    dataset_catalog.add(generate_dataset(dataset_name='my_dataset'))
+    services.get_dataset(dataset_catalog=dataset_catalog, dataset_name='my_dataset')
+    fetches = {span.attributes['file_path']: span for span in recorded_spans if span.name == 'git.fetch'}
+    assert fetches['catalog/my_dataset/config.yaml'].attributes['bytes'] > 0
+    assert fetches['catalog/my_dataset/actual.sql'].error is not None
+    assert [span.name for span in recorded_spans if span.name != 'git.fetch'] == ['yaml.parse', 'schema.load']
+
+
+def test_instrumentation_listener_errors_do_not_stop_the_work(recorded_spans: list):
+    def broken_listener(span):
+        raise RuntimeError('the metrics backend is down')
+
+    instrumentation.add_listener(broken_listener)
+    try:
+        with pytest.warns(RuntimeWarning, match='the metrics backend is down'):
+            with pytest.raises(ValueError), instrumentation.span('failing_stage'):
+                raise ValueError('the stage failed')
+    finally:
+        instrumentation.remove_listener(broken_listener)
+    assert recorded_spans[0].error == 'ValueError: the stage failed'
+
+
+def test_spans_keep_their_core_fields_and_their_parent_on_worker_threads(recorded_spans: list):
+    def copy_query(query):
+        with instrumentation.span('partition', error=query):
+            pass
+
+    with instrumentation.span('write_dataset'):
+        transfer.copy_partitions(queries=['first', 'second'], copy_query=copy_query)
+    partitions = [span.to_dict() for span in recorded_spans if span.name == 'partition']
+    assert [(partition['parent'], partition['error']) for partition in partitions] == [('write_dataset', None)] * 2
+    assert sorted(partition['attributes']['error'] for partition in partitions) == ['first', 'second']
+
+
+def test_open_telemetry_exporter():
+    exported = []
+
+    class FakeExportedSpan:
+        def __init__(self, name, attributes, start_time):
+            self.name, self.attributes, self.start_time = name, attributes, start_time
+
+        def end(self, end_time):
+            self.end_time = end_time
+            exported.append(self)
+
+    class FakeTracer:
+        def start_span(self, name, attributes, start_time):
+            return FakeExportedSpan(name=name, attributes=attributes, start_time=start_time)
+
+    exporter = instrumentation.OpenTelemetryExporter(tracer=FakeTracer())
+    instrumentation.add_listener(exporter)
+    try:
+        with instrumentation.span('bcp.load', table='my_table', rows=10, bytes=100):
+            pass
+    finally:
+        instrumentation.remove_listener(exporter)
+    exported_span, = exported
+    assert exported_span.name == 'datarade.bcp.load'
+    assert exported_span.attributes['datarade.rows'] == 10
+    assert exported_span.end_time >= exported_span.start_time
+